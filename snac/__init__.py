@@ -1,7 +1,21 @@
 from . import simulation
+from . import archive
+from . import cache
+from . import emulator
+from . import ensemble
+from . import features
+from . import fitting
+from . import kernels
+from . import lines
 from . import load
+from . import matching
 from . import paths
 from . import plot_tools
+from . import prefetch
 from . import quantities
+from . import reducers
+from . import render
+from . import server
+from . import shared
 # from . import strings
 from . import tools
\ No newline at end of file
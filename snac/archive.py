@@ -0,0 +1,304 @@
+"""
+Single-file HDF5 archive of an ensemble of SNEC models, for moving and
+sharing parameter studies without thousands of .xg/.dat files and caches.
+
+Layout:
+    /models/<model>            group, with the scalars as attributes
+    /models/<model>/dat/<col>  dat columns (time not shifted to breakout)
+    /models/<model>/profiles   'time', 'mass', and one (time x cell)
+                               dataset per field, chunked and compressed
+
+Profile datasets are read lazily (see LazyArray): indexing reads only the
+chunks holding the selected snapshots and cells. Simulation and Ensemble
+open models straight from an archive with archive=<filepath>.
+
+Requires h5py.
+
+Example:
+    archive.export(models, 'study.h5')
+    sim = simulation.Simulation('model_1', archive='study.h5')
+"""
+
+from collections.abc import Mapping
+import numpy as np
+import pandas as pd
+
+# snac
+from . import load
+from . import tools
+
+def export(models, filepath, config='snec', chunk_time=16, chunk_cell=1024,
+           compression='gzip', compression_opts=4, reload=False, save=True,
+           verbose=True):
+    """
+    Pack models into an HDF5 archive. Models already in the archive
+    are replaced, others are kept.
+
+    parameters
+    ----------
+    models : [str]
+    filepath : str
+    config : str
+        config file, for dat columns, profile fields and scalars
+    chunk_time : int
+        snapshots per chunk
+    chunk_cell : int
+        cells per chunk
+    compression : str
+        h5py compression filter, e.g. 'gzip', 'lzf', or None
+    compression_opts : int
+        compression level, for gzip
+    reload : bool
+        load from raw data, not caches
+    save : bool
+        save caches while loading
+    verbose : bool
+    """
+    import h5py
+
+    models = list(tools.ensure_sequence(models))
+    config = load.load_config(name=config, verbose=False)
+    cols = config['dat_quantities']['fields']
+    fields = config['profiles']['fields']
+
+    with h5py.File(filepath, 'a') as f:
+        root = f.require_group('models')
+
+        for model in models:
+            tools.printv(f'Archiving: {model}', verbose)
+            dat = load.get_dat(model, cols=cols, reload=reload, save=save,
+                               verbose=False)
+            scalars = load.get_scalars(model, var=config['scalars']['fields'])
+            arrays = load.get_profile_arrays(model, fields=fields, reload=reload,
+                                             save=save, verbose=False)
+            if model in root:
+                del root[model]
+
+            group = root.create_group(model)
+            group.attrs.update(scalars)
+
+            dat_group = group.create_group('dat')
+            dat_group.attrs['columns'] = list(dat.columns)
+            for col in dat.columns:
+                dat_group.create_dataset(col, data=dat[col].to_numpy())
+
+            profiles = group.create_group('profiles')
+            profiles.attrs['fields'] = list(fields)
+            profiles.create_dataset('time', data=np.asarray(arrays['time']))
+            profiles.create_dataset('mass', data=np.asarray(arrays['mass']))
+
+            for key in fields:
+                array = np.asarray(arrays[key])
+                chunks = (min(chunk_time, array.shape[0]),
+                          min(chunk_cell, array.shape[1]))
+                profiles.create_dataset(key, data=array, chunks=chunks,
+                                        compression=compression,
+                                        compression_opts=compression_opts
+                                        if compression == 'gzip' else None,
+                                        shuffle=compression is not None)
+
+class Archive:
+    """
+    Read-only access to an HDF5 ensemble archive, see export().
+    """
+    def __init__(self, filepath):
+        """
+        parameters
+        ----------
+        filepath : str
+        """
+        import h5py
+
+        self.filepath = filepath
+        self.file = h5py.File(filepath, 'r')
+
+    def __contains__(self, model):
+        return f'models/{model}/profiles' in self.file
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.file.close()
+
+    @property
+    def models(self):
+        """
+        Names of archived models
+        Returns : [str]
+        """
+        models = []
+
+        def visit(name, obj):
+            if name.endswith('/profiles'):
+                models.append(name[:-len('/profiles')])
+
+        self.file['models'].visititems(visit)
+        return sorted(models)
+
+    def get_dat(self, model):
+        """
+        Dat table of a model, as load.get_dat()
+        Returns : pd.DataFrame
+
+        parameters
+        ----------
+        model : str
+        """
+        group = self._group(model)['dat']
+        return pd.DataFrame({col: group[col][()] for col in group.attrs['columns']})
+
+    def get_scalars(self, model):
+        """
+        Scalars of a model, as load.get_scalars()
+        Returns : dict
+
+        parameters
+        ----------
+        model : str
+        """
+        return {key: value.item() if isinstance(value, np.generic) else value
+                for key, value in self._group(model).attrs.items()}
+
+    def get_profile_arrays(self, model, fields=None):
+        """
+        Profile arrays of a model, as load.get_profile_arrays(). 'time' and 'mass'
+        are read into memory, fields are read lazily on indexing.
+        Returns : dict
+
+        parameters
+        ----------
+        model : str
+        fields : []
+            defaults to all archived fields
+        """
+        group = self._group(model)['profiles']
+        if fields is None:
+            fields = list(group.attrs['fields'])
+
+        arrays = {'time': group['time'][()], 'mass': group['mass'][()]}
+        for key in fields:
+            arrays[key] = LazyArray(group[key])
+
+        return arrays
+
+    def get_profiles(self, model, fields=None):
+        """
+        Profiles of a model, as load.get_profiles(): profiles[field][time]
+        is a (cell x 2) array of mass and field, read on access.
+        Returns : dict of Mapping
+
+        parameters
+        ----------
+        model : str
+        fields : []
+        """
+        arrays = self.get_profile_arrays(model, fields=fields)
+        fields = [key for key in arrays if key not in ('time', 'mass')]
+
+        return {key: _SnapshotView(arrays['time'], arrays['mass'], arrays[key])
+                for key in fields}
+
+    def _group(self, model):
+        """HDF5 group of a model
+        """
+        if model not in self:
+            raise KeyError(f'Model not in archive {self.filepath}: {model}')
+        return self.file[f'models/{model}']
+
+class LazyArray(tools.LazyArrayOperators):
+    """
+    A 2D HDF5 dataset, read on indexing. Supports numpy indexing by integers,
+    slices (including negative steps), boolean masks and index arrays
+    (including paired index arrays), reading only
+    the chunks that hold the selected rows and columns. Arithmetic and
+    ufuncs read the whole dataset first.
+    """
+    def __init__(self, dataset):
+        """
+        parameters
+        ----------
+        dataset : h5py.Dataset
+        """
+        self.dataset = dataset
+        self.shape = dataset.shape
+        self.dtype = dataset.dtype
+        self.ndim = dataset.ndim
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __array__(self, dtype=None, copy=None):
+        return np.asarray(self.dataset[()], dtype=dtype)
+
+    def __getitem__(self, key):
+        key = tools.expand_index(key, ndim=self.ndim)
+
+        read = []
+        local = []
+        listed = False  # h5py reads at most one axis by index list
+
+        for k, n in zip(key, self.shape):
+            if isinstance(k, slice):
+                start, stop, step = k.indices(n)
+                if step > 0:
+                    read.append(slice(start, stop, step))
+                    local.append(slice(None))
+                else:  # h5py only reads increasing slices: read, then reverse
+                    rows = range(start, stop, step)
+                    if len(rows) == 0:
+                        read.append(slice(0, 0))
+                    else:
+                        read.append(slice(rows[-1], rows[0] + 1, -step))
+                    local.append(slice(None, None, -1))
+            elif np.ndim(k) == 0:
+                k = _check_index(int(k), n)
+                read.append(slice(k, k + 1))
+                local.append(0)
+            else:
+                k = np.asarray(k)
+                if k.dtype == bool:
+                    if k.shape != (n, ):
+                        raise IndexError(f'boolean index of shape {k.shape} '
+                                         f'does not match axis of length {n}')
+                    k = np.flatnonzero(k)
+                k = _check_index(k.astype(int), n)
+                if listed:
+                    lo = k.min() if k.size > 0 else 0
+                    read.append(slice(lo, k.max() + 1 if k.size > 0 else 0))
+                    local.append(k - lo)
+                else:
+                    unique, inverse = np.unique(k, return_inverse=True)
+                    read.append(unique)
+                    local.append(inverse.reshape(k.shape))
+                    listed = True
+
+        return self.dataset[tuple(read)][tuple(local)]
+
+def _check_index(k, n):
+    """Integer index (or index array) k on an axis of length n, made
+    non-negative. Raises IndexError if out of bounds, as numpy does.
+    """
+    if np.any((k < -n) | (k >= n)):
+        raise IndexError(f'index out of bounds for axis of length {n}')
+    return k % n
+
+class _SnapshotView(Mapping):
+    """One field of Archive.get_profiles(): (cell x 2) arrays keyed by time
+    """
+    def __init__(self, time, mass, array):
+        self._index = {t: j for j, t in enumerate(time)}
+        self._mass = mass
+        self._array = array
+
+    def __getitem__(self, t):
+        return np.column_stack([self._mass, self._array[self._index[t]]])
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._index)
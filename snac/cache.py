@@ -0,0 +1,351 @@
+"""
+Persistent memoization of derived quantities (tau_sob, total energy, ...).
+
+Entries are keyed by (model, snapshot, quantity, parameters, code version),
+held in memory with LRU eviction, and written through to one pickle per
+entry in the model's temp directory, next to the profile cache.
+Repeated sessions and ensemble sweeps reuse prior results; changing the
+code of a quantity changes its version, and so misses the old entries.
+
+Shared cache root: all caches of a model live in paths.temp_path(model).
+If a cache root is set (see paths.cache_root), these are content-addressed
+directories under one root, shared by all users. Accesses are recorded by
+touch() and evict() removes least recently used models to stay under
+the byte budget (paths.cache_max_bytes). Eviction walks the whole root, so
+it runs when the large caches (dat, profiles, arrays) are saved, not on
+every derived entry.
+
+Concurrency: cache files are written to a temporary file and atomically
+renamed into place (atomic_write), so readers never see truncated files.
+model_lock() is a per-model file lock, so that when many processes (or
+nodes) need the same model, one builds its caches while the others wait
+and then reuse them.
+"""
+
+import fcntl
+import hashlib
+import inspect
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# snac
+from . import paths
+from . import tools
+
+def code_version(*funcs):
+    """
+    Version string of the code of one or more functions, from their source.
+    Returns : str
+
+    parameters
+    ----------
+    funcs : callable
+    """
+    sha = hashlib.sha1()
+    for func in funcs:
+        try:
+            sha.update(inspect.getsource(func).encode())
+        except (OSError, TypeError):
+            sha.update(func.__qualname__.encode())
+
+    return sha.hexdigest()[:12]
+
+class DerivedCache:
+    """
+    Cache of derived quantities for one model.
+    """
+    def __init__(self, model, maxsize=128, persist=True, verbose=False):
+        """
+        parameters
+        ----------
+        model : str
+        maxsize : int
+            number of entries held in memory
+        persist : bool
+            read entries from, and write to, disk
+        verbose : bool
+        """
+        self.model = model
+        self.maxsize = maxsize
+        self.persist = persist
+        self.verbose = verbose
+        self._entries = OrderedDict()
+
+    def key(self, quantity, snapshot, params=None, version=''):
+        """
+        Hash of an entry's (model, snapshot, quantity, parameters, version).
+        Returns : str
+
+        parameters
+        ----------
+        quantity : str
+        snapshot : float
+            snapshot time
+        params : dict
+            parameters the quantity depends on, beyond the snapshot
+        version : str
+            see code_version()
+        """
+        params = sorted((params or {}).items())
+        label = repr((self.model, float(snapshot), quantity, params, version))
+        return hashlib.sha1(label.encode()).hexdigest()
+
+    def fetch(self, quantity, snapshot, compute, params=None, version=''):
+        """
+        Return the cached quantity, or compute, cache and return it.
+
+        parameters
+        ----------
+        quantity : str
+        snapshot : float
+        compute : callable
+            no-argument function computing the quantity
+        params : dict
+        version : str
+        """
+        key = self.key(quantity, snapshot, params=params, version=version)
+
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+        filepath = None
+        if self.persist:
+            filepath = paths.derived_temp_filepath(self.model, key=key)
+
+        if filepath is not None and os.path.exists(filepath):
+            tools.printv(f'Loading {quantity}: {filepath}', self.verbose)
+            with open(filepath, 'rb') as f:
+                value = pickle.load(f)
+            touch(self.model)
+        else:
+            value = compute()
+            if self.persist:
+                os.makedirs(os.path.dirname(filepath), exist_ok=True)
+                tools.printv(f'Saving {quantity}: {filepath}', self.verbose)
+                with atomic_write(filepath) as f:
+                    pickle.dump(value, f)
+                touch(self.model)
+                # small entries: eviction is left to the dat/profile/array caches
+
+        self._entries[key] = value
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+        return value
+
+    def clear(self):
+        """
+        Clear entries held in memory (not on disk).
+        """
+        self._entries.clear()
+
+# ===============================================================
+#                      Shared cache root
+# ===============================================================
+ACCESS_FILENAME = '.access'  # its mtime is the last access of a model's caches
+
+def touch(model):
+    """
+    Record an access of a model's caches, for LRU eviction.
+    Does nothing without a shared cache root.
+
+    parameters
+    ----------
+    model : str
+    """
+    if paths.cache_root() is None:
+        return
+
+    filepath = os.path.join(paths.temp_path(model), ACCESS_FILENAME)
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    with open(filepath, 'a'):
+        os.utime(filepath)
+
+def cache_usage():
+    """
+    Size and last access of each model directory under the shared cache root,
+    least recently used first.
+    Returns : [(path, bytes, last access time)]
+    """
+    root = paths.cache_root()
+    if root is None or not os.path.isdir(root):
+        return []
+
+    usage = []
+    for entry in os.scandir(root):
+        if not entry.is_dir():
+            continue
+        nbytes = 0
+        last_access = entry.stat().st_mtime
+        for dirpath, _, filenames in os.walk(entry.path):
+            for filename in filenames:
+                try:
+                    stat = os.stat(os.path.join(dirpath, filename))
+                except FileNotFoundError:  # removed meanwhile
+                    continue
+                nbytes += stat.st_size
+                if filename == ACCESS_FILENAME:
+                    last_access = stat.st_mtime
+        usage.append((entry.path, nbytes, last_access))
+
+    return sorted(usage, key=lambda u: u[2])
+
+def evict(max_bytes=None, keep=(), verbose=False):
+    """
+    Remove least recently used model caches until the shared cache root
+    is under budget. Does nothing without a cache root or budget.
+    Returns : [str] removed paths
+
+    parameters
+    ----------
+    max_bytes : int
+        defaults to paths.cache_max_bytes()
+    keep : [str]
+        models never to evict (e.g., the one just saved)
+    verbose : bool
+    """
+    if max_bytes is None:
+        max_bytes = paths.cache_max_bytes()
+    if max_bytes is None or paths.cache_root() is None:
+        return []
+
+    keep = [os.path.realpath(paths.temp_path(model)) for model in keep]
+    usage = cache_usage()
+    total = sum(u[1] for u in usage)
+    removed = []
+
+    for path, nbytes, last_access in usage:
+        if total <= max_bytes:
+            break
+        if os.path.realpath(path) in keep or nbytes == 0:
+            continue
+        with _try_flock(os.path.join(path, LOCK_FILENAME)) as locked:
+            if not locked:  # being built by another process
+                continue
+            tools.printv(f'Evicting cache: {path} ({nbytes/1e6:.1f} MB, '
+                         f'last used {time.ctime(last_access)})', verbose)
+            _clear_dir(path)
+        total -= nbytes
+        removed.append(path)
+
+    return removed
+
+def _clear_dir(path):
+    """
+    Remove the contents of a model's cache directory, but not its lock file:
+    processes waiting in model_lock() hold it open, and must keep excluding
+    new ones once they get the lock.
+    """
+    for entry in os.scandir(path):
+        if entry.name == LOCK_FILENAME:
+            continue
+        if entry.is_dir(follow_symlinks=False):
+            shutil.rmtree(entry.path, ignore_errors=True)
+        else:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+# ===============================================================
+#                      Concurrency
+# ===============================================================
+LOCK_FILENAME = '.lock'
+_locks = {}  # lock filepath: [threading.RLock, depth, open lock file]
+_locks_guard = threading.Lock()
+
+@contextmanager
+def atomic_write(filepath, mode='wb'):
+    """
+    Open a temporary file next to filepath for writing, and atomically rename
+    it to filepath on success. On error, the temporary file is removed and
+    filepath is untouched.
+
+    parameters
+    ----------
+    filepath : str
+    mode : str
+    """
+    dirname, basename = os.path.split(filepath)
+    fd, tmp_filepath = tempfile.mkstemp(dir=dirname, prefix=f'.{basename}.',
+                                        suffix='.tmp')
+    try:
+        with os.fdopen(fd, mode) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_filepath, 0o666 & ~_umask())
+        os.replace(tmp_filepath, filepath)
+    except BaseException:
+        if os.path.exists(tmp_filepath):
+            os.remove(tmp_filepath)
+        raise
+
+@contextmanager
+def model_lock(model, enabled=True):
+    """
+    Exclusive lock on a model's caches, across processes (flock on a lock file
+    in the model's temp directory) and threads. Reentrant within a thread.
+
+    parameters
+    ----------
+    model : str
+    enabled : bool
+        if False, do nothing (e.g., when not saving to a read-only location)
+    """
+    if not enabled:
+        yield
+        return
+
+    filepath = os.path.join(paths.temp_path(model), LOCK_FILENAME)
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+
+    with _locks_guard:
+        entry = _locks.setdefault(filepath, [threading.RLock(), 0, None])
+
+    with entry[0]:
+        if entry[1] == 0:
+            entry[2] = open(filepath, 'a')
+            fcntl.flock(entry[2], fcntl.LOCK_EX)
+        entry[1] += 1
+        try:
+            yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                fcntl.flock(entry[2], fcntl.LOCK_UN)
+                entry[2].close()
+                entry[2] = None
+
+@contextmanager
+def _try_flock(filepath):
+    """Try to take an exclusive flock without waiting. Yields : bool
+    """
+    if not os.path.exists(filepath):
+        yield True
+        return
+
+    with open(filepath, 'a') as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def _umask():
+    """Current umask
+    """
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
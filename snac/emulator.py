@@ -0,0 +1,313 @@
+"""
+Light curve emulator: a fast surrogate for the dat quantities of an
+ensemble, as a function of the model parameters (scalars).
+
+Dat curves of every model (lum_observed and vel_photo by default) are
+resampled onto a common grid of days post breakout, reduced to a few
+principal components (PCA), and the component weights are interpolated
+across parameter space with radial basis functions (thin-plate spline,
+plus a linear term). Predicting is then a few small matrix products,
+for thousands of parameter points at once.
+
+Log fields (e.g. luminosity) are emulated in log10, and log params
+(e.g. E_bomb) interpolated in log10. Params are rescaled to [0, 1] over
+the training models, so the interpolation does not depend on their units.
+Params that are the same for every training model (e.g. a fixed masscut)
+are dropped.
+cross_validate() reports the interpolation error on held-out models.
+
+Example:
+    emu = emulator.Emulator(models)
+    emu.cross_validate()
+    lc = emu.predict({'zams': [12, 15], 'E_bomb': [1e51, 2e51],
+                      'masscut': [1.5, 1.6]})
+    lc['day'], lc['lum_observed']
+"""
+
+import numpy as np
+import pandas as pd
+
+# snac
+from . import ensemble
+from . import tools
+
+class Emulator:
+    """
+    Surrogate of dat curves across model parameters, see module docstring.
+    """
+    def __init__(self, models, params=('zams', 'E_bomb', 'masscut'),
+                 fields=('lum_observed', 'vel_photo'), days=None, n_days=200,
+                 n_components=8, log_fields=('lum_observed', ),
+                 log_params=('E_bomb', ), smoothing=0.0, config='snec',
+                 archive=None, verbose=True):
+        """
+        parameters
+        ----------
+        models : [str] or ensemble.Ensemble
+            training models
+        params : [str]
+            scalars to emulate over
+        fields : [str]
+            dat quantities to emulate
+        days : 1D array
+            days post breakout to resample onto. Must be covered by every model.
+            Defaults to n_days points over the range covered by all models.
+        n_days : int
+        n_components : int
+            number of principal components kept (at most the number of models)
+        log_fields : [str]
+            fields emulated in log10
+        log_params : [str]
+            params interpolated in log10
+        smoothing : float
+            RBF smoothing. 0 interpolates the component weights of the
+            training models exactly.
+        config : str
+        archive : str or archive.Archive
+            HDF5 ensemble archive to load models from, see archive.py
+        verbose : bool
+        """
+        if not isinstance(models, ensemble.Ensemble):
+            models = ensemble.Ensemble(models, config=config, archive=archive,
+                                       load_profiles=False, verbose=False)
+        self.verbose = verbose
+        self.models = list(models.models)
+        self.params = list(params)
+        self.fields = list(fields)
+        self.log_fields = [f for f in log_fields if f in self.fields]
+        self.log_params = [p for p in log_params if p in self.params]
+        self.n_components = n_components
+        self.smoothing = smoothing
+
+        self.table = pd.DataFrame([models[m].scalars for m in self.models],
+                                  index=pd.Index(self.models, name='model'))[self.params]
+        # params constant over the training models can't be interpolated
+        # across: they are dropped (and ignored when predicting)
+        x = self._log_x(self.table)
+        lo, hi = x.min(axis=0), x.max(axis=0)
+        self._varied = hi > lo
+        self._x_range = (lo[self._varied], hi[self._varied])
+        constant = [p for p, v in zip(self.params, self._varied) if not v]
+        if not self._varied.any():
+            raise ValueError(f'Params {self.params} are the same for every model')
+        if constant:
+            tools.printv(f'Constant over models, not emulated: {constant}', verbose)
+
+        dats = [models[m].dat for m in self.models]
+        self.days = self._get_days(dats, days=days, n_days=n_days)
+        self.curves = {key: np.stack([np.interp(self.days * 86400., dat['time'],
+                                                dat[key]) for dat in dats])
+                       for key in self.fields}
+
+        # log fields are clipped to their smallest positive value (e.g., zero
+        # luminosity before breakout)
+        self._floor = {}
+        for key in self.log_fields:
+            positive = self.curves[key][self.curves[key] > 0]
+            if len(positive) == 0:
+                raise ValueError(f'{key} is not positive anywhere, cannot emulate in log10')
+            self._floor[key] = positive.min()
+
+        self._fit = _fit(self._x(self.table), self._y(self.curves),
+                         n_components=n_components, smoothing=smoothing)
+        self.explained = self._fit['explained']
+
+        tools.printv(f'Emulator: {len(self.models)} models, '
+                     f'{len(self.explained)} components, '
+                     f'explained variance {self.explained.sum():.5f}', verbose)
+
+    # =======================================================
+    #                   Prediction
+    # =======================================================
+    def predict(self, params):
+        """
+        Emulated dat curves at given parameter points
+        Returns : dict with 'day', and (point x day) arrays of each field
+
+        parameters
+        ----------
+        params : dict, pd.DataFrame, or 2D array
+            param values keyed by name, or (point x param) array with
+            columns in the order of self.params. Params that are constant
+            over the training models are ignored, and may be left out
+            (array columns are then the varied params only).
+        """
+        y = _predict(self._fit, self._x(params))
+        return dict(day=self.days, **self._unstack(y))
+
+    def cross_validate(self, n_folds=None, seed=0):
+        """
+        Interpolation error on held-out models: the emulator is refit without
+        each fold, and compared with the held-out curves. Errors are in dex
+        for log fields.
+        Returns : pd.DataFrame indexed by model, with columns <field>_rms, <field>_max
+
+        parameters
+        ----------
+        n_folds : int
+            number of folds. Defaults to leave-one-out.
+        seed : int
+            for shuffling models into folds
+        """
+        n = len(self.models)
+        n_folds = n if n_folds is None else n_folds
+        folds = np.array_split(np.random.default_rng(seed).permutation(n), n_folds)
+
+        x = self._x(self.table)
+        y = self._y(self.curves)
+        errors = np.full_like(y, np.nan)
+
+        for test in folds:
+            train = np.setdiff1d(np.arange(n), test)
+            fit = _fit(x[train], y[train], n_components=self.n_components,
+                       smoothing=self.smoothing)
+            errors[test] = _predict(fit, x[test]) - y[test]
+
+        errors = self._unstack(errors, transform=False)
+        table = pd.DataFrame(index=self.table.index)
+        for key in self.fields:
+            table[f'{key}_rms'] = np.sqrt(np.nanmean(errors[key]**2, axis=1))
+            table[f'{key}_max'] = np.nanmax(np.abs(errors[key]), axis=1)
+
+        for key in self.fields:
+            unit = ' dex' if key in self.log_fields else ''
+            tools.printv(f'{key}: median rms error '
+                         f"{table[f'{key}_rms'].median():.4g}{unit}", self.verbose)
+        return table
+
+    # =======================================================
+    #                   Transforms
+    # =======================================================
+    def _x(self, params):
+        """Param points as a (point x varied param) array, logged and rescaled
+        """
+        varied = [p for p, v in zip(self.params, self._varied) if v]
+        if not isinstance(params, (dict, pd.DataFrame)):
+            params = np.array(np.atleast_2d(params), dtype=float)
+            if params.shape[1] == len(self.params):
+                params = params[:, self._varied]
+            elif params.shape[1] != len(varied):
+                raise ValueError(f'params must have columns {self.params}, '
+                                 f'or {varied} (the params that vary)')
+
+        x = self._log_x(params, names=varied)
+        lo, hi = self._x_range
+        return (x - lo) / (hi - lo)
+
+    def _log_x(self, params, names=None):
+        """Param points as a (point x param) array, with log params in log10
+
+        params : dict, pd.DataFrame, or 2D array (with columns names)
+        names : [str]
+            defaults to self.params
+        """
+        names = self.params if names is None else names
+        if isinstance(params, (dict, pd.DataFrame)):
+            x = np.column_stack([np.atleast_1d(np.asarray(params[p], dtype=float))
+                                 for p in names])
+        else:
+            x = np.array(np.atleast_2d(params), dtype=float)
+
+        for i, p in enumerate(names):
+            if p in self.log_params:
+                x[:, i] = np.log10(x[:, i])
+
+        return x
+
+    def _y(self, curves):
+        """Curves of all fields as one (model x field*day) array
+        """
+        return np.hstack([np.log10(np.maximum(curves[key], self._floor[key]))
+                          if key in self.log_fields else curves[key]
+                          for key in self.fields])
+
+    def _unstack(self, y, transform=True):
+        """Split a (point x field*day) array into fields, undoing _y()
+        """
+        curves = {}
+        for key, block in zip(self.fields, np.split(y, len(self.fields), axis=1)):
+            if transform and key in self.log_fields:
+                block = 10**block
+            curves[key] = block
+        return curves
+
+    def _get_days(self, dats, days, n_days):
+        """Day grid covered by every model
+        """
+        first = max(dat['time'].iloc[0] for dat in dats) / 86400.
+        last = min(dat['time'].iloc[-1] for dat in dats) / 86400.
+
+        if days is None:
+            return np.linspace(max(first, 0.0), last, n_days)
+
+        days = np.asarray(days, dtype=float)
+        if days.min() < first or days.max() > last:
+            raise ValueError(f'days must be within [{first:.3f}, {last:.3f}], '
+                             'the range covered by all models')
+        return days
+
+def _fit(x, y, n_components, smoothing):
+    """
+    Fit PCA of curves, and RBF interpolation of component weights over params
+    Returns : dict of arrays
+
+    parameters
+    ----------
+    x : 2D array
+        (model x param), rescaled
+    y : 2D array
+        (model x field*day)
+    n_components : int
+    smoothing : float
+    """
+    n, d = x.shape
+    if n < d + 2:
+        raise ValueError(f'Need at least {d + 2} models to emulate over {d} params')
+
+    mean = y.mean(axis=0)
+    scale = y.std(axis=0)
+    scale[scale == 0] = 1.0
+    u, s, vt = np.linalg.svd((y - mean) / scale, full_matrices=False)
+
+    k = min(n_components, len(s))
+    weights = u[:, :k] * s[:k]
+
+    # thin-plate spline with a linear polynomial term
+    poly = np.hstack([np.ones((n, 1)), x])
+    a = np.zeros((n + d + 1, n + d + 1))
+    a[:n, :n] = _kernel(x, x) + smoothing * np.eye(n)
+    a[:n, n:] = poly
+    a[n:, :n] = poly.T
+    b = np.vstack([weights, np.zeros((d + 1, k))])
+    coeffs = np.linalg.solve(a, b)
+
+    return {'x': x, 'mean': mean, 'scale': scale, 'components': vt[:k],
+            'rbf': coeffs[:n], 'poly': coeffs[n:],
+            'explained': s[:k]**2 / np.sum(s**2)}
+
+def _predict(fit, x):
+    """
+    Curves at param points, from _fit()
+    Returns : 2D array (point x field*day)
+
+    parameters
+    ----------
+    fit : dict
+    x : 2D array
+        (point x param), rescaled
+    """
+    poly = np.hstack([np.ones((len(x), 1)), x])
+    weights = _kernel(x, fit['x']) @ fit['rbf'] + poly @ fit['poly']
+    return (weights @ fit['components']) * fit['scale'] + fit['mean']
+
+def _kernel(x1, x2):
+    """
+    Thin-plate spline kernel, r^2 log(r), between two sets of points
+    Returns : 2D array (len(x1) x len(x2))
+    """
+    r2 = (np.sum(x1**2, axis=1)[:, np.newaxis] + np.sum(x2**2, axis=1)
+          - 2 * x1 @ x2.T)
+    r2 = np.maximum(r2, 0.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        k = 0.5 * r2 * np.log(r2)
+    return np.where(r2 > 0, k, 0.0)
@@ -0,0 +1,300 @@
+"""
+Ensemble class for a collection of SNEC runs, e.g., a parameter study.
+
+An Ensemble instance holds one Simulation per model and provides
+batched access to their data.
+
+Info
+-------------------
+    Setup arguments
+    ---------------
+    models: Names of the SNEC run directories.
+
+    Data structures
+    ---------------
+    sims: Simulation objects, keyed by model. Dictionary.
+"""
+
+import time
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+
+# snac
+from . import archive as snac_archive
+from . import features
+from . import plot_tools
+from . import shared
+from . import simulation
+from . import tools
+
+class Ensemble:
+    """
+    Collection of Simulation objects.
+    """
+    def __init__(self, models, config='snec', output_dir='Data',
+                 verbose=True, reload=False, save=True, load_profiles=False,
+                 background=False, archive=None):
+        """
+        parameters
+        ----------
+        models : [str]
+            names of the model directories. If None, all models in archive.
+        config : str
+            Base name of config file to use, e.g. 'snec' for 'config/snec.ini'
+        output_dir : str
+            name of subdirectory containing model output files
+        verbose : bool
+            print information to terminal
+        reload : bool
+            load from raw data, not saved pickle files (slow)
+        save : bool
+            save extracted data to pickle files (for faster loading)
+        load_profiles : bool
+            do, or do not, load mass profiles
+        background : bool
+            load profiles in background threads, see Simulation
+        archive : str or archive.Archive
+            HDF5 ensemble archive to load models from, see archive.py
+        """
+        t0 = time.time()
+        if isinstance(archive, str):
+            archive = snac_archive.Archive(archive)
+        if models is None:
+            if archive is None:
+                raise ValueError('Specify models, or an archive to take them from')
+            models = archive.models
+
+        self.verbose = verbose
+        self.config = config
+        self.archive = archive
+        self.models = list(tools.ensure_sequence(models))
+        self.sims = {}
+
+        for model in self.models:
+            self.sims[model] = simulation.Simulation(
+                                    model=model, config=config,
+                                    output_dir=output_dir, verbose=verbose,
+                                    reload=reload, save=save,
+                                    load_profiles=load_profiles,
+                                    background=background, archive=archive)
+
+        t1 = time.time()
+        tools.printv(f'Ensemble load time: {t1-t0:.3f} s', verbose)
+
+    def __getitem__(self, model):
+        return self.sims[model]
+
+    def __len__(self):
+        return len(self.models)
+
+    # =======================================================
+    #                   Manipulation
+    # =======================================================
+    def sample_dat(self, days, interpolate=False):
+        """
+        Sample dat quantities of every model at a set of days post shock breakout.
+        See Simulation.sample_dat()
+        Returns : pd.DataFrame indexed by (model, day)
+
+        Parameters:
+        -----------
+        days : float or [float]
+        interpolate : bool
+        """
+        samples = {model: self.sims[model].sample_dat(days=days,
+                                                      interpolate=interpolate)
+                   for model in self.models}
+
+        return pd.concat(samples, names=['model'])
+
+    def regrid(self, fields, grid, days, coord='mass'):
+        """
+        Interpolate profile fields of every model onto a shared mass grid.
+        See Simulation.regrid(). Profiles need not be loaded: if they are
+        not, fields are read from the array cache or the archive
+        (see Simulation.get_profile_arrays()).
+        Returns : dict of (model x day x grid) arrays, NaN outside of each model grid
+
+        Parameters:
+        -----------
+        fields : str or [str]
+        grid : 1D array
+        days : float or [float]
+        coord : {'mass', 'mass_fraction'}
+        """
+        fields = tools.ensure_sequence(fields)
+        regridded = [self.sims[model].regrid(fields, grid=grid, days=days,
+                                             coord=coord)
+                     for model in self.models]
+
+        return {key: np.stack([r[key] for r in regridded]) for key in fields}
+
+    def to_dataset(self, fields=None, chunks=64):
+        """
+        Labeled xarray Dataset of all models, with dims (model, time, cell).
+        See Simulation.to_dataset(). Time dims are indexed by snapshot number,
+        with the actual times in the 't' and 'dat_t' coordinates; models with
+        fewer snapshots or cells are padded with NaN. Scalars have dim (model).
+        Profiles stay lazily backed by each model's array cache.
+        Returns : xr.Dataset
+
+        parameters
+        ----------
+        fields : [str]
+        chunks : int
+        """
+        import xarray as xr
+
+        datasets = [self.sims[model].to_dataset(fields=fields, chunks=chunks,
+                                                positional_time=True)
+                    for model in self.models]
+
+        ds = xr.concat(datasets, dim=pd.Index(self.models, name='model'),
+                       join='outer', coords='different', compat='equals',
+                       combine_attrs='drop')
+
+        scalars = pd.DataFrame([self.sims[model].scalars for model in self.models])
+        for col in scalars:
+            ds[col] = ('model', scalars[col].to_numpy())
+
+        return ds
+
+    def share(self, fields=None, backing='shm', path=None):
+        """
+        Place the dense profile arrays of every model in shared memory,
+        for multiprocessing analysis. See shared.SharedArrays.
+        Returns : shared.SharedArrays
+
+        Parameters:
+        -----------
+        fields : [str]
+        backing : {'shm', 'memmap'}
+        path : str
+        """
+        arrays = [self.sims[model].get_profile_arrays() for model in self.models]
+        return shared.SharedArrays(self.models, fields=fields, config=self.config,
+                                   backing=backing, path=path, arrays=arrays,
+                                   verbose=self.verbose)
+
+    def get_features(self, n_workers=None, **kwargs):
+        """
+        Light curve features of every model, one row per model.
+        See features.feature_table()
+        Returns : pd.DataFrame indexed by model
+
+        Parameters:
+        -----------
+        n_workers : int
+        **kwargs
+            args for features.feature_table()
+        """
+        return features.feature_table(self.models, config=self.config,
+                                      n_workers=n_workers, **kwargs)
+
+    # =======================================================
+    #                   Plotting
+    # =======================================================
+    def plot_dat(self, y_var, color_by=None, y_scale='log', x_scale='linear',
+                 cmap='viridis', n_points=None, display=True, ax=None,
+                 figsize=(8, 6), linewidth=0.5, alpha=1.0):
+        """
+        Overlay a dat quantity of every model, against days post breakout.
+        Curves are decimated and drawn as one LineCollection, see
+        plot_tools.plot_curves()
+        Returns : fig, ax
+
+        Parameters:
+        -----------
+        y_var : str
+        color_by : str
+            scalar to colour curves by, e.g. 'zams' or 'E_bomb'
+        y_scale : {'log', 'linear'}
+        x_scale : {'log', 'linear'}
+        cmap : str
+        n_points : int
+            points per decimated curve. Defaults to the axes width in pixels
+        display : bool
+        ax : Axes
+        figsize : [width, height]
+        linewidth : float
+        alpha : float
+        """
+        curves = [(self.sims[model].dat['time'] / 86400., self.sims[model].dat[y_var])
+                  for model in self.models]
+
+        fig, ax = self._plot_curves(curves, color_by=color_by, x_scale=x_scale,
+                                    y_scale=y_scale, cmap=cmap, n_points=n_points,
+                                    ax=ax, figsize=figsize, linewidth=linewidth,
+                                    alpha=alpha)
+        ax.set_xlabel('$t$ (days)')
+        ax.set_ylabel(self.sims[self.models[0]].get_label(y_var))
+
+        if display:
+            plt.show(block=False)
+
+        return fig, ax
+
+    def plot_profile(self, y_var, day, x_var='mass', color_by=None, y_scale=None,
+                     x_scale=None, cmap='viridis', n_points=None, display=True,
+                     ax=None, figsize=(8, 6), linewidth=0.5, alpha=1.0):
+        """
+        Overlay a profile of every model, at a given day post breakout
+        (see Simulation.get_snapshot_index). Curves are decimated and drawn
+        as one LineCollection, see plot_tools.plot_curves()
+        Returns : fig, ax
+
+        Parameters:
+        -----------
+        y_var : str
+        day : float
+        x_var : str
+        color_by : str
+            scalar to colour curves by, e.g. 'zams' or 'E_bomb'
+        y_scale : {'log', 'linear'}
+            defaults to config [plotting] ax_scales
+        x_scale : {'log', 'linear'}
+        (see plot_dat)
+        """
+        sim = self.sims[self.models[0]]
+        ax_scales = sim.config['plotting']['ax_scales']
+        x_scale = x_scale or ax_scales.get(x_var, 'log')
+        y_scale = y_scale or ax_scales.get(y_var, 'log')
+
+        curves = []
+        for model in self.models:
+            arrays = self.sims[model].get_profile_arrays()
+            row = self.sims[model].get_snapshot_index(day)[0]
+            x = arrays['mass'] if x_var == 'mass' else arrays[x_var][row]
+            curves.append((x, arrays[y_var][row]))
+
+        fig, ax = self._plot_curves(curves, color_by=color_by, x_scale=x_scale,
+                                    y_scale=y_scale, cmap=cmap, n_points=n_points,
+                                    ax=ax, figsize=figsize, linewidth=linewidth,
+                                    alpha=alpha)
+        ax.set_title(f't = {day:g} days')
+        ax.set_xlabel(sim.get_label(x_var))
+        ax.set_ylabel(sim.get_label(y_var))
+
+        if display:
+            plt.show(block=False)
+
+        return fig, ax
+
+    def _plot_curves(self, curves, color_by, x_scale, y_scale, cmap, n_points,
+                     ax, figsize, linewidth, alpha):
+        """Setup fig, ax, and draw curves of every model
+        """
+        fig = None
+        if ax is None:
+            fig, ax = plt.subplots(figsize=figsize)
+
+        values = None
+        if color_by is not None:
+            values = [self.sims[model].scalars[color_by] for model in self.models]
+
+        plot_tools.plot_curves(ax, curves, values=values, cmap=cmap,
+                               n_points=n_points, x_scale=x_scale,
+                               y_scale=y_scale, colorbar_label=color_by,
+                               linewidths=linewidth, alpha=alpha)
+        return fig, ax
@@ -0,0 +1,160 @@
+"""
+Light curve feature extraction from the .dat quantities.
+
+Features are computed from the dat arrays of one model in a single
+vectorized pass, and are cached per model alongside the dat cache.
+The cache is validated against a fingerprint of the raw .dat files
+(see load.dat_fingerprint), so tables over large ensembles are rebuilt
+from the cache after the first run.
+"""
+
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import numpy as np
+import pandas as pd
+
+# snac
+from . import cache
+from . import load
+from . import paths
+from . import tools
+
+def lc_features(time, lum, vel, days=(15.0, 50.0), t_min=20.0, drop_dex=0.2):
+    """
+    Compute light curve features from dat arrays.
+    Returns : dict
+
+    lum_<day>, vel_photo_<day> : luminosity and photospheric velocity at given days
+    t_drop : day of steepest decline in log L (after t_min), i.e., the drop off the plateau
+    t_plateau : plateau duration. First day after t_min where L falls drop_dex
+        below L(50 d). NaN if it never does.
+
+    Parameters:
+    -----------
+    time : np.array
+        time post shock breakout [s]
+    lum  : np.array
+        lum_observed
+    vel  : np.array
+        vel_photo
+    days : [float]
+        days post breakout at which to sample lum and vel
+    t_min : float
+        ignore times before t_min days when locating the plateau drop
+    drop_dex : float
+        decline in log L from L(50 d) marking the end of the plateau
+    """
+    day = np.asarray(time, dtype=float) / 86400.
+    lum = np.asarray(lum, dtype=float)
+    vel = np.asarray(vel, dtype=float)
+    days = np.asarray(tools.ensure_sequence(days), dtype=float)
+
+    features = {}
+
+    ind, w = tools.interp_weights(days, day)
+    lum_days = lum[ind] * (1.0 - w) + lum[ind + 1] * w
+    vel_days = vel[ind] * (1.0 - w) + vel[ind + 1] * w
+    for d, l, v in zip(days, lum_days, vel_days):
+        features[f'lum_{d:g}'] = l
+        features[f'vel_photo_{d:g}'] = v
+
+    log_lum = np.log10(np.clip(lum, 1e-99, None))
+    late = day >= t_min
+
+    if np.count_nonzero(late) > 2:
+        slope = np.gradient(log_lum[late], day[late])
+        features['t_drop'] = day[late][np.argmin(slope)]
+
+        i50, w50 = tools.interp_weights(50.0, day)
+        log_lum_50 = log_lum[i50] * (1.0 - w50) + log_lum[i50 + 1] * w50
+        below = np.flatnonzero(log_lum[late] < log_lum_50 - drop_dex)
+        features['t_plateau'] = day[late][below[0]] if len(below) > 0 else np.nan
+    else:
+        features['t_drop'] = np.nan
+        features['t_plateau'] = np.nan
+
+    return features
+
+def model_features(model, config='snec', days=(15.0, 50.0), t_min=20.0,
+                   drop_dex=0.2, use_cache=True, verbose=False):
+    """
+    Light curve features for one model, using the feature cache if valid.
+    Returns : dict
+
+    Parameters:
+    -----------
+    model : str
+    config : str
+    days : [float]
+    t_min : float
+    drop_dex : float
+    use_cache : bool
+        load from, and save to, the feature cache
+    verbose : bool
+    (see lc_features)
+    """
+    cols = load.load_config(name=config, verbose=False)['dat_quantities']['fields']
+    params = {'days': tuple(tools.ensure_sequence(days)), 't_min': t_min,
+              'drop_dex': drop_dex}
+    fingerprint = load.dat_fingerprint(model, cols=cols)
+    filepath = paths.features_temp_filepath(model)
+
+    if use_cache and os.path.exists(filepath):
+        with open(filepath, 'rb') as f:
+            cached = pickle.load(f)
+        if cached['fingerprint'] == fingerprint and cached['params'] == params:
+            tools.printv(f'Loading feature cache: {filepath}', verbose)
+            cache.touch(model)
+            return cached['features']
+
+    # rebuilt if the .dat files changed, see load.get_dat
+    dat = load.get_dat(model, cols=cols, verbose=verbose)
+    fingerprint = dat.attrs['fingerprint']
+    t_sb = load.get_scalars(model, var=['t_sb'])['t_sb']
+
+    features = lc_features(time=dat['time'].to_numpy() - t_sb,
+                           lum=dat['lum_observed'].to_numpy(),
+                           vel=dat['vel_photo'].to_numpy(), **params)
+
+    if use_cache:
+        load.ensure_temp_dir_exists(model, verbose=False)
+        tools.printv(f'Saving feature cache: {filepath}', verbose)
+        with cache.atomic_write(filepath) as f:
+            pickle.dump({'fingerprint': fingerprint, 'params': params,
+                         'features': features}, f)
+        cache.touch(model)
+
+    return features
+
+def feature_table(models, config='snec', n_workers=None, days=(15.0, 50.0),
+                  t_min=20.0, drop_dex=0.2, use_cache=True, verbose=False):
+    """
+    Light curve features over an ensemble, one row per model.
+    Models are processed in parallel worker processes.
+    Returns : pd.DataFrame indexed by model
+
+    Parameters:
+    -----------
+    models : [str]
+    config : str
+    n_workers : int
+        number of worker processes. Defaults to os.cpu_count(). 1 runs serially.
+    days : [float]
+    t_min : float
+    drop_dex : float
+    use_cache : bool
+    verbose : bool
+    """
+    models = list(tools.ensure_sequence(models))
+    func = partial(model_features, config=config, days=days, t_min=t_min,
+                   drop_dex=drop_dex, use_cache=use_cache, verbose=verbose)
+
+    if n_workers == 1:
+        rows = [func(model) for model in models]
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            rows = list(pool.map(func, models, chunksize=max(1, len(models) // 64)))
+
+    return pd.DataFrame(rows, index=pd.Index(models, name='model'))
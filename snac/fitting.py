@@ -0,0 +1,140 @@
+"""
+Chi-square fitting of observations over an ensemble of models and a grid
+of explosion epochs.
+
+Model curves (dat columns, and FeII 5169 velocities, 'v_Fe') of every model
+are resampled once onto a common grid of days post breakout, as (model x day)
+arrays (see model_curves). Chi-square is then evaluated for every model and
+offset at once (see matching.chi2_grid), with the observed epochs mapped to
+model days as: day post breakout = observed day + offset.
+
+Example:
+    data = {'lum_observed': (days, lum, lum_err),
+            'v_Fe': (fe_days, v_fe, v_fe_err)}
+    table, surface = fitting.fit(data, offsets=np.arange(0, 20, 0.1),
+                                 models=models)
+"""
+
+import numpy as np
+import pandas as pd
+
+# snac
+from . import ensemble
+from . import matching
+from . import tools
+
+def fit(data, offsets, models=None, curves=None, grid=None, fe_days=None,
+        config='snec', archive=None, verbose=True):
+    """
+    Chi-square of observations for every model and offset.
+    Returns : table, surface
+
+    table : pd.DataFrame ranked by chi2, with columns model, offset (best),
+        chi2, chi2_<quantity>, and likelihood (marginalized over offsets,
+        normalized over models)
+    surface : pd.DataFrame (model x offset) of likelihood, exp(-chi2/2),
+        normalized to sum to 1
+
+    parameters
+    ----------
+    data : dict
+        observations {quantity: (days, values, errors)}. Quantities are dat
+        columns (in their units), or 'v_Fe' [km/s]
+    offsets : 1D array
+        trial days from breakout to the reference epoch of the observed days
+    models : [str] or ensemble.Ensemble
+        not needed if curves are given
+    curves : dict
+        precomputed model curves, see model_curves()
+    grid : 1D array
+        days post breakout to resample models onto (if curves not given).
+        Defaults to 0.5 day spacing up to the last observed day + offset
+    fe_days : [float]
+        days to compute v_Fe at (if curves not given), see model_curves()
+    config : str
+    archive : str or archive.Archive
+    verbose : bool
+    """
+    offsets = np.asarray(tools.ensure_sequence(offsets), dtype=float)
+
+    if curves is None:
+        if grid is None:
+            last = max(np.max(obs[0]) for obs in data.values()) + offsets.max()
+            grid = np.arange(0.0, last + 1.0, 0.5)
+        curves = model_curves(models, quantities=list(data), grid=grid,
+                              fe_days=fe_days, config=config, archive=archive,
+                              verbose=verbose)
+    models = curves['model']
+
+    chi2_quantity = {}
+    for key, (days, values, errors) in data.items():
+        chi2_quantity[key] = matching.chi2_grid(curves[key], curves['day'],
+                                                days=days, obs=values,
+                                                err=errors, shifts=offsets)
+    chi2 = np.sum(list(chi2_quantity.values()), axis=0)
+
+    with np.errstate(invalid='ignore'):
+        likelihood = np.exp(-0.5 * (chi2 - np.min(chi2)))
+    likelihood /= np.sum(likelihood)
+
+    best = np.argmin(chi2, axis=1)
+    rows = np.arange(len(models))
+    table = pd.DataFrame({'model': models, 'offset': offsets[best],
+                          'chi2': chi2[rows, best]})
+    for key, array in chi2_quantity.items():
+        table[f'chi2_{key}'] = array[rows, best]
+    table['likelihood'] = likelihood.sum(axis=1)
+
+    table = table.sort_values('chi2', ignore_index=True)
+    surface = pd.DataFrame(likelihood, index=pd.Index(models, name='model'),
+                           columns=pd.Index(offsets, name='offset'))
+
+    return table, surface
+
+def model_curves(models, quantities, grid, fe_days=None, config='snec',
+                 archive=None, verbose=True):
+    """
+    Resample model curves onto a common grid of days post breakout, for fit().
+    Returns : dict with 'model', 'day' (the grid), and (model x day) arrays
+        of each quantity, NaN where a model does not cover the grid
+
+    parameters
+    ----------
+    models : [str] or ensemble.Ensemble
+    quantities : [str]
+        dat columns, or 'v_Fe' (FeII 5169 velocity [km/s], see
+        Simulation.vel_FeII_curve; needs H_frac profiles)
+    grid : 1D array
+        days post breakout
+    fe_days : [float]
+        days to compute v_Fe at, interpolated onto grid. Defaults to every
+        5 days up to the last day of grid
+    config : str
+    archive : str or archive.Archive
+    verbose : bool
+    """
+    if not isinstance(models, ensemble.Ensemble):
+        models = ensemble.Ensemble(models, config=config, archive=archive,
+                                   load_profiles=False, verbose=False)
+    grid = np.asarray(grid, dtype=float)
+    quantities = list(tools.ensure_sequence(quantities))
+    if fe_days is None:
+        fe_days = np.arange(5.0, grid[-1] + 5.0, 5.0)
+
+    curves = {'model': list(models.models), 'day': grid}
+    for key in quantities:
+        curves[key] = np.full((len(models), len(grid)), np.nan)
+
+    for i, model in enumerate(models.models):
+        tools.printv(f'Resampling curves: {model}', verbose)
+        sim = models[model]
+        day = sim.dat['time'].to_numpy() / 86400.
+
+        for key in quantities:
+            if key == 'v_Fe':
+                curves[key][i] = np.interp(grid, fe_days, sim.vel_FeII_curve(fe_days),
+                                           left=np.nan, right=np.nan)
+            else:
+                curves[key][i] = np.interp(grid, day, sim.dat[key].to_numpy(),
+                                           left=np.nan, right=np.nan)
+    return curves
@@ -0,0 +1,267 @@
+"""
+Kernels for the hot loops: ionization table lookup (lines.py),
+the tau = 1 search (quantities.iron_velocity) and .xg text scanning
+(load.xg_to_dict).
+
+Each kernel has a pure-NumPy implementation and, if Numba is installed,
+a compiled one. Both give identical results. Numba is used when available
+unless disabled with the SNAC_NUMBA environment variable
+(e.g. export SNAC_NUMBA=no) or set_numba(False).
+See tools/bench_kernels.py for timings.
+"""
+
+import os
+import re
+import numpy as np
+
+# snac
+from . import tools
+
+try:
+    import numba
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+
+USE_NUMBA = HAVE_NUMBA and tools.str_to_bool(os.environ.get('SNAC_NUMBA', 'yes'))
+
+def set_numba(use_numba):
+    """
+    Turn Numba kernels on/off.
+    parameters
+    ----------
+    use_numba : bool
+    """
+    global USE_NUMBA
+    if use_numba and not HAVE_NUMBA:
+        raise ImportError('Numba is not installed')
+    USE_NUMBA = use_numba
+
+def _jit(func):
+    """Compile with Numba, if installed
+    """
+    if HAVE_NUMBA:
+        return numba.njit(cache=True)(func)
+    return func
+
+# ===============================================================
+#                      Ionization table lookup
+# ===============================================================
+def eta_lookup(density, temp, rho_grid, temp_grid, eta_grid):
+    """
+    Look up ionization fractions from a regular (rho, T) table, taking the
+    nearest tabulated density and the largest tabulated temperature <= temp.
+    Zero outside of the table, and at its (max rho, max T) corner.
+    Returns : np.array, shaped as density
+
+    parameters
+    ----------
+    density : np.array
+    temp : np.array
+    rho_grid : np.array
+        ascending table densities
+    temp_grid : np.array
+        ascending table temperatures
+    eta_grid : 2D np.array
+        (rho x T) table
+    """
+    return table_values(table_index(density, temp, rho_grid, temp_grid), eta_grid)
+
+def table_index(density, temp, rho_grid, temp_grid):
+    """
+    Locate (rho, T) points on a regular table grid, as in eta_lookup().
+    The index only depends on the grid, so it can be shared by all tables
+    on the same grid (see table_values()).
+    Returns : np.array of flat (rho x T) table indices, shaped as density,
+        -1 where eta_lookup() gives zero
+
+    parameters
+    ----------
+    density : np.array
+    temp : np.array
+    rho_grid : np.array
+        ascending table densities
+    temp_grid : np.array
+        ascending table temperatures
+    """
+    density = np.asarray(density, dtype=float)
+    temp = np.asarray(temp, dtype=float)
+
+    if USE_NUMBA:
+        ind = _table_index_numba(density.ravel(), temp.ravel(), rho_grid, temp_grid)
+    else:
+        ind = _table_index_numpy(density.ravel(), temp.ravel(), rho_grid, temp_grid)
+
+    return ind.reshape(density.shape)
+
+def table_values(ind, eta_grid):
+    """
+    Table values at indices from table_index(), zero where ind = -1
+    Returns : np.array, shaped as ind
+
+    parameters
+    ----------
+    ind : np.array
+    eta_grid : 2D np.array
+        (rho x T) table
+    """
+    eta = np.ravel(eta_grid)[ind]
+    eta[ind < 0] = 0.0
+
+    return eta
+
+def _table_index_numpy(density, temp, rho_grid, temp_grid):
+    """NumPy version of table_index, for flat arrays
+    """
+    hi = np.clip(np.searchsorted(rho_grid, density), 1, len(rho_grid) - 1)
+    lo = hi - 1
+    # ties go to the larger density
+    ind_r = np.where(np.abs(rho_grid[hi] - density) <= np.abs(rho_grid[lo] - density),
+                     hi, lo)
+    ind_T = np.clip(np.searchsorted(temp_grid, temp, side='right') - 1,
+                    0, len(temp_grid) - 1)
+
+    ind = ind_r * len(temp_grid) + ind_T
+
+    outside = ((density < rho_grid[0]) | (density > rho_grid[-1])
+               | (temp < temp_grid[0]) | (temp > temp_grid[-1])
+               | ((temp == temp_grid[-1]) & (density == rho_grid[-1]))
+               | np.isnan(density) | np.isnan(temp))
+    ind[outside] = -1
+
+    return ind
+
+@_jit
+def _table_index_numba(density, temp, rho_grid, temp_grid):
+    """Numba version of table_index, for flat arrays
+    """
+    n_rho = len(rho_grid)
+    n_T = len(temp_grid)
+    ind = np.full(len(density), -1)
+
+    for i in range(len(density)):
+        d = density[i]
+        t = temp[i]
+        if not (d >= rho_grid[0] and d <= rho_grid[n_rho - 1]):
+            continue
+        if not (t >= temp_grid[0] and t <= temp_grid[n_T - 1]):
+            continue
+        if t == temp_grid[n_T - 1] and d == rho_grid[n_rho - 1]:
+            continue
+
+        hi = min(max(np.searchsorted(rho_grid, d), 1), n_rho - 1)
+        lo = hi - 1
+        ind_r = hi if abs(rho_grid[hi] - d) <= abs(rho_grid[lo] - d) else lo
+        ind_T = min(max(np.searchsorted(temp_grid, t, side='right') - 1, 0), n_T - 1)
+
+        ind[i] = ind_r * n_T + ind_T
+
+    return ind
+
+# ===============================================================
+#                      tau = 1 search
+# ===============================================================
+def tau_one_index(tau_sob):
+    """
+    Index of the outermost cell with tau_sob > 1, or -1 if there is none.
+    For 2D (time x cell) arrays, one index per row.
+    Returns : int, or np.array for 2D
+
+    parameters
+    ----------
+    tau_sob : np.array
+    """
+    tau_sob = np.asarray(tau_sob, dtype=float)
+    tau_2d = np.atleast_2d(tau_sob)
+
+    if USE_NUMBA:
+        ind = _tau_one_index_numba(tau_2d)
+    else:
+        ind = _tau_one_index_numpy(tau_2d)
+
+    return int(ind[0]) if tau_sob.ndim == 1 else ind
+
+def _tau_one_index_numpy(tau_sob):
+    """NumPy version of tau_one_index, for 2D arrays
+    """
+    mask = tau_sob > 1.0
+    last = mask.shape[1] - 1 - np.argmax(mask[:, ::-1], axis=1)
+
+    return np.where(mask.any(axis=1), last, -1)
+
+@_jit
+def _tau_one_index_numba(tau_sob):
+    """Numba version of tau_one_index, for 2D arrays
+    """
+    n_row, n_cell = tau_sob.shape
+    ind = np.full(n_row, -1)
+
+    for j in range(n_row):
+        for i in range(n_cell - 1, -1, -1):
+            if tau_sob[j, i] > 1.0:
+                ind[j] = i
+                break
+
+    return ind
+
+# ===============================================================
+#                      .xg scanning
+# ===============================================================
+def parse_xg(buf):
+    """
+    Parse the contents of a SNEC .xg file: blocks of (mass, value) lines,
+    each headed by a line containing 'Time' and ending with the time.
+    Returns : dict of (cell x 2) arrays, keyed by time
+
+    parameters
+    ----------
+    buf : bytes
+    """
+    if USE_NUMBA:
+        starts, ends = _scan_headers_numba(np.frombuffer(buf, dtype=np.uint8))
+    else:
+        starts, ends = _scan_headers_numpy(buf)
+
+    dd = {}
+
+    for k in range(len(starts)):
+        time = float(buf[starts[k]:ends[k]].split()[-1])
+        stop = starts[k + 1] if k + 1 < len(starts) else len(buf)
+        block = buf[ends[k]:stop].decode()
+        dd[time] = np.fromstring(block, sep=' ').reshape(-1, 2)
+
+    return dd
+
+def _scan_headers_numpy(buf):
+    """Start/end offsets of header lines (containing 'Time')
+    """
+    spans = [m.span() for m in re.finditer(rb'^[^\n]*Time[^\n]*$', buf, re.M)]
+    starts = np.array([s[0] for s in spans], dtype=np.int64)
+    ends = np.array([s[1] for s in spans], dtype=np.int64)
+
+    return starts, ends
+
+@_jit
+def _scan_headers_numba(buf):
+    """Numba version of _scan_headers_numpy, for a uint8 array
+    """
+    n = len(buf)
+    starts = np.empty(n // 5 + 1, dtype=np.int64)
+    ends = np.empty(n // 5 + 1, dtype=np.int64)
+    n_header = 0
+    line_start = 0
+    has_time = False
+
+    for i in range(n + 1):
+        if i == n or buf[i] == 10:  # end of line
+            if has_time:
+                starts[n_header] = line_start
+                ends[n_header] = i
+                n_header += 1
+            line_start = i + 1
+            has_time = False
+        elif (buf[i] == 84 and i + 3 < n and buf[i+1] == 105  # 'Time'
+              and buf[i+2] == 109 and buf[i+3] == 101):
+            has_time = True
+
+    return starts[:n_header], ends[:n_header]
@@ -0,0 +1,206 @@
+"""
+Sobolev optical depths and tau = 1 velocities of spectral lines.
+
+Each line is registered in LINES with its rest wavelength, oscillator
+strength, and a table of the fraction of its species in the lower level of
+the transition, as a function of (rho, T), in snac/data (see eta_table()).
+The number density of the species is taken as a fixed fraction of the
+hydrogen mass fraction profile (abundance * X), since SNEC does not track
+the composition of the envelope.
+
+Lines are evaluated together: the location of each (rho, T) point on a
+table grid is found once (kernels.table_index) and shared by every line
+tabulated on the same grid, and profiles are passed as (snapshot x cell)
+arrays, so many lines at many days are a single pass over the snapshots
+(see Simulation.line_velocities).
+
+Only FeII 5169 is registered by default, as it is the only table shipped
+in snac/data. Other lines are added with register_line(), e.g.
+    lines.register_line('FeII_5018', wavelength=5018.4, f=..., table=...)
+with the table file placed in snac/data.
+"""
+
+import functools
+import os
+import numpy as np
+from astropy import units as u
+from astropy import constants as const
+
+# snac
+from . import kernels
+from . import paths
+from . import tools
+
+LINES = {}
+
+class Line:
+    """
+    Atomic data of a spectral line, for Sobolev optical depths
+    """
+    def __init__(self, name, wavelength, f, table, A, abundance):
+        """
+        parameters
+        ----------
+        name : str
+        wavelength : float
+            rest wavelength [Angstrom]
+        f : float
+            oscillator strength
+        table : str
+            file in snac/data of the fraction of the species in the lower
+            level (columns: rho, T, eta), see eta_table()
+        A : float
+            mass number of the species
+        abundance : float
+            mass fraction of the species, per unit hydrogen mass fraction
+        """
+        self.name = name
+        self.wavelength = wavelength
+        self.f = f
+        self.table = table
+        self.A = A
+        self.abundance = abundance
+
+    def __repr__(self):
+        return (f'Line({self.name}, {self.wavelength} A, f={self.f}, '
+                f'table={self.table})')
+
+    def coefficient(self):
+        """
+        Factor converting (rho * X * eta * t_exp) to tau_sob (cgs)
+        Returns : float
+        """
+        m_e = const.m_e.cgs.value
+        c = const.c.cgs.value
+        q_e = const.e.gauss.value
+        lambda_0 = (self.wavelength * u.Angstrom).to('cm').value
+
+        return ((np.pi * q_e**2) / (m_e * c) * self.f * lambda_0
+                * const.N_A.value * self.abundance / self.A)
+
+def register_line(name, wavelength, f, table, A=56, abundance=0.0016912):
+    """
+    Add a line to LINES, or replace it. Defaults are for iron, at the solar
+    iron-to-hydrogen mass ratio. See Line.
+
+    parameters
+    ----------
+    name : str
+    wavelength : float
+    f : float
+    table : str
+    A : float
+    abundance : float
+    """
+    LINES[name] = Line(name, wavelength=wavelength, f=f, table=table,
+                       A=A, abundance=abundance)
+
+# Iron mass fraction is not tracked - assume it is the solar fraction of iron.
+# Should be valid in the outer parts of the star, where we will be looking later.
+register_line('FeII_5169', wavelength=5169, f=0.023, table='FeII_5169_eta.dat')
+
+@functools.lru_cache()
+def eta_table(filename):
+    """
+    Load a fractional ionization table (columns: rho, T, eta) from snac/data
+    as a regular grid. Loaded once per file.
+    Returns : rho_grid, temp_grid, eta_grid (rho x T)
+
+    Parameters:
+    -----------
+    filename : str
+    """
+    fn = os.path.join(paths.data_path(), filename)
+    rho, Temp, eta = np.loadtxt(fn, unpack=True)
+
+    rho_grid = np.unique(rho)
+    temp_grid = np.unique(Temp)
+    order = np.lexsort((Temp, rho))
+    eta_grid = eta[order].reshape(len(rho_grid), len(temp_grid))
+
+    return rho_grid, temp_grid, eta_grid
+
+def get_lines(lines=None):
+    """
+    Registered lines by name
+    Returns : [Line]
+
+    Parameters:
+    -----------
+    lines : str or [str]
+        defaults to all of LINES
+    """
+    if lines is None:
+        return list(LINES.values())
+
+    lines = tools.ensure_sequence(lines)
+    missing = [name for name in lines if name not in LINES]
+    if missing:
+        raise ValueError(f'Unknown lines: {missing}. Registered: {[*LINES]}')
+
+    return [LINES[name] for name in lines]
+
+def tau_sob(density, temp, X, t_exp, lines=None):
+    """
+    Sobolev optical depth profiles of several lines. The table lookup is done
+    once per table grid, for all lines tabulated on it.
+    Returns : dict of np.array (shaped as density), keyed by line
+
+    Parameters:
+    -----------
+    density : np.array
+    temp : np.array
+    X : np.array
+        Hydrogen mass fraction
+        All are profiles from SNEC output, 1D (cell), or 2D (snapshot x cell)
+    t_exp : float or 1D array
+        time since explosion [days]. Time of profiles + t_sb.
+        One per snapshot, for 2D profiles.
+    lines : str or [str]
+        registered lines, defaults to all of LINES
+    """
+    density = np.asarray(density, dtype=float)
+    temp = np.asarray(temp, dtype=float)
+    X = np.asarray(X, dtype=float)
+
+    t_exp = np.asarray(t_exp, dtype=float) * 86400
+    if t_exp.ndim == 1:
+        t_exp = t_exp[:, np.newaxis]
+
+    column = density * X * t_exp  # common to all lines
+    shared = {}  # table indices, keyed by grid
+    tau = {}
+
+    for line in get_lines(lines):
+        rho_grid, temp_grid, eta_grid = eta_table(line.table)
+        grid = (rho_grid.tobytes(), temp_grid.tobytes())
+
+        if grid not in shared:
+            shared[grid] = kernels.table_index(density, temp, rho_grid, temp_grid)
+
+        eta = kernels.table_values(shared[grid], eta_grid)
+        tau[line.name] = line.coefficient() * column * eta
+
+    return tau
+
+def tau_one_velocity(vel, tau_sob):
+    """
+    Velocity where the Sobolev optical depth = 1 (outermost cell with
+    tau_sob > 1), for each snapshot. Zero where there is none (e.g., rho, T
+    off the table), following quantities.iron_velocity().
+    Returns : float, or np.array for 2D [km/s]
+
+    Parameters:
+    -----------
+    vel     : np.array
+        1D (cell), or 2D (snapshot x cell) [cm/s]
+    tau_sob : np.array
+        shaped as vel
+    """
+    vel = np.asarray(vel, dtype=float)
+    vel_2d = np.atleast_2d(vel)
+    ind = np.atleast_1d(kernels.tau_one_index(np.atleast_2d(tau_sob)))
+
+    v = np.where(ind > 0, vel_2d[np.arange(len(ind)), ind] / 1e5, 0.0)
+
+    return float(v[0]) if vel.ndim == 1 else v
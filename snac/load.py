@@ -6,16 +6,22 @@ Info:
 """
 
 import os
+import hashlib
+import itertools
 import numpy as np
 import pandas as pd
 import pickle
 import configparser
 import ast
-import subprocess
+import shutil
 import sys
 import time
+from collections.abc import MutableMapping
+from concurrent.futures import Future, ThreadPoolExecutor
 
 # snac
+from . import cache
+from . import kernels
 from . import paths
 # from . import quantities
 # from . import analysis
@@ -52,11 +58,22 @@ def load_config(name=None, verbose=True):
     return config
 
 
+class StaleCacheError(Exception):
+    """Cache built from raw files that have since changed
+    """
+
+# cache loading errors that mean rebuilding (e.g., a truncated file
+# left by an interrupted write, before writes were atomic)
+CACHE_MISS = (FileNotFoundError, EOFError, pickle.UnpicklingError, StaleCacheError)
+
 # =======================================================================
 #                      Dat files
 # =======================================================================
 def get_dat(model, cols, reload=False, save=True, verbose=True):
-    """Get set of integrated quantities, as contained in .dat files
+    """Get set of integrated quantities, as contained in .dat files.
+    The cache is rebuilt if the .dat files have changed since it was saved
+    (see dat_fingerprint), and the fingerprint of the data is returned in
+    dat.attrs['fingerprint'] (None if the .dat files are missing)
     Returns : pandas.DataFrame
     parameters
     ----------
@@ -68,24 +85,37 @@ def get_dat(model, cols, reload=False, save=True, verbose=True):
     verbose : bool
     """
     dat_table = None
+    fingerprint = dat_fingerprint(model, cols=cols, missing_ok=True)
 
     # attempt to load temp file
     if not reload:
         try:
-            dat_table = load_dat_cache(model=model, verbose=verbose)
-        except FileNotFoundError:
-            tools.printv('dat cache not found, manually loading', verbose)
+            dat_table = load_dat_cache(model=model, fingerprint=fingerprint,
+                                       verbose=verbose)
+        except CACHE_MISS:
+            tools.printv('dat cache not found or stale, manually loading', verbose)
 
     # fall back on loading raw .dat
     if dat_table is None:
-        dat_table = extract_dat(model, cols=cols, verbose=verbose)
-        if save:
-            save_dat_cache(dat_table, model=model, 
-                           verbose=verbose)
+        # one process builds the cache, others wait for it
+        with cache.model_lock(model, enabled=save):
+            if not reload:
+                try:
+                    dat_table = load_dat_cache(model=model, fingerprint=fingerprint,
+                                               verbose=verbose)
+                except CACHE_MISS:
+                    pass
+
+            if dat_table is None:
+                dat_table = extract_dat(model, cols=cols, verbose=verbose)
+                dat_table.attrs['fingerprint'] = fingerprint
+                if save:
+                    save_dat_cache(dat_table, model=model, 
+                                   verbose=verbose)
 
     return dat_table
 
-def extract_dat(model, cols, verbose=True):
+def extract_dat(model, cols, verbose=True, files=None):
     """Extract data from .dat file
     Returns : dataFrame of 1D quantities
     parameters
@@ -95,6 +125,9 @@ def extract_dat(model, cols, verbose=True):
         list with column names
     run: str
     verbose : bool
+    files : dict
+        file objects or buffers, keyed by column, to read instead of
+        the .dat files (e.g., already read by prefetch.read_files)
     """
  
     df = pd.DataFrame()
@@ -103,6 +136,8 @@ def extract_dat(model, cols, verbose=True):
     for key in cols:
         filepath = paths.dat_filepath(model=model, quantity=key)
         tools.printv(f'Extracting dat: {filepath}', verbose=verbose)
+        if files is not None:
+            filepath = files[key]
 
         if (key == 'conservation'):
             df_temp1 = pd.read_fwf(filepath, header=None, \
@@ -127,29 +162,67 @@ def save_dat_cache(dat, model, verbose=True):
     parameters
     ----------
     dat : pd.DataFrame
-        data table as returned by extract_dat()
+        data table as returned by extract_dat(), with the fingerprint of
+        the .dat files in dat.attrs['fingerprint'] (see get_dat)
     model : str
-    run : str
     verbose : bool
     """
     ensure_temp_dir_exists(model, verbose=False)
     filepath = paths.dat_temp_filepath(model=model)
 
     tools.printv(f'Saving dat cache: {filepath}', verbose)
-    dat.to_pickle(filepath)
+    with cache.atomic_write(filepath) as f:
+        dat.to_pickle(f)
+    cache.touch(model)
+    cache.evict(keep=[model], verbose=verbose)
 
 
-def load_dat_cache(model, verbose=True):
+def load_dat_cache(model, fingerprint=None, verbose=True):
     """Load pre-extracted .dat quantities (see: save_dat_cache)
+    Raises StaleCacheError if saved from .dat files with another fingerprint
     parameters
     ----------
     model : str
-    run : str
+    fingerprint : str
+        see dat_fingerprint(). If None, not checked
     verbose : bool
     """
     filepath = paths.dat_temp_filepath(model=model)
     tools.printv(f'Loading dat cache: {filepath}', verbose)
-    return pd.read_pickle(filepath)    
+    dat = pd.read_pickle(filepath)
+    if fingerprint is not None and dat.attrs.get('fingerprint') != fingerprint:
+        raise StaleCacheError(f'.dat files changed since caching: {filepath}')
+    cache.touch(model)
+    return dat
+
+def dat_fingerprint(model, cols, missing_ok=False):
+    """Fingerprint of the raw .dat files (and info.dat), for validating
+    caches of derived quantities. Built from file names, sizes and
+    modification times, so no data is read.
+    Returns : str
+    parameters
+    ----------
+    model : str
+    cols : []
+        list with column names
+    missing_ok : bool
+        return None if a file is missing (e.g., only caches are kept),
+        instead of raising FileNotFoundError
+    """
+    filepaths = [paths.dat_filepath(model=model, quantity=key) for key in cols]
+    filepaths += [os.path.join(paths.output_path(model), 'info.dat')]
+
+    sha = hashlib.sha1()
+    for filepath in filepaths:
+        try:
+            stat = os.stat(filepath)
+        except FileNotFoundError:
+            if missing_ok:
+                return None
+            raise
+        sha.update(f'{os.path.basename(filepath)}:{stat.st_size}:{stat.st_mtime_ns};'.encode())
+
+    return sha.hexdigest()
 
 # ===============================================================
 #                      Profiles
@@ -171,19 +244,173 @@ def get_profiles(model, fields, reload=False, save=True, verbose=True):
     if not reload:
         try:
             dat_table = load_profile_cache(model=model, verbose=verbose)
-        except FileNotFoundError:
+        except CACHE_MISS:
             tools.printv('profile cache not found, manually loading', verbose)
 
     # fall back on loading raw .xg
     if dat_table is None:
-        dat_table = extract_profile(model, fields=fields, verbose=verbose)
-        if save:
-            save_profile_cache(dat_table, model=model, 
-                           verbose=verbose)
+        with cache.model_lock(model, enabled=save):
+            if not reload:
+                try:
+                    dat_table = load_profile_cache(model=model, verbose=verbose)
+                except CACHE_MISS:
+                    pass
+
+            if dat_table is None:
+                dat_table = extract_profile(model, fields=fields, verbose=verbose)
+                if save:
+                    save_profile_cache(dat_table, model=model, 
+                                       verbose=verbose)
 
     return dat_table
 
-def extract_profile(model, fields, verbose=True):
+class ProfileFutures(MutableMapping):
+    """Profiles (as returned by get_profiles) loading in background threads.
+    Behaves as the profile dict: accessing a field waits only for that field.
+    From the profile cache if present (one load, shared by all fields),
+    otherwise each field's .xg file is extracted in its own thread, under
+    the model lock (see get_profiles).
+    """
+    def __init__(self, model, fields, reload=False, save=True, verbose=True):
+        """
+        parameters
+        ----------
+        model   : str
+        fields  : []
+        reload  : bool
+        save    : bool
+        verbose : bool
+        """
+        self.model = model
+        self._futures = {key: Future() for key in fields}
+
+        use_cache = not reload and os.path.exists(paths.profile_temp_filepath(model))
+        executor = ThreadPoolExecutor(max_workers=1)
+
+        if use_cache:
+            executor.submit(self._from_cache, save=save, verbose=verbose)
+        else:
+            executor.submit(self._build, reload=reload, save=save, verbose=verbose)
+
+        executor.shutdown(wait=False)
+
+    def _from_cache(self, save=True, verbose=True):
+        """Resolve all fields from the profile cache (one load). If it can't
+        be read, rebuild from the .xg files, as get_profiles() does; fields
+        missing from it are extracted.
+        """
+        try:
+            profiles = load_profile_cache(model=self.model, verbose=verbose)
+        except CACHE_MISS:
+            tools.printv('profile cache unreadable, manually loading', verbose)
+            self._build(save=save, verbose=verbose)
+            return
+        except Exception as error:
+            self._fail(error)
+            return
+
+        missing = [key for key in self._futures if key not in profiles]
+        if missing:
+            try:
+                profiles.update(extract_profile(self.model, fields=missing,
+                                                verbose=verbose))
+            except Exception as error:
+                self._fail(error)
+
+        for key, future in self._futures.items():
+            if not future.done():
+                future.set_result(profiles[key])
+
+    def _build(self, reload=False, save=True, verbose=True):
+        """Extract each field's .xg file in its own thread, and save the
+        profile cache. Under the model lock, with the cache checked again
+        once the lock is taken, so one process builds and the others reuse.
+        """
+        try:
+            with cache.model_lock(self.model, enabled=save):
+                if not reload:
+                    try:
+                        profiles = load_profile_cache(model=self.model, verbose=verbose)
+                    except CACHE_MISS:
+                        profiles = None
+
+                    if profiles is not None:
+                        for key, future in self._futures.items():
+                            future.set_result(profiles[key])
+                        return
+
+                # fields are resolved as soon as each one is extracted
+                with ThreadPoolExecutor(max_workers=len(self._futures)) as pool:
+                    for key, future in self._futures.items():
+                        pool.submit(extract_profile, self.model, fields=[key],
+                                    verbose=verbose).add_done_callback(
+                            lambda done, key=key, future=future:
+                                _copy_future(done, future, key))
+
+                if save and not any(f.exception() for f in self._futures.values()):
+                    save_profile_cache(self.result(), model=self.model, verbose=verbose)
+        except Exception as error:
+            self._fail(error)
+
+    def _fail(self, error):
+        """Set error on the fields not yet loaded
+        """
+        for future in self._futures.values():
+            if not future.done():
+                future.set_exception(error)
+
+    def __getitem__(self, key):
+        return self._futures[key].result()
+
+    def __setitem__(self, key, value):
+        self._futures[key] = _Done(value)
+
+    def __delitem__(self, key):
+        del self._futures[key]
+
+    def __iter__(self):
+        return iter(self._futures)
+
+    def __len__(self):
+        return len(self._futures)
+
+    def done(self, key=None):
+        """Whether a field (or all fields) has finished loading
+        parameters
+        ----------
+        key : str
+        """
+        if key is None:
+            return all(f.done() for f in self._futures.values())
+        return self._futures[key].done()
+
+    def result(self):
+        """Wait for all fields. Returns : dict
+        """
+        return {key: self[key] for key in self._futures}
+
+def _copy_future(done, future, key):
+    """Set future to field key of the result of done (or its exception)
+    """
+    error = done.exception()
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(done.result()[key])
+
+class _Done:
+    """Stand-in for a completed future
+    """
+    def __init__(self, value):
+        self._value = value
+
+    def result(self):
+        return self._value
+
+    def done(self):
+        return True
+
+def extract_profile(model, fields, verbose=True, files=None):
     """Extract data from .xg file
     Returns : dict of 1D quantities
     parameters
@@ -193,6 +420,9 @@ def extract_profile(model, fields, verbose=True):
         dictionary with column names
     run: str
     verbose : bool
+    files : dict
+        file objects or buffers, keyed by field, to read instead of
+        the .xg files (e.g., already read by prefetch.read_files)
     """
  
     df = {}
@@ -200,6 +430,8 @@ def extract_profile(model, fields, verbose=True):
     for key in fields:
         filepath = paths.profile_filepath(model=model, quantity=key)
         tools.printv(f'Extracting profile: {filepath}', verbose=verbose)
+        if files is not None:
+            filepath = files[key]
 
         df[key] = xg_to_dict(filepath)
 
@@ -220,7 +452,10 @@ def save_profile_cache(dat, model, verbose=True):
 
     tools.printv(f'Saving profile cache: {filepath}', verbose)
 
-    pickle.dump( dat, open( filepath, "wb" ) )
+    with cache.atomic_write(filepath) as f:
+        pickle.dump(dat, f)
+    cache.touch(model)
+    cache.evict(keep=[model], verbose=verbose)
 
 def load_profile_cache(model, verbose=True):
     """Load pre-extracted .xg quantities (see: save_dat_cache)
@@ -232,34 +467,370 @@ def load_profile_cache(model, verbose=True):
     """
     filepath = paths.profile_temp_filepath(model=model)
     tools.printv(f'Loading profile cache: {filepath}', verbose)
-    return pickle.load( open(filepath, 'rb') )
+    with open(filepath, 'rb') as f:
+        profiles = pickle.load(f)
+    cache.touch(model)
+    return profiles
+
+def profiles_to_arrays(profiles, fields):
+    """Stack profiles (as returned by extract_profile) into dense (time x cell) arrays
+    Returns : dict
+        'time' : 1D array of snapshot times
+        'mass' : 1D array of cell mass coordinates. SNEC grids are Lagrangian,
+                 so these are taken from the first snapshot.
+        field  : 2D (time x cell) array for each field
+    parameters
+    ----------
+    profiles : dict
+    fields : []
+    """
+    times = [*profiles[fields[0]]]
+
+    arrays = {'time': np.array(times),
+              'mass': profiles[fields[0]][times[0]][:, 0]}
+
+    for key in fields:
+        arrays[key] = np.stack([profiles[key][t][:, 1] for t in times])
+
+    return arrays
+
+def get_profile_arrays(model, fields, reload=False, save=True, mmap=True,
+                       tolerance=None, verbose=True):
+    """Get dense (time x cell) profile arrays, see profiles_to_arrays()
+    Cached as one .npy file per field, which are memory-mapped on loading,
+    so only the parts of the arrays actually used are read from disk.
+    If the cache was built with a tolerance, fields are InterpolatedArrays:
+    they support arithmetic and ufuncs like ndarrays (reading the whole
+    field), but index them first (or np.asarray) to read only part.
+    Returns : dict
+    parameters
+    ----------
+    model   : str
+    fields  : []
+    reload  : bool
+    save    : bool
+    mmap    : bool
+        memory-map cached arrays, rather than reading them into memory
+    tolerance : float
+        when building the cache, drop snapshots that are reconstructed
+        within this relative tolerance, see downsample_snapshots().
+        Defaults to paths.cache_tolerance(). 0 keeps every snapshot.
+    verbose : bool
+    """
+    arrays = None
+
+    if not reload:
+        try:
+            arrays = load_array_cache(model=model, fields=fields, mmap=mmap,
+                                      verbose=verbose)
+        except FileNotFoundError:
+            tools.printv('array cache not found, manually loading', verbose)
+
+    if arrays is None:
+        with cache.model_lock(model, enabled=save):
+            if not reload:
+                try:
+                    arrays = load_array_cache(model=model, fields=fields,
+                                              mmap=mmap, verbose=verbose)
+                except FileNotFoundError:
+                    pass
+
+            if arrays is None:
+                profiles = get_profiles(model, fields=fields, reload=reload,
+                                        save=save, verbose=verbose)
+                arrays = profiles_to_arrays(profiles, fields=fields)
+                if save:
+                    if tolerance is None:
+                        tolerance = paths.cache_tolerance()
+                    kept = None
+                    if tolerance:
+                        kept = downsample_snapshots(arrays, fields=fields,
+                                                    rtol=tolerance)
+                        tools.printv(f'Keeping {len(kept)} of {len(arrays["time"])} '
+                                     f'snapshots (rtol={tolerance:g})', verbose)
+                    save_array_cache(arrays, model=model, kept=kept,
+                                     verbose=verbose)
+
+    return arrays
+
+def save_array_cache(arrays, model, kept=None, verbose=True):
+    """Save dense profile arrays, one .npy file per field
+    parameters
+    ----------
+    arrays : dict
+        arrays as returned by profiles_to_arrays()
+    model : str
+    kept : 1D int array
+        only save these snapshots of each field (see downsample_snapshots),
+        and save kept, for reconstructing the others on loading
+    verbose : bool
+    """
+    ensure_temp_dir_exists(model, verbose=False)
+    kept_filepath = paths.array_temp_filepath(model=model, field='kept')
+
+    if kept is None:
+        if os.path.exists(kept_filepath):
+            os.remove(kept_filepath)
+    else:
+        with cache.atomic_write(kept_filepath) as f:
+            np.save(f, kept)
+
+    # 'time' last, so a complete set of files exists whenever it does
+    keys = sorted(arrays, key=lambda key: key == 'time')
+
+    for key in keys:
+        array = arrays[key]
+        if kept is not None and key not in ('time', 'mass'):
+            array = array[kept]
+
+        filepath = paths.array_temp_filepath(model=model, field=key)
+        tools.printv(f'Saving array cache: {filepath}', verbose)
+        with cache.atomic_write(filepath) as f:
+            np.save(f, array)
+
+    cache.touch(model)
+    cache.evict(keep=[model], verbose=verbose)
+
+def load_array_cache(model, fields, mmap=True, verbose=True):
+    """Load dense profile arrays (see: save_array_cache)
+    parameters
+    ----------
+    model : str
+    fields : []
+    mmap : bool
+    verbose : bool
+    """
+    mmap_mode = 'r' if mmap else None
+    arrays = {}
+
+    for key in ['time', 'mass'] + list(fields):
+        filepath = paths.array_temp_filepath(model=model, field=key)
+        tools.printv(f'Loading array cache: {filepath}', verbose)
+        arrays[key] = np.load(filepath, mmap_mode=mmap_mode)
+
+    kept_filepath = paths.array_temp_filepath(model=model, field='kept')
+    if os.path.exists(kept_filepath):
+        kept = np.load(kept_filepath)
+        for key in fields:
+            arrays[key] = InterpolatedArray(arrays[key], time=arrays['time'],
+                                            kept=kept)
+    cache.touch(model)
+    return arrays
+
+def downsample_snapshots(arrays, fields, rtol):
+    """Snapshots to keep, such that every field at every dropped snapshot
+    is reconstructed within a relative tolerance by linear interpolation in
+    time between kept snapshots. Kept intervals are grown greedily (by doubling,
+    then bisection), so long quiet phases are reduced to a few snapshots.
+    The first and last snapshots are always kept.
+    Returns : 1D int array of kept snapshot indices
+    parameters
+    ----------
+    arrays : dict
+        arrays as returned by profiles_to_arrays()
+    fields : []
+    rtol : float
+        relative tolerance, |interpolated - true| <= rtol * |true|
+    """
+    time = np.asarray(arrays['time'], dtype=float)
+    n = len(time)
+    kept = [0]
+    start = 0
+
+    def within(end):
+        """Whether snapshots between start and end are within rtol"""
+        w = ((time[start + 1:end] - time[start])
+             / (time[end] - time[start]))[:, np.newaxis]
+        for key in fields:
+            a, b = arrays[key][start], arrays[key][end]
+            true = arrays[key][start + 1:end]
+            interp = a * (1.0 - w) + b * w
+            if not np.all((np.abs(interp - true) <= rtol * np.abs(true))
+                          | (interp == true)):
+                return False
+        return True
+
+    while start < n - 1:
+        good = start + 1  # neighbours need no interpolation
+        step = 2
+        while good < n - 1:
+            end = min(start + step, n - 1)
+            if within(end):
+                good = end
+                step *= 2
+            else:
+                while end - good > 1:
+                    mid = (good + end) // 2
+                    if within(mid):
+                        good = mid
+                    else:
+                        end = mid
+                break
+        kept.append(good)
+        start = good
+
+    return np.array(kept)
+
+class InterpolatedArray(tools.LazyArrayOperators):
+    """
+    A (time x cell) profile array stored at a subset of snapshots (see
+    downsample_snapshots), with the others reconstructed by linear
+    interpolation in time on indexing. Supports numpy indexing by integers,
+    slices and index arrays, reading only the stored snapshots needed.
+    Arithmetic and ufuncs reconstruct the whole array first.
+    """
+    def __init__(self, data, time, kept):
+        """
+        parameters
+        ----------
+        data : 2D array
+            (kept x cell) stored snapshots, e.g. memory-mapped
+        time : 1D array
+            times of all snapshots
+        kept : 1D int array
+            indices of the stored snapshots
+        """
+        self.data = data
+        self.kept = kept
+        self.shape = (len(time), data.shape[1])
+        self.dtype = data.dtype
+        self.ndim = 2
+
+        # stored neighbours and interpolation weight of every snapshot
+        time = np.asarray(time, dtype=float)
+        n_kept = len(kept)
+        self._left = np.clip(np.searchsorted(kept, np.arange(len(time)),
+                                             side='right') - 1, 0, max(n_kept - 2, 0))
+        self._right = np.minimum(self._left + 1, n_kept - 1)
+
+        t_left, t_right = time[kept[self._left]], time[kept[self._right]]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            weight = (time - t_left) / (t_right - t_left)
+        self._weight = np.where(self._right > self._left, weight, 0.0)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __array__(self, dtype=None, copy=None):
+        return np.asarray(self[:], dtype=dtype)
+
+    def __getitem__(self, key):
+        key = tools.expand_index(key, ndim=self.ndim)
+
+        rows = np.arange(self.shape[0])[key[0]]
+        flat = np.ravel(rows)
+        w = self._weight[flat][:, np.newaxis]
+        a = np.asarray(self.data[self._left[flat]])
+        b = np.asarray(self.data[self._right[flat]])
+
+        with np.errstate(invalid='ignore'):
+            values = np.where(w == 0, a, np.where(w == 1, b, a * (1.0 - w) + b * w))
+        values = values.astype(self.dtype, copy=False)
+
+        # index the reconstructed rows as the requested rows
+        if np.ndim(rows) == 0:
+            row_key = 0
+        elif isinstance(key[0], slice):
+            row_key = slice(None)
+        else:
+            row_key = np.arange(flat.size).reshape(np.shape(rows))
+
+        return values[(row_key, ) + key[1:]]
 
 def xg_to_dict(fn):
     """
     Function to parse SNEC .xg files into dictionaries
-    Slow.
+    See kernels.parse_xg()
+
+    Parameters:
+    -----------
+    fn : str or file object
+    """
+    if isinstance(fn, str):
+        with open(fn, 'rb') as rf:
+            return xg_to_dict(rf)
+
+    buf = fn.read()
+    if isinstance(buf, str):
+        buf = buf.encode()
+
+    return kernels.parse_xg(buf)
+
+def iter_xg(fn, block_size=16777216):
+    """
+    Stream a SNEC .xg file one snapshot at a time, reading block_size bytes
+    at a time, so memory is bounded by the block size rather than the file.
+    Yields : time, (cell x 2) array
+    See kernels.parse_xg()
 
     Parameters:
     -----------
     fn : str
+    block_size : int
     """
-    dd = {}
-
-    with open(fn, 'r') as rf:
-        for line in rf:
-            cols = line.split()
-            # Beginning of time data - make key for this time                                                         
-            if 'Time' in line:
-                time = float(cols[-1])
-                dd[time] = []
-            # In time data -- build x,y arrays                                                                        
-            elif len(cols)==2:
-                dd[time].append(np.fromstring(line, sep=' '))
-            # End of time data (blank line) -- make list into array                                                   
-            else:
-                dd[time] = np.array(dd[time])
+    buf = b''
+
+    with open(fn, 'rb') as f:
+        while True:
+            data = f.read(block_size)
+            buf += data
+
+            # parse up to the start of the last header line, which may be incomplete
+            cut = len(buf)
+            if data:
+                header = buf.rfind(b'Time')
+                cut = buf.rfind(b'\n', 0, header) + 1 if header > 0 else 0
+
+            if cut > 0:
+                yield from kernels.parse_xg(buf[:cut]).items()
+                buf = buf[cut:]
+
+            if not data:
+                break
+
+def iter_profile_chunks(model, fields, chunk=16, block_size=16777216,
+                        verbose=True):
+    """
+    Stream profiles from the .xg files in chunks of snapshots, with all fields
+    aligned, without loading whole files. See profiles_to_arrays().
+    Yields : dict
+        'time' : 1D array of (up to chunk) snapshot times
+        'mass' : 1D array of cell mass coordinates
+        field  : 2D (time x cell) array for each field
+
+    Parameters:
+    -----------
+    model : str
+    fields : []
+    chunk : int
+        number of snapshots per chunk
+    block_size : int
+        bytes per read, see iter_xg()
+    verbose : bool
+    """
+    streams = []
+    for key in fields:
+        filepath = paths.profile_filepath(model=model, quantity=key)
+        tools.printv(f'Streaming profile: {filepath}', verbose=verbose)
+        streams.append(iter_xg(filepath, block_size=block_size))
+
+    snapshots = zip(*streams)
+
+    while True:
+        rows = list(itertools.islice(snapshots, chunk))
+        if not rows:
+            return
+
+        times = np.array([row[0][0] for row in rows])
+        for i, key in enumerate(fields):
+            if any(row[i][0] != t for row, t in zip(rows, times)):
+                raise ValueError(f'Snapshot times of {key} do not match {fields[0]}')
+
+        arrays = {'time': times, 'mass': rows[0][0][1][:, 0]}
+        for i, key in enumerate(fields):
+            arrays[key] = np.stack([row[i][1][:, 1] for row in rows])
 
-    return dd
+        yield arrays
 
 # =======================================================================
 #                      Scalars
@@ -357,12 +928,12 @@ def try_mkdir(path, skip=False, verbose=True):
             cont = input('Overwrite? (y/[n]): ')
 
             if cont == 'y' or cont == 'Y':
-                subprocess.run(['rm', '-r', path])
-                subprocess.run(['mkdir', path])
+                shutil.rmtree(path)
+                os.makedirs(path)
             elif cont == 'n' or cont == 'N':
                 sys.exit()
     else:
-        subprocess.run(['mkdir', '-p', path], check=True)
+        os.makedirs(path, exist_ok=True)  # may be created concurrently
 
 
 def ensure_temp_dir_exists(model, verbose=True):
@@ -0,0 +1,327 @@
+"""
+Matching observed light curves against an ensemble of models.
+
+A MatchIndex stores the light curve (log10 lum_observed) and photospheric
+velocity (vel_photo) of every model, resampled onto a fixed grid of days
+post breakout, as two (model x day) arrays. A query interpolates all
+models at once onto the observed epochs, for every trial time shift,
+and returns the k models (and shifts) with the smallest chi-square.
+
+The index is saved to a file, and rebuilt incrementally by update():
+only models that are new, or whose .dat files have changed since they
+were indexed (see load.dat_fingerprint), are reloaded.
+
+Example:
+    index = matching.MatchIndex('grid_index.pickle')
+    index.update(models)
+    index.query(days=obs_days, lum=obs_lum, vel_days=vel_days, vel=obs_vel,
+                shifts=np.arange(0, 20, 0.25), k=5)
+"""
+
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import numpy as np
+import pandas as pd
+
+# snac
+from . import cache
+from . import load
+from . import tools
+
+DEFAULT_DAYS = np.arange(0.0, 300.5, 0.5)
+BLOCK_MODELS = 64  # models per block in queries, to keep temporaries in cache
+
+class MatchIndex:
+    """
+    Resampled light curves of an ensemble, for nearest-neighbour matching
+    of observations. See module docstring.
+    """
+    def __init__(self, filepath=None, days=None, config='snec', verbose=True):
+        """
+        parameters
+        ----------
+        filepath : str
+            file to save the index to, and load it from if it exists.
+            If None, the index is kept in memory only.
+        days : 1D array
+            uniform grid of days post breakout to resample models onto.
+            Defaults to the grid of an existing index file, or DEFAULT_DAYS.
+            If it differs from the grid of the index file, the index is rebuilt.
+        config : str
+            config file, for the dat columns to load
+        verbose : bool
+        """
+        self.filepath = filepath
+        self.config = config
+        self.verbose = verbose
+
+        self.models = []
+        self.fingerprints = {}
+        self.lum = np.empty((0, 0))
+        self.vel = np.empty((0, 0))
+        self.days = DEFAULT_DAYS if days is None else np.asarray(days, dtype=float)
+
+        if filepath is not None and os.path.exists(filepath):
+            self.load(filepath)
+            if days is not None and not np.array_equal(days, self.days):
+                tools.printv('Day grid changed, rebuilding index', verbose)
+                self.models = []
+                self.fingerprints = {}
+                self.lum = np.empty((0, 0))
+                self.vel = np.empty((0, 0))
+                self.days = np.asarray(days, dtype=float)
+
+        self.lum = self.lum.reshape(len(self.models), len(self.days))
+        self.vel = self.vel.reshape(len(self.models), len(self.days))
+
+    def __contains__(self, model):
+        return model in self.fingerprints
+
+    def __len__(self):
+        return len(self.models)
+
+    # =======================================================
+    #                   Building
+    # =======================================================
+    def update(self, models, n_workers=1, save=True):
+        """
+        Add models to the index, or reload them if their .dat files have
+        changed. Unchanged models are skipped.
+        Returns : [str] models (re)loaded
+
+        parameters
+        ----------
+        models : [str]
+        n_workers : int
+            worker processes for loading. None for os.cpu_count()
+        save : bool
+            save the index to self.filepath
+        """
+        cols = load.load_config(name=self.config, verbose=False)['dat_quantities']['fields']
+        models = list(tools.ensure_sequence(models))
+        stale = [m for m in models
+                 if self.fingerprints.get(m) != load.dat_fingerprint(m, cols=cols)]
+
+        tools.printv(f'Indexing {len(stale)} of {len(models)} models', self.verbose)
+        func = partial(_model_curves, days=self.days, cols=cols)
+
+        if n_workers == 1:
+            rows = [func(model) for model in stale]
+        else:
+            with ProcessPoolExecutor(max_workers=n_workers) as pool:
+                rows = list(pool.map(func, stale, chunksize=max(1, len(stale) // 64)))
+
+        new = []
+        for model, (fingerprint, lum, vel) in zip(stale, rows):
+            if model in self.fingerprints:
+                i = self.models.index(model)
+                self.lum[i] = lum
+                self.vel[i] = vel
+            else:
+                new.append((lum, vel))
+                self.models.append(model)
+            self.fingerprints[model] = fingerprint
+
+        if new:
+            lum, vel = zip(*new)
+            self.lum = np.vstack([self.lum, lum])
+            self.vel = np.vstack([self.vel, vel])
+
+        if save and stale and self.filepath is not None:
+            self.save()
+
+        return stale
+
+    def remove(self, models, save=True):
+        """
+        Remove models from the index
+
+        parameters
+        ----------
+        models : [str]
+        save : bool
+        """
+        models = set(tools.ensure_sequence(models))
+        keep = [i for i, m in enumerate(self.models) if m not in models]
+
+        self.models = [self.models[i] for i in keep]
+        self.lum = self.lum[keep]
+        self.vel = self.vel[keep]
+        for model in models:
+            self.fingerprints.pop(model, None)
+
+        if save and self.filepath is not None:
+            self.save()
+
+    def save(self, filepath=None):
+        """
+        Save the index (atomically)
+
+        parameters
+        ----------
+        filepath : str
+            defaults to self.filepath
+        """
+        filepath = filepath or self.filepath
+        tools.printv(f'Saving index: {filepath}', self.verbose)
+
+        with cache.atomic_write(filepath) as f:
+            pickle.dump({'days': self.days, 'models': self.models,
+                         'fingerprints': self.fingerprints,
+                         'lum': self.lum, 'vel': self.vel}, f)
+
+    def load(self, filepath):
+        """
+        Load an index saved by save()
+
+        parameters
+        ----------
+        filepath : str
+        """
+        tools.printv(f'Loading index: {filepath}', self.verbose)
+        with open(filepath, 'rb') as f:
+            saved = pickle.load(f)
+
+        self.days = saved['days']
+        self.models = saved['models']
+        self.fingerprints = saved['fingerprints']
+        self.lum = saved['lum']
+        self.vel = saved['vel']
+
+    # =======================================================
+    #                   Matching
+    # =======================================================
+    def query(self, days=None, lum=None, lum_err=0.05, vel_days=None, vel=None,
+              vel_err=None, shifts=(0.0, ), k=10):
+        """
+        Best matching models for an observed light curve and/or velocity curve.
+
+        Observed epochs are days since a reference epoch (e.g. discovery),
+        which is shifts days after shock breakout: model day = day + shift.
+        For every model, the shift with the smallest chi-square is kept.
+        Models not covering every observed epoch (at a given shift) are
+        excluded.
+        Returns : pd.DataFrame of the (up to) k best models, with columns
+            model, shift, chi2, chi2_lum, chi2_vel
+
+        parameters
+        ----------
+        days : 1D array
+            epochs of lum [days]
+        lum : 1D array
+            observed luminosity [erg/s]
+        lum_err : float or 1D array
+            uncertainty of log10(lum) [dex]
+        vel_days : 1D array
+            epochs of vel [days]
+        vel : 1D array
+            observed photospheric velocity [cm/s]
+        vel_err : float or 1D array
+            uncertainty of vel [cm/s]. Defaults to 10% of vel
+        shifts : [float]
+            trial days from breakout to the reference epoch
+        k : int
+            number of models to return
+        """
+        shifts = np.asarray(tools.ensure_sequence(shifts), dtype=float)
+        chi2_lum = np.zeros((len(self.models), len(shifts)))
+        chi2_vel = np.zeros((len(self.models), len(shifts)))
+
+        if lum is not None:
+            chi2_lum = chi2_grid(self.lum, self.days, days, np.log10(lum),
+                                 lum_err, shifts)
+        if vel is not None:
+            vel = np.asarray(vel, dtype=float)
+            vel_err = 0.1 * vel if vel_err is None else vel_err
+            chi2_vel = chi2_grid(self.vel, self.days, vel_days, vel,
+                                 vel_err, shifts)
+
+        chi2 = chi2_lum + chi2_vel
+        best = np.argmin(chi2, axis=1)  # best shift of each model
+        min_chi2 = chi2[np.arange(len(self.models)), best]
+
+        top = np.arange(len(self.models))
+        if k < len(top):
+            top = np.argpartition(min_chi2, k)[:k]
+        top = top[np.argsort(min_chi2[top])]
+        top = top[np.isfinite(min_chi2[top])]
+
+        return pd.DataFrame({'model': [self.models[i] for i in top],
+                             'shift': shifts[best[top]],
+                             'chi2': chi2[top, best[top]],
+                             'chi2_lum': chi2_lum[top, best[top]],
+                             'chi2_vel': chi2_vel[top, best[top]]})
+
+def chi2_grid(curves, grid, days, obs, err, shifts):
+    """
+    Chi-square of every model and shift against one observed curve, with
+    models linearly interpolated onto the observed epochs (day + shift).
+    Inf where a model does not cover an observed epoch.
+    Returns : 2D array (model x shift)
+
+    parameters
+    ----------
+    curves : 2D array
+        (model x grid) model curves, NaN where not covered
+    grid : 1D array
+        days of curves
+    days : 1D array
+        observed epochs
+    obs : 1D array
+        observed values
+    err : float or 1D array
+        uncertainties of obs
+    shifts : 1D array
+        trial offsets added to days
+    """
+    days = np.asarray(days, dtype=float)
+    shifts = np.asarray(shifts, dtype=float)
+    model_days = (shifts[:, np.newaxis] + days).ravel()  # (shift x epoch)
+    obs = np.tile(obs, len(shifts))
+    inv_err = np.tile(1.0 / np.broadcast_to(err, days.shape), len(shifts))
+
+    # interpolation weights are shared by all models
+    i, w = tools.interp_weights(model_days, grid)
+    outside = (model_days < grid[0]) | (model_days > grid[-1])
+    inv_err[outside] = np.nan
+
+    chi2 = np.empty((len(curves), len(shifts)))
+    for start in range(0, len(curves), BLOCK_MODELS):
+        block = curves[start:start + BLOCK_MODELS]
+        res = block[:, i] * (1.0 - w)
+        res += block[:, i + 1] * w
+        res -= obs
+        res *= inv_err
+        res = res.reshape(len(block), len(shifts), len(days))
+        chi2[start:start + BLOCK_MODELS] = np.einsum('msj,msj->ms', res, res)
+
+    return np.where(np.isnan(chi2), np.inf, chi2)
+
+def _model_curves(model, days, cols):
+    """
+    Resample the light curve and velocity of a model onto days post breakout.
+    NaN outside of the model's output.
+    Returns : fingerprint, log10(lum_observed), vel_photo
+
+    parameters
+    ----------
+    model : str
+    days : 1D array
+    cols : []
+        dat columns to load
+    """
+    # rebuilt if the .dat files changed, see load.get_dat
+    dat = load.get_dat(model, cols=cols, verbose=False)
+    fingerprint = dat.attrs['fingerprint']
+    t_sb = load.get_scalars(model, var=['t_sb'])['t_sb']
+    day = (dat['time'].to_numpy() - t_sb) / 86400.
+
+    with np.errstate(divide='ignore'):
+        lum = np.interp(days, day, np.log10(dat['lum_observed'].to_numpy()),
+                        left=np.nan, right=np.nan)
+    vel = np.interp(days, day, dat['vel_photo'].to_numpy(),
+                    left=np.nan, right=np.nan)
+
+    return fingerprint, lum, vel
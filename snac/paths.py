@@ -11,8 +11,15 @@ Functions that return strings for paths and such.
 
 - Expected directory structure:
     $SNEC_MODEL/model/Data
+
+- Caches go in $SNEC_MODEL/model/temp, unless a shared cache root is set
+  with $SNAC_CACHE_DIR (or [cache] root in config/snec.ini), see cache.py
 """
 
+import ast
+import configparser
+import functools
+import hashlib
 import os
 
 def config_filepath(name='snec'):
@@ -71,12 +78,85 @@ def model_path(model):
 
 def temp_path(model):
     """
-    Path to directory for temporary file saving
+    Path to directory for temporary file saving.
+    <model>/temp, or <cache root>/<model cache key> if a cache root is set.
     """
+    root = cache_root()
+    if root is not None:
+        return os.path.join(root, model_cache_key(model))
+
     m_path = model_path(model)
     return os.path.join(m_path, 'temp')
 
 
+@functools.lru_cache(maxsize=None)
+def model_cache_key(model):
+    """
+    Content address of a model's caches under the shared cache root:
+    model name plus a hash of the model path and of the names, sizes and
+    modification times of its output files. Fixed for the session.
+    parameters
+    ----------
+    model : str
+    """
+    o_path = output_path(model)
+    sha = hashlib.sha1(os.path.realpath(o_path).encode())
+
+    for entry in sorted(os.scandir(o_path), key=lambda e: e.name):
+        stat = entry.stat()
+        sha.update(f'{entry.name}:{stat.st_size}:{stat.st_mtime_ns};'.encode())
+
+    name = model.strip(os.sep).replace(os.sep, '_')
+    return f'{name}-{sha.hexdigest()[:16]}'
+
+
+def cache_root():
+    """
+    Root of the shared cache directory, or None for per-model temp directories.
+    Set by $SNAC_CACHE_DIR, or 'root' in the [cache] section of config/snec.ini
+    """
+    root = os.environ.get('SNAC_CACHE_DIR', _cache_config().get('root'))
+    return None if root in (None, '') else os.path.expanduser(root)
+
+
+def cache_max_bytes():
+    """
+    Size budget of the shared cache directory in bytes, or None for unlimited.
+    Set by $SNAC_CACHE_SIZE, or 'max_bytes' in the [cache] section of config/snec.ini
+    """
+    max_bytes = os.environ.get('SNAC_CACHE_SIZE', _cache_config().get('max_bytes'))
+    return None if max_bytes in (None, '') else int(float(max_bytes))
+
+
+def cache_tolerance():
+    """
+    Relative tolerance for dropping snapshots from the array cache, or None
+    to keep every snapshot (see load.downsample_snapshots).
+    Set by $SNAC_CACHE_TOLERANCE, or 'tolerance' in the [cache] section of config/snec.ini
+    """
+    tolerance = os.environ.get('SNAC_CACHE_TOLERANCE', _cache_config().get('tolerance'))
+    return None if tolerance in (None, '') else float(tolerance)
+
+
+@functools.lru_cache()
+def _cache_config():
+    """
+    [cache] section of config/snec.ini (empty if missing)
+    """
+    try:
+        filepath = config_filepath()
+    except EnvironmentError:
+        return {}
+
+    ini = configparser.ConfigParser()
+    ini.read(filepath)
+    if not ini.has_section('cache'):
+        return {}
+
+    return {option: ast.literal_eval(ini.get('cache', option))
+            for option in ini.options('cache')}
+
+
 def output_path(model, output_dir='Data'):
     """
     Return path to model output directory
@@ -163,4 +243,59 @@ def profile_temp_filepath(model):
     """
     path = temp_path(model)
     filename = profile_temp_filename(model)
-    return os.path.join(path, filename) 
\ No newline at end of file
+    return os.path.join(path, filename)
+
+
+def array_temp_filename(model, field):
+    """
+    Return filename for cached dense (time x cell) profile array
+    Parameters:
+    -----------
+    model : str
+    field : str
+    """
+    return f'{model}_{field}.npy'
+
+
+def array_temp_filepath(model, field):
+    """
+    Return filepath to cached dense (time x cell) profile array
+    """
+    path = temp_path(model)
+    filename = array_temp_filename(model, field)
+    return os.path.join(path, filename)
+
+
+def derived_temp_path(model):
+    """
+    Path to directory of cached derived quantities, see cache.py
+    """
+    return os.path.join(temp_path(model), 'derived')
+
+
+def derived_temp_filepath(model, key):
+    """
+    Return filepath to one cached derived quantity
+    parameters
+    ----------
+    model : str
+    key : str
+        entry hash, see cache.DerivedCache.key()
+    """
+    return os.path.join(derived_temp_path(model), f'{key}.pickle')
+
+
+def features_temp_filename(model):
+    """
+    Return filename for temporary (cached) light curve features
+    """
+    return f'{model}_features.pickle'
+
+
+def features_temp_filepath(model):
+    """
+    Return filepath to cached light curve features
+    """
+    path = temp_path(model)
+    filename = features_temp_filename(model)
+    return os.path.join(path, filename)
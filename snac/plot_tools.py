@@ -1,6 +1,7 @@
 
 import numpy as np
 import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection
 
 
 """
@@ -24,7 +25,177 @@ def setup_subplots(n_sub, max_cols=2, sub_figsize=(6, 5), **kwargs):
         args passed to plt.subplots()
     """
 
+    n_rows, n_cols = subplot_shape(n_sub, max_cols=max_cols)
+    figsize = (n_cols*sub_figsize[0], n_rows*sub_figsize[1])
+    return plt.subplots(n_rows, n_cols, figsize=figsize, **kwargs)
+
+
+def subplot_shape(n_sub, max_cols=2):
+    """
+    Rows and columns of subplots for given number of subplots
+    returns : n_rows, n_cols
+    parameters
+    ----------
+    n_sub : int
+    max_cols : int
+    """
     n_rows = int(np.ceil(n_sub / max_cols))
     n_cols = {False: 1, True: max_cols}.get(n_sub > 1)
-    figsize = (n_cols*sub_figsize[0], n_rows*sub_figsize[1])
-    return plt.subplots(n_rows, n_cols, figsize=figsize, **kwargs)
\ No newline at end of file
+    return n_rows, n_cols
+
+
+def plot_curves(ax, curves, values=None, cmap='viridis', norm=None,
+                n_points=None, x_scale='linear', y_scale='log',
+                colorbar_label=None, **kwargs):
+    """
+    Draw many curves as one LineCollection, each decimated with lttb() to
+    about the pixel width of the axes (in the scaled coordinates of the axes).
+    Non-finite points, and non-positive points on log axes, are dropped.
+    returns : LineCollection
+    parameters
+    ----------
+    ax : Axes
+    curves : [(x, y)]
+    values : [float]
+        one value per curve, to colour-map them by (e.g. zams)
+    cmap : str or Colormap
+    norm : Normalize
+        defaults to the range of values
+    n_points : int
+        points per decimated curve. Defaults to the axes width in pixels
+    x_scale : {'log', 'linear'}
+    y_scale : {'log', 'linear'}
+    colorbar_label : str
+        if values are given, a colorbar is added with this label
+    **kwargs :
+        args passed to LineCollection, e.g. linewidths, alpha
+    """
+    ax.set_xscale(x_scale)
+    ax.set_yscale(y_scale)
+
+    if n_points is None:
+        n_points = max(int(ax.get_window_extent().width), 3)
+
+    scaled = []
+    for x, y in curves:
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        keep = np.isfinite(x) & np.isfinite(y)
+        if x_scale == 'log':
+            keep &= x > 0
+        if y_scale == 'log':
+            keep &= y > 0
+        x, y = x[keep], y[keep]
+        scaled.append((x, y, np.log10(x) if x_scale == 'log' else x,
+                       np.log10(y) if y_scale == 'log' else y))
+
+    indices = lttb([(xs, ys) for _, _, xs, ys in scaled], n_out=n_points)
+    segments = [np.column_stack([x[i], y[i]]) for (x, y, _, _), i in zip(scaled, indices)]
+
+    lines = LineCollection(segments, **kwargs)
+    if values is not None:
+        lines.set_array(np.asarray(values, dtype=float))
+        lines.set_cmap(cmap)
+        if norm is not None:
+            lines.set_norm(norm)
+
+    ax.add_collection(lines)
+    ax.autoscale_view()
+
+    if values is not None and colorbar_label is not None:
+        ax.figure.colorbar(lines, ax=ax, label=colorbar_label)
+
+    return lines
+
+
+def lttb(curves, n_out, block_size=2**24):
+    """
+    Decimate curves with Largest-Triangle-Three-Buckets (Steinarsson 2013):
+    points are split into n_out buckets, and from each bucket the point
+    forming the largest triangle with the previously kept point and the mean
+    of the next bucket is kept. This preserves peaks, drops and the overall
+    shape of a curve far better than taking every n-th point.
+    Vectorized over curves (in blocks of similar length), with one step per bucket.
+    returns : [1D int array] indices of kept points of each curve
+    parameters
+    ----------
+    curves : [(x, y)]
+        x must be sorted. Curves of n_out points or fewer are kept whole.
+    n_out : int
+        points per decimated curve, at least 3 (first and last are always kept)
+    block_size : int
+        maximum number of padded points per block of curves
+    """
+    n_out = max(int(n_out), 3)
+    lengths = np.array([len(x) for x, _ in curves], dtype=int)
+    indices = [np.arange(n) for n in lengths]
+
+    # longest first, so blocks hold curves of similar length
+    long = np.flatnonzero(lengths > n_out)
+    long = long[np.argsort(-lengths[long], kind='stable')]
+
+    start = 0
+    while start < len(long):
+        n_block = max(1, block_size // (2 * lengths[long[start]]))
+        block = long[start:start + n_block]
+        kept = _lttb_block([curves[i] for i in block], n=lengths[block], n_out=n_out)
+        for row, i in enumerate(block):
+            indices[i] = kept[row]
+        start += n_block
+
+    return indices
+
+
+def _lttb_block(curves, n, n_out):
+    """
+    lttb() of a block of curves longer than n_out
+    returns : 2D int array (curve x n_out) of kept indices
+    parameters
+    ----------
+    curves : [(x, y)]
+    n : 1D int array
+        lengths of curves
+    n_out : int
+    """
+    m = len(curves)
+    rows = np.arange(m)
+    x = np.zeros((m, n.max()))
+    y = np.zeros((m, n.max()))
+    for row, (xi, yi) in enumerate(curves):
+        x[row, :n[row]] = xi
+        y[row, :n[row]] = yi
+
+    # bucket edges over the inner points, 1 to n-2. The last "bucket" is the last point
+    edges = 1 + (np.arange(n_out - 1) * (n[:, np.newaxis] - 2)) // (n_out - 2)
+    edges = np.column_stack([edges, n])
+
+    # mean of the next bucket, for every bucket. Bucket axis first, so each
+    # step below reads contiguous memory
+    x_sum = np.column_stack([np.zeros(m), np.cumsum(x, axis=1)])
+    y_sum = np.column_stack([np.zeros(m), np.cumsum(y, axis=1)])
+    starts, ends, next_ends = edges[:, :-2].T, edges[:, 1:-1].T, edges[:, 2:].T
+    count = next_ends - ends
+    xc = ((x_sum[rows, next_ends] - x_sum[rows, ends]) / count)[..., np.newaxis]
+    yc = ((y_sum[rows, next_ends] - y_sum[rows, ends]) / count)[..., np.newaxis]
+
+    # candidate points of every bucket, padded to the largest bucket
+    candidates = starts[..., np.newaxis] + np.arange(np.max(ends - starts))
+    valid = candidates < ends[..., np.newaxis]
+    candidates = np.where(valid, candidates, starts[..., np.newaxis])
+    xj = x[rows[:, np.newaxis], candidates]
+    yj = y[rows[:, np.newaxis], candidates]
+
+    kept = np.zeros((n_out, m), dtype=int)
+    kept[-1] = n - 1
+    xa, ya = x[:, :1], y[:, :1]
+
+    for b in range(n_out - 2):
+        area = np.abs((xa - xc[b]) * (yj[b] - ya) - (xa - xj[b]) * (yc[b] - ya))
+        area[~valid[b]] = -1.0
+
+        k = np.argmax(area, axis=1)
+        kept[b + 1] = candidates[b, rows, k]
+        xa = xj[b, rows, k][:, np.newaxis]
+        ya = yj[b, rows, k][:, np.newaxis]
+
+    return kept.T
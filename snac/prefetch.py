@@ -0,0 +1,302 @@
+"""
+Concurrent, prefetching I/O for parallel/network filesystems (e.g. Lustre).
+
+Parsing .dat/.xg files line by line issues many small sequential reads,
+each of which stalls on filesystem latency. Here whole files are read in
+large blocks, many at once from a thread pool, and parsed from memory.
+Prefetcher iterates over models while the next models are read in the
+background.
+
+Read sizes and concurrency default to the [io] section of the config.
+DelayedOpener is a filesystem stand-in with artificial latency, so
+benchmarks (see tools/bench_prefetch.py) are reproducible locally.
+
+Example:
+    for model, dat, profiles in prefetch.Prefetcher(models):
+        ...
+"""
+
+import io
+import os
+import pickle
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+
+# snac
+from . import cache
+from . import load
+from . import paths
+from . import tools
+
+def read_file(filepath, block_size=16777216, opener=open):
+    """
+    Read a whole file with reads of up to block_size bytes.
+    Returns : bytes
+
+    parameters
+    ----------
+    filepath : str
+    block_size : int
+    opener : callable
+        open(filepath, mode, buffering) replacement, e.g. DelayedOpener
+    """
+    chunks = []
+
+    with opener(filepath, 'rb', buffering=0) as f:
+        while True:
+            chunk = f.read(block_size)
+            if not chunk:
+                break
+            chunks.append(chunk)
+
+    return b''.join(chunks)
+
+def read_files(filepaths, block_size=16777216, n_threads=8, opener=open,
+               pool=None):
+    """
+    Read many files concurrently.
+    Returns : dict of bytes, keyed by filepath
+
+    parameters
+    ----------
+    filepaths : [str]
+    block_size : int
+    n_threads : int
+        ignored if pool is given
+    opener : callable
+    pool : ThreadPoolExecutor
+        existing pool to submit reads to
+    """
+    if pool is None:
+        with ThreadPoolExecutor(max_workers=n_threads) as pool:
+            return read_files(filepaths, block_size=block_size, opener=opener,
+                              pool=pool)
+
+    futures = {fp: pool.submit(read_file, fp, block_size=block_size, opener=opener)
+               for fp in filepaths}
+
+    return {fp: future.result() for fp, future in futures.items()}
+
+def load_model(model, cols, fields=None, block_size=16777216, n_threads=8,
+               opener=open, pool=None, reload=False, save=True, verbose=False):
+    """
+    Load dat and profiles of one model, reading all files concurrently.
+    Caches are read if present (see load.get_dat, load.get_profiles),
+    otherwise the raw .dat/.xg files, from which the caches are saved.
+    Returns : dat, profiles
+
+    parameters
+    ----------
+    model : str
+    cols : []
+        dat columns
+    fields : []
+        profile fields. If None, profiles are not loaded.
+    block_size : int
+    n_threads : int
+    opener : callable
+    pool : ThreadPoolExecutor
+    reload : bool
+        read raw files, not caches
+    save : bool
+    verbose : bool
+    """
+    dat_cache = paths.dat_temp_filepath(model)
+    profile_cache = paths.profile_temp_filepath(model)
+    dat_files = {key: paths.dat_filepath(model, quantity=key) for key in cols}
+    xg_files = {}
+
+    use_dat_cache = not reload and os.path.exists(dat_cache)
+    filepaths = [dat_cache] if use_dat_cache else list(dat_files.values())
+
+    if fields is not None:
+        use_profile_cache = not reload and os.path.exists(profile_cache)
+        if use_profile_cache:
+            filepaths += [profile_cache]
+        else:
+            xg_files = {key: paths.profile_filepath(model, quantity=key)
+                        for key in fields}
+            filepaths += list(xg_files.values())
+
+    tools.printv(f'Reading {len(filepaths)} files: {model}', verbose)
+    bufs = read_files(filepaths, block_size=block_size, n_threads=n_threads,
+                      opener=opener, pool=pool)
+
+    if use_dat_cache:
+        dat = pd.read_pickle(io.BytesIO(bufs[dat_cache]))
+        fingerprint = load.dat_fingerprint(model, cols=cols, missing_ok=True)
+        if fingerprint is not None and dat.attrs.get('fingerprint') != fingerprint:
+            # .dat files changed since caching
+            dat = load.get_dat(model, cols=cols, reload=True, save=save,
+                               verbose=verbose)
+    else:
+        # one process builds the cache, others wait for it (see load.get_dat)
+        with cache.model_lock(model, enabled=save):
+            dat = None
+            fingerprint = load.dat_fingerprint(model, cols=cols)
+            if not reload:
+                try:
+                    dat = load.load_dat_cache(model, fingerprint=fingerprint,
+                                              verbose=verbose)
+                except load.CACHE_MISS:
+                    pass
+
+            if dat is None:
+                dat = load.extract_dat(model, cols=cols, verbose=verbose,
+                                       files={key: io.BytesIO(bufs[fp])
+                                              for key, fp in dat_files.items()})
+                dat.attrs['fingerprint'] = fingerprint
+                if save:
+                    load.save_dat_cache(dat, model=model, verbose=verbose)
+
+    profiles = None
+    if fields is not None:
+        if use_profile_cache:
+            profiles = pickle.loads(bufs[profile_cache])
+        else:
+            with cache.model_lock(model, enabled=save):
+                if not reload:
+                    try:
+                        profiles = load.load_profile_cache(model, verbose=verbose)
+                    except load.CACHE_MISS:
+                        pass
+
+                if profiles is None:
+                    profiles = load.extract_profile(
+                                    model, fields=fields, verbose=verbose,
+                                    files={key: io.BytesIO(bufs[fp])
+                                           for key, fp in xg_files.items()})
+                    if save:
+                        load.save_profile_cache(profiles, model=model,
+                                                verbose=verbose)
+
+    return dat, profiles
+
+class Prefetcher:
+    """
+    Iterate over models, yielding (model, dat, profiles), while the next
+    models are loaded in the background. See load_model().
+    """
+    def __init__(self, models, config='snec', load_profiles=True,
+                 block_size=None, n_threads=None, depth=None, opener=open,
+                 reload=False, save=True, verbose=False):
+        """
+        parameters
+        ----------
+        models : [str]
+        config : str
+            config file, for dat columns, profile fields and [io] defaults
+        load_profiles : bool
+        block_size : int
+            bytes per read call
+        n_threads : int
+            concurrent file reads
+        depth : int
+            number of models to load ahead of the current one
+        opener : callable
+            open() replacement, e.g. DelayedOpener
+        reload : bool
+        save : bool
+        verbose : bool
+        """
+        config = load.load_config(name=config, verbose=False)
+        io_config = config.get('io', {})
+
+        self.models = list(tools.ensure_sequence(models))
+        self.cols = config['dat_quantities']['fields']
+        self.fields = config['profiles']['fields'] if load_profiles else None
+        self.block_size = block_size or io_config.get('block_size', 16777216)
+        self.n_threads = n_threads or io_config.get('n_threads', 8)
+        self.depth = io_config.get('depth', 2) if depth is None else depth
+        self.opener = opener
+        self.reload = reload
+        self.save = save
+        self.verbose = verbose
+
+    def __len__(self):
+        return len(self.models)
+
+    def __iter__(self):
+        io_pool = ThreadPoolExecutor(max_workers=self.n_threads)
+        model_pool = ThreadPoolExecutor(max_workers=self.depth + 1)
+        pending = deque()
+        models = iter(self.models)
+
+        def submit():
+            model = next(models, None)
+            if model is not None:
+                pending.append((model, model_pool.submit(
+                                    load_model, model, cols=self.cols,
+                                    fields=self.fields, block_size=self.block_size,
+                                    opener=self.opener, pool=io_pool,
+                                    reload=self.reload, save=self.save,
+                                    verbose=self.verbose)))
+
+        try:
+            for _ in range(self.depth + 1):
+                submit()
+
+            while pending:
+                model, future = pending.popleft()
+                dat, profiles = future.result()
+                submit()
+                yield model, dat, profiles
+        finally:
+            model_pool.shutdown(wait=True, cancel_futures=True)
+            io_pool.shutdown(wait=True, cancel_futures=True)
+
+# ===============================================================
+#                      Benchmarking
+# ===============================================================
+class DelayedOpener:
+    """
+    Stand-in for a parallel/network filesystem: an open() replacement that
+    adds a fixed latency to every open and read call, plus an optional
+    transfer time. Use as the opener of read_file/Prefetcher.
+    """
+    def __init__(self, latency=0.005, bandwidth=None):
+        """
+        parameters
+        ----------
+        latency : float
+            seconds per open/read call
+        bandwidth : float
+            bytes per second. None for unlimited.
+        """
+        self.latency = latency
+        self.bandwidth = bandwidth
+
+    def __call__(self, filepath, mode='rb', buffering=-1):
+        time.sleep(self.latency)
+        return _DelayedFile(open(filepath, mode, buffering=buffering), self)
+
+    def delay(self, nbytes):
+        """Sleep for one read call of nbytes
+        """
+        t = self.latency
+        if self.bandwidth:
+            t += nbytes / self.bandwidth
+        time.sleep(t)
+
+class _DelayedFile:
+    """File wrapper delaying every read call, see DelayedOpener
+    """
+    def __init__(self, f, opener):
+        self._f = f
+        self._opener = opener
+
+    def read(self, size=-1):
+        data = self._f.read(size)
+        self._opener.delay(len(data))
+        return data
+
+    def close(self):
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -1,11 +1,9 @@
 import numpy as np
-from astropy import units as u
 from astropy import constants as const
-import os
 
 # snac
-from . import tools
-from . import paths
+from . import kernels
+from . import lines
 
 """
 Module for calculating physical quantities
@@ -13,9 +11,10 @@ Module for calculating physical quantities
 
 msun = const.M_sun.cgs.value
 
-def tau_sob(density, temp, X, t_exp):
+def tau_sob(density, temp, X, t_exp, line='FeII_5169'):
     """
-    Compute Sobolev optical depth profile for FeII 5169. See README for some details.
+    Compute Sobolev optical depth profile for a line (FeII 5169 by default).
+    See README for some details, and lines.py for the line registry.
     
     Parameters:
     -----------
@@ -26,79 +25,10 @@ def tau_sob(density, temp, X, t_exp):
         All are profiles at a specific time, from SNEC output.
     t_exp : float
         time since explosion. Time of profiles + t_sb. Days.
+    line : str
+        registered line, see lines.LINES
     """
-
-    m_e = const.m_e.cgs.value
-    c = const.c.cgs.value
-    q_e = const.e.gauss.value
-    f = 0.023
-    lambda_0 = (5169 * u.Angstrom).to('cm').value
-    t_exp *= 86400
-    A_Fe = 56
-
-    # fractional ionization table
-    fn = os.path.join(paths.data_path(), 'FeII_5169_eta.dat')
-    rho, Temp, eta = np.loadtxt(fn, unpack=True)
-    rho = np.flip(rho)
-    Temp = np.flip(Temp)
-    eta = np.flip(eta)
-
-    # Iron mass fraction is nat tracked - assume it is the solar fraction of iron.
-    # Should be valid in the outer parts of the star, where we will be looking later.
-    X_Fe = 0.0016912 * X
-
-    n_Fe = density * const.N_A.value * X_Fe / A_Fe
-
-    # ==============================
-    #    Compute ionization frac
-    # ==============================
-
-    eta_profile = np.zeros_like(density) # Initialize current eta profile as zeros
-    
-    for i in range( len( density ) ):
-        # Eta table is for a finite range. Make sure our profiles stay within it,
-        if( density[i] < np.min(rho) ):
-            eta_profile[i] = 0.0
-            continue
-        if( density[i] > np.max(rho) ):
-            # density[i] = np.max(rho) 
-            eta_profile[i] = 0.0
-            continue
-        if( temp[i] < np.min(Temp) ):
-            eta_profile[i] = 0.0
-            continue
-        if( temp[i] > np.max(Temp) ):
-            # temp[i] = np.max(Temp)  
-            eta_profile[i] = 0.0
-            continue   
-        if( temp[i] == np.max(Temp) and density[i] == np.max(rho) ):
-            eta_profile[i] = 0 #8.68775e-05
-            continue
-        #ind_r = np.where( rho <= float(density[i]) )
-        # This selects all indices with rho_table = rho_snec
-        # Not necessarily finding "closest" density value
-        diff = np.abs( rho - float(density[i]) )
-        ind_min = diff.argmin()
-        # ind_r = np.where( rho == rho[np.min(np.where( rho <= float(density[i]) ))] )
-        ind_r = np.where( rho == rho[ind_min] )
-        
-        temps = Temp[ ind_r ] 
-        
-        ind_T = np.min(np.where( temps <= float(temp[i]) ) ) + ind_r[0][0]
-        # ind_T = np.where( Temp <= float(temp[i]))
-        # print(density[i], temp[i], eta[ind_T])
-        
-        # eta_index = np.intersect1d( np.where(rho == rho[ind_r]), np.where(Temp == Temp[ind_T]) )#[0]
-        # print(eta_index)
-        eta_profile[i] = eta[ind_T]
-
-    # ==============================
-    #    Compute tau_sob
-    # ==============================
-
-    tau_sob = ( (np.pi * q_e**2)/(m_e * c) ) * n_Fe * f * t_exp * lambda_0 * eta_profile
-
-    return tau_sob
+    return lines.tau_sob(density, temp, X, t_exp, lines=[line])[line]
 
 def iron_velocity(vel, tau_sob):
     """
@@ -117,10 +47,7 @@ def iron_velocity(vel, tau_sob):
 
     n = int(len(vel)/4) # Half the array, to just look in the outer part of the star
     
-    try:    
-        tau_1_ind = np.max( np.where( tau_sob > 1.0 ) )
-    except:
-        tau_1_ind = -1
+    tau_1_ind = kernels.tau_one_index(tau_sob)
 
     if tau_1_ind > 0:
 
@@ -209,3 +136,33 @@ def ejecta_mass(e_tot, mass):
     n = len(mass) - 1
 
     return (mass[n] - mass[indx]) / msun
+
+def shock_index(vel, pressure, min_jump=0.1):
+    """
+    Locate the shock front in (time x cell) profiles, in one vectorized pass:
+    the cell interface with the largest outward drop in log pressure, among
+    interfaces where the flow is compressive (velocity drops outward).
+    Returns the index of the last shocked cell in each snapshot, or -1 where
+    no interface has a log pressure drop above min_jump (e.g., before the
+    bomb, or once the shock has broken out).
+    Returns : np.array
+
+    Parameters:
+    -----------
+    vel      : 2D np.array
+    pressure : 2D np.array
+        pressure, or a proxy for it (e.g., rho * eps)
+    min_jump : float
+        minimum drop in ln(pressure) across the shock
+    """
+    vel = np.atleast_2d(vel)
+    log_p = np.log(np.clip(np.atleast_2d(pressure), 1e-300, None))
+
+    drop = log_p[:, :-1] - log_p[:, 1:]
+    compressive = vel[:, :-1] > vel[:, 1:]
+    score = np.where(compressive, drop, -np.inf)
+
+    ind = np.argmax(score, axis=1)
+    found = score[np.arange(len(ind)), ind] > min_jump
+
+    return np.where(found, ind, -1)
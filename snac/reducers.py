@@ -0,0 +1,111 @@
+"""
+Per-snapshot reductions of streamed profile chunks (see
+Simulation.iter_snapshots), for analyses that only need e.g. a maximum,
+an integral or a threshold crossing per snapshot. Only one chunk of
+snapshots is in memory at a time, however long the run.
+
+A reducer is a function of a chunk (dict of 'time', 'mass' and (time x cell)
+field arrays) returning one value per snapshot in the chunk. reduce()
+applies reducers to every chunk and collects the results.
+
+Example:
+    df = reducers.reduce(sim.iter_snapshots(['vel', 'eps']),
+                         {'vel_max': reducers.maximum('vel'),
+                          'E_int': reducers.mass_integral('eps')})
+"""
+
+import numpy as np
+import pandas as pd
+
+def reduce(chunks, reducers):
+    """
+    Apply reducers to every snapshot of a stream of chunks.
+    Returns : pd.DataFrame indexed by time, one column per reducer
+
+    parameters
+    ----------
+    chunks : iterable of dict
+        e.g., Simulation.iter_snapshots()
+    reducers : dict of callable
+        reducers, keyed by column name
+    """
+    times = []
+    results = {name: [] for name in reducers}
+
+    for chunk in chunks:
+        times.append(chunk['time'])
+        for name, func in reducers.items():
+            results[name].append(np.asarray(func(chunk)))
+
+    index = pd.Index(np.concatenate(times) if times else [], name='time')
+    return pd.DataFrame({name: np.concatenate(values) if values else []
+                         for name, values in results.items()}, index=index)
+
+def minimum(field):
+    """
+    Minimum of a field over all cells.
+    Returns : reducer
+
+    parameters
+    ----------
+    field : str
+    """
+    return lambda chunk: np.min(chunk[field], axis=1)
+
+def maximum(field):
+    """
+    Maximum of a field over all cells.
+    Returns : reducer
+
+    parameters
+    ----------
+    field : str
+    """
+    return lambda chunk: np.max(chunk[field], axis=1)
+
+def mass_integral(field):
+    """
+    Mass-weighted integral of a field, int field dm, by the trapezoid rule
+    over the cell mass coordinates (e.g., 'eps' gives the internal energy).
+    Returns : reducer
+
+    parameters
+    ----------
+    field : str
+    """
+    def func(chunk):
+        values = chunk[field]
+        dm = np.diff(chunk['mass'])
+        return 0.5 * (values[:, 1:] + values[:, :-1]) @ dm
+
+    return func
+
+def first_crossing(field, threshold, above=True, from_surface=False):
+    """
+    Mass coordinate of the first cell where a field is above (or below)
+    a threshold, searching outward from the centre, or inward from the
+    surface (e.g., the outermost cell with tau > 1). NaN if there is none.
+    Returns : reducer
+
+    parameters
+    ----------
+    field : str
+    threshold : float
+    above : bool
+        look for field > threshold, else field < threshold
+    from_surface : bool
+        search inward from the surface
+    """
+    def func(chunk):
+        values = chunk[field]
+        mask = values > threshold if above else values < threshold
+        if from_surface:
+            mask = mask[:, ::-1]
+
+        ind = np.argmax(mask, axis=1)
+        if from_surface:
+            ind = mask.shape[1] - 1 - ind
+
+        return np.where(mask.any(axis=1), chunk['mass'][ind], np.nan)
+
+    return func
@@ -0,0 +1,274 @@
+"""
+Headless batch rendering of profile evolution, for making movies of
+many models.
+
+Frames are drawn with the Agg backend directly (no pyplot or GUI), on one
+figure per worker whose line data are updated in place for each snapshot,
+rather than building a new figure per plot as Simulation.plot_profile does.
+The fixed parts of the figure (axes, ticks, labels) are drawn once, and
+only the lines and title are redrawn over them for each frame.
+Snapshots of one model, or whole models of a grid, are split over worker
+processes. Frames are written as PNG sequences, and optionally encoded
+into a movie: mp4 with ffmpeg (if installed), or gif with Pillow.
+
+Example:
+    render.render_grid(models, y_vars=['rho', 'vel'], path='movies',
+                       movie='mp4', n_workers=32)
+"""
+
+import os
+import shutil
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from PIL import Image
+
+# snac
+from . import plot_tools
+from . import simulation
+from . import tools
+
+FRAME_FILENAME = 'frame_{:05d}.png'
+
+def render_model(model, y_vars, path='.', x_var='mass', config='snec',
+                 days=None, stride=1, movie=None, fps=24, n_workers=1,
+                 dpi=100, max_cols=2, sub_figsize=(6, 5), y_scale=None,
+                 x_scale=None, ylims=None, linestyle='-', marker='',
+                 verbose=True):
+    """
+    Render profile snapshots of one model to a PNG sequence in path/<model>/,
+    and optionally encode them into a movie, path/<model>.<movie>.
+    Axis limits are fixed over all frames.
+    Returns : [str] frame filepaths, or movie filepath
+
+    parameters
+    ----------
+    model : str
+    y_vars : str or [str]
+        profile fields, one subplot each
+    path : str
+        output directory
+    x_var : {'mass', 'radius'}
+    config : str
+    days : [float]
+        days post breakout to render (see Simulation.get_snapshot_index).
+        Defaults to every snapshot.
+    stride : int
+        render every stride-th snapshot (if days is None)
+    movie : {None, 'mp4', 'gif'}
+    fps : int
+        movie frames per second
+    n_workers : int
+        worker processes rendering frames. 1 renders serially.
+    dpi : int
+    max_cols : int
+    sub_figsize : tuple
+    y_scale : {'log', 'linear'}
+        defaults to config [plotting] ax_scales
+    x_scale : {'log', 'linear'}
+    ylims : dict
+        [min, max] for any y_vars, overriding the data range
+    linestyle : str
+    marker : str
+    verbose : bool
+    """
+    y_vars = list(tools.ensure_sequence(y_vars))
+    sim = simulation.Simulation(model, config=config, load_profiles=False,
+                                verbose=False)
+    arrays = sim.get_profile_arrays()
+
+    if days is None:
+        rows = np.arange(0, len(arrays['time']), stride)
+    else:
+        rows = sim.get_snapshot_index(days)
+
+    frame_path = os.path.join(path, model)
+    os.makedirs(frame_path, exist_ok=True)
+    tools.printv(f'Rendering {len(rows)} frames: {frame_path}', verbose)
+
+    scales = {var: scale or sim.config['plotting']['ax_scales'].get(var, 'log')
+              for var, scale in [(x_var, x_scale)] + [(v, y_scale) for v in y_vars]}
+    limits = {var: _data_limits(arrays[var], scales[var]) for var in scales}
+    limits.update(ylims or {})
+
+    func = partial(_render_frames, model, frame_path=frame_path, y_vars=y_vars,
+                   x_var=x_var, config=config, scales=scales, limits=limits,
+                   dpi=dpi, max_cols=max_cols, sub_figsize=sub_figsize,
+                   linestyle=linestyle, marker=marker)
+    starts = np.arange(len(rows))
+    blocks = [(r, s) for r, s in zip(np.array_split(rows, n_workers),
+                                     np.array_split(starts, n_workers)) if len(r) > 0]
+
+    if n_workers == 1:
+        filepaths = func(rows, starts)
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            filepaths = [fp for block in pool.map(func, *zip(*blocks))
+                         for fp in block]
+
+    if movie is None:
+        return filepaths
+
+    filepath = f'{frame_path}.{movie}'
+    tools.printv(f'Encoding movie: {filepath}', verbose)
+    encode_movie(filepaths, filepath, fps=fps)
+
+    return filepath
+
+def render_grid(models, y_vars, path='.', n_workers=None, verbose=True,
+                **kwargs):
+    """
+    Render profile evolution of many models, one model per worker process.
+    See render_model().
+    Returns : dict of render_model() outputs, keyed by model
+
+    parameters
+    ----------
+    models : [str]
+    y_vars : str or [str]
+    path : str
+    n_workers : int
+        number of worker processes. Defaults to os.cpu_count(). 1 runs serially.
+    verbose : bool
+    **kwargs
+        args for render_model()
+    """
+    models = list(tools.ensure_sequence(models))
+    func = partial(render_model, y_vars=y_vars, path=path, n_workers=1,
+                   verbose=verbose, **kwargs)
+
+    if n_workers == 1:
+        outputs = [func(model) for model in models]
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            outputs = list(pool.map(func, models))
+
+    return dict(zip(models, outputs))
+
+def encode_movie(frames, filepath, fps=24):
+    """
+    Encode a PNG sequence into a movie. The format is taken from the file
+    extension: mp4 (needs ffmpeg) or gif (Pillow).
+
+    parameters
+    ----------
+    frames : [str]
+        PNG filepaths, in order
+    filepath : str
+    fps : int
+    """
+    ext = os.path.splitext(filepath)[1].lower()
+
+    if ext == '.gif':
+        images = [Image.open(frame) for frame in frames]
+        images[0].save(filepath, save_all=True, append_images=images[1:],
+                       duration=1000 / fps, loop=0)
+        for image in images:
+            image.close()
+
+    elif ext == '.mp4':
+        ffmpeg = shutil.which('ffmpeg')
+        if ffmpeg is None:
+            raise FileNotFoundError('ffmpeg not found, needed for mp4 movies. '
+                                    "Use movie='gif', or encode the PNG frames")
+        # frames are numbered in order, see FRAME_FILENAME
+        pattern = os.path.join(os.path.dirname(frames[0]), 'frame_%05d.png')
+        subprocess.run([ffmpeg, '-y', '-loglevel', 'error', '-framerate', str(fps),
+                        '-i', pattern, '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2',
+                        '-pix_fmt', 'yuv420p', filepath], check=True)
+    else:
+        raise ValueError(f"movie format must be 'mp4' or 'gif', not {ext}")
+
+def _render_frames(model, rows, starts, frame_path, y_vars, x_var, config,
+                   scales, limits, dpi, max_cols, sub_figsize, linestyle, marker):
+    """
+    Render the given snapshots of a model, on one figure whose lines are
+    updated and blitted for each frame.
+    Returns : [str] frame filepaths
+
+    parameters
+    ----------
+    model : str
+    rows : [int]
+        snapshot indices
+    starts : [int]
+        frame numbers
+    (see render_model)
+    """
+    sim = simulation.Simulation(model, config=config, load_profiles=False,
+                                verbose=False)
+    arrays = sim.get_profile_arrays()
+    time = arrays['time'] - sim.scalars['t_sb']
+
+    n_rows, n_cols = plot_tools.subplot_shape(len(y_vars), max_cols=max_cols)
+    fig = Figure(figsize=(n_cols * sub_figsize[0], n_rows * sub_figsize[1]),
+                 dpi=dpi)
+    canvas = FigureCanvasAgg(fig)
+    axes = fig.subplots(n_rows, n_cols, squeeze=False).ravel()
+
+    lines = []
+    for ax, y_var in zip(axes, y_vars):
+        line, = ax.plot([], [], ls=linestyle, marker=marker, animated=True)
+        lines.append(line)
+        ax.set_xscale(scales[x_var])
+        ax.set_yscale(scales[y_var])
+        ax.set_xlim(limits[x_var])
+        ax.set_ylim(limits[y_var])
+        ax.set_xlabel(sim.get_label(x_var))
+        ax.set_ylabel(sim.get_label(y_var))
+    for ax in axes[len(y_vars):]:
+        ax.set_visible(False)
+
+    title = fig.suptitle('', animated=True)
+    fig.tight_layout(rect=(0, 0, 1, 0.95))  # leave room for suptitle
+
+    # axes, ticks and labels are fixed: draw once, then only redraw
+    # the lines and title on top of them for each frame (blitting)
+    canvas.draw()
+    background = canvas.copy_from_bbox(fig.bbox)
+    filepaths = []
+
+    for row, frame in zip(rows, starts):
+        canvas.restore_region(background)
+        x = arrays['mass'] if x_var == 'mass' else arrays[x_var][row]
+
+        for ax, line, y_var in zip(axes, lines, y_vars):
+            line.set_data(x, arrays[y_var][row])
+            ax.draw_artist(line)
+
+        title.set_text(f'{model}: t = {time[row]:.3f} s')
+        fig.draw_artist(title)
+
+        filepath = os.path.join(frame_path, FRAME_FILENAME.format(frame))
+        image = Image.frombuffer('RGBA', canvas.get_width_height(),
+                                 canvas.buffer_rgba(), 'raw', 'RGBA', 0, 1)
+        image.save(filepath, compress_level=1)
+        filepaths.append(filepath)
+
+    return filepaths
+
+def _data_limits(array, scale):
+    """
+    Axis limits spanning all values of an array, with a margin.
+    Returns : [min, max], or None if there are no values to show
+
+    parameters
+    ----------
+    array : np.array
+    scale : {'log', 'linear'}
+    """
+    array = np.asarray(array)
+    if scale == 'log':
+        array = array[array > 0]
+    if array.size == 0:
+        return None
+    lo, hi = np.nanmin(array), np.nanmax(array)
+
+    if scale == 'log':
+        return [lo / 1.5, hi * 1.5]
+
+    pad = 0.05 * (hi - lo) or 0.05 * abs(hi) or 1.0
+    return [lo - pad, hi + pad]
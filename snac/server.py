@@ -0,0 +1,591 @@
+"""
+Local analysis daemon, keeping recently used models loaded across processes.
+
+A Server holds Simulation objects in memory, evicting the least recently
+used ones beyond a byte budget, and answers queries from any local process
+over a Unix socket. Large arrays in replies (dat columns, profiles, shell
+histories...) are passed in shared memory: the client maps them without
+copying, and the blocks are freed once the client's arrays are garbage
+collected. RemoteSimulation mirrors the Simulation query methods.
+
+Replies are pickled, so both ends authenticate with a per-user secret
+(see authkey()), and the socket is kept in a private directory (see
+runtime_dir()), out of reach of other local users.
+
+Start a server in its own process with start(), or from a shell:
+    python -m snac.server [socket_path] [max_bytes]
+Defaults are in the [server] section of the config.
+
+Example:
+    server.start()
+    sim = server.Client().simulation('model_1')
+    sim.get_profile_day(50)
+    sim.solo_profile['rho']
+"""
+
+import os
+import stat
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from multiprocessing import shared_memory
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client as _Connect, Listener
+import numpy as np
+import pandas as pd
+
+# snac
+from . import load
+from . import shared
+from . import simulation
+from . import tools
+
+MIN_SHM_BYTES = 65536  # smaller arrays are sent inline
+
+# Simulation methods clients may call, see RemoteSimulation
+QUERIES = ['sample_dat', 'get_photosphere', 'get_shock', 'get_snapshot_index',
+           'regrid', 'shell_history']
+
+def default_socket(config='snec'):
+    """
+    Socket path of the server: $SNAC_SOCKET, or the [server] section of the
+    config, or else one per user in runtime_dir()
+    Returns : str
+
+    parameters
+    ----------
+    config : str
+    """
+    socket_path = os.environ.get('SNAC_SOCKET')
+    if socket_path is None:
+        socket_path = load.load_config(name=config, verbose=False) \
+                          .get('server', {}).get('socket')
+    if socket_path is None:
+        socket_path = os.path.join(runtime_dir(), 'server.sock')
+
+    return socket_path
+
+def runtime_dir():
+    """
+    Private per-user directory (mode 0700) for the socket and authkey:
+    $XDG_RUNTIME_DIR/snac, or else snac-<uid> in the temp directory.
+    Raises RuntimeError if it exists but is not private to the user
+    (e.g., pre-created by another user).
+    Returns : str
+    """
+    root = os.environ.get('XDG_RUNTIME_DIR')
+    if root and os.path.isdir(root):
+        path = os.path.join(root, 'snac')
+    else:
+        path = os.path.join(tempfile.gettempdir(), f'snac-{os.getuid()}')
+
+    try:
+        os.mkdir(path, mode=0o700)
+    except FileExistsError:
+        pass
+
+    info = os.lstat(path)
+    if (not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid()
+            or info.st_mode & 0o077):
+        raise RuntimeError(f'{path} is not a private directory of this user. '
+                           'Remove it, or set $XDG_RUNTIME_DIR')
+    return path
+
+def authkey():
+    """
+    Per-user secret authenticating clients and servers to each other, read
+    from runtime_dir()/authkey (mode 0600), created on first use.
+    Returns : bytes
+    """
+    filepath = os.path.join(runtime_dir(), 'authkey')
+    try:
+        fd = os.open(filepath, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(os.urandom(32))
+    except FileExistsError:
+        pass
+
+    fd = os.open(filepath, os.O_RDONLY | os.O_NOFOLLOW)
+    with os.fdopen(fd, 'rb') as f:
+        info = os.fstat(f.fileno())
+        if info.st_uid != os.getuid() or info.st_mode & 0o077:
+            raise RuntimeError(f'{filepath} is not private to this user')
+        key = f.read()
+
+    if len(key) < 32:
+        raise RuntimeError(f'{filepath} is truncated. Remove it and restart the server')
+    return key
+
+# ===============================================================
+#                      Server
+# ===============================================================
+class Server:
+    """
+    Serves queries on resident Simulation objects over a Unix socket.
+    """
+    def __init__(self, socket_path=None, max_bytes=None, config='snec',
+                 verbose=True):
+        """
+        parameters
+        ----------
+        socket_path : str
+            defaults to default_socket()
+        max_bytes : float
+            memory budget for resident models. Least recently used models are
+            evicted beyond it (the most recent one is always kept).
+            Defaults to the [server] section of the config.
+        config : str
+        verbose : bool
+        """
+        server_config = load.load_config(name=config, verbose=False).get('server', {})
+
+        self.socket_path = socket_path or default_socket(config=config)
+        self.max_bytes = max_bytes or server_config.get('max_bytes', 8e9)
+        self.config = config
+        self.verbose = verbose
+
+        self._sims = OrderedDict()  # model: (Simulation, nbytes), LRU first
+        self._lock = threading.Lock()
+        self._loading = {}  # model: lock, so each model is loaded once
+        self._stopping = False
+
+    def serve(self):
+        """
+        Accept connections until shutdown(), one thread per client.
+        """
+        _remove_stale_socket(self.socket_path)
+        old_mask = os.umask(0o177)  # socket is created 0600, no chmod race
+        try:
+            listener = Listener(self.socket_path, family='AF_UNIX',
+                                authkey=authkey())
+        finally:
+            os.umask(old_mask)
+        tools.printv(f'Serving on {self.socket_path}', self.verbose)
+
+        with listener:  # removes the socket on closing
+            while True:
+                try:
+                    conn = listener.accept()
+                except (AuthenticationError, EOFError, ConnectionError):
+                    continue  # client without the authkey, or gone mid-handshake
+                if self._stopping:
+                    conn.close()
+                    break
+                threading.Thread(target=self._handle, args=(conn, ),
+                                 daemon=True).start()
+
+    def shutdown(self):
+        """
+        Stop accepting connections, and remove the socket.
+        """
+        self._stopping = True
+        _Connect(self.socket_path, family='AF_UNIX',
+                 authkey=authkey()).close()  # wake up accept()
+
+    def get_sim(self, model):
+        """
+        Resident Simulation of a model, loading it if needed.
+        Returns : Simulation
+
+        parameters
+        ----------
+        model : str
+        """
+        with self._lock:
+            if model in self._sims:
+                self._sims.move_to_end(model)
+                return self._sims[model][0]
+            model_lock = self._loading.setdefault(model, threading.Lock())
+
+        with model_lock:
+            with self._lock:
+                if model in self._sims:
+                    return self._sims[model][0]
+
+            tools.printv(f'Loading: {model}', self.verbose)
+            sim = simulation.Simulation(model, config=self.config,
+                                        load_profiles=False, verbose=False)
+            sim.get_profile_arrays()
+
+            with self._lock:
+                self._sims[model] = (sim, _sim_nbytes(sim))
+                self._evict()
+
+        return sim
+
+    def query(self, model, method, args=(), kwargs=None):
+        """
+        Answer one query on a model.
+        Returns : query result
+
+        parameters
+        ----------
+        model : str
+        method : str
+            'dat', 'scalars', 'profile_day', or one of QUERIES
+        args : tuple
+        kwargs : dict
+        """
+        kwargs = kwargs or {}
+        sim = self.get_sim(model)
+
+        if method == 'dat':
+            return sim.dat
+        elif method == 'scalars':
+            return sim.scalars
+        elif method == 'profile_day':
+            return _profile_day(sim, *args, **kwargs)
+        elif method in QUERIES:
+            return getattr(sim, method)(*args, **kwargs)
+        else:
+            raise ValueError(f'Unknown query: {method}')
+
+    def status(self):
+        """
+        Resident models and their sizes
+        Returns : dict
+        """
+        with self._lock:
+            return {'models': {model: nbytes for model, (_, nbytes)
+                               in self._sims.items()},
+                    'max_bytes': self.max_bytes}
+
+    def _evict(self):
+        """Drop least recently used models beyond the budget (call with lock held)
+        """
+        total = sum(nbytes for _, nbytes in self._sims.values())
+
+        while total > self.max_bytes and len(self._sims) > 1:
+            model, (_, nbytes) = self._sims.popitem(last=False)
+            total -= nbytes
+            tools.printv(f'Evicting: {model} ({nbytes/1e6:.1f} MB)', self.verbose)
+
+    def _handle(self, conn):
+        """Answer requests from one client until it disconnects
+        """
+        with conn:
+            while True:
+                try:
+                    request = conn.recv()
+                except (EOFError, OSError):
+                    return
+
+                blocks = []
+                try:
+                    if request[0] == 'status':
+                        reply = ('ok', self.status())
+                    elif request[0] == 'shutdown':
+                        conn.send(('ok', None))  # reply before stopping
+                        self.shutdown()
+                        return
+                    else:
+                        result = self.query(*request[1:])
+                        reply = ('ok', _pack(result, blocks))
+                except Exception as e:
+                    reply = ('error', e)
+
+                try:
+                    conn.send(reply)
+                    if blocks:
+                        conn.recv()  # client has attached
+                except (EOFError, OSError):
+                    return
+                finally:
+                    for shm in blocks:
+                        shm.close()
+                        shm.unlink()
+
+# ===============================================================
+#                      Client
+# ===============================================================
+class Client:
+    """
+    Connection to a Server.
+    """
+    def __init__(self, socket_path=None):
+        """
+        parameters
+        ----------
+        socket_path : str
+            defaults to default_socket()
+        """
+        self.socket_path = socket_path or default_socket()
+        self._conn = _Connect(self.socket_path, family='AF_UNIX', authkey=authkey())
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._conn.close()
+
+    def query(self, model, method, *args, **kwargs):
+        """
+        Send a query, see Server.query()
+        Returns : query result
+
+        parameters
+        ----------
+        model : str
+        method : str
+        """
+        return self._request(('query', model, method, args, kwargs))
+
+    def simulation(self, model):
+        """
+        Returns : RemoteSimulation
+        """
+        return RemoteSimulation(model, client=self)
+
+    def status(self):
+        """
+        Resident models on the server
+        Returns : dict
+        """
+        return self._request(('status', ))
+
+    def shutdown(self):
+        """
+        Stop the server
+        """
+        return self._request(('shutdown', ))
+
+    def _request(self, request):
+        """Send a request, and unpack the reply
+        """
+        with self._lock:
+            self._conn.send(request)
+            status, reply = self._conn.recv()
+
+            if status == 'error':
+                raise reply
+
+            attached = []
+            result = _unpack(reply, attached)
+            if attached:
+                self._conn.send('attached')
+
+        return result
+
+class RemoteSimulation:
+    """
+    Simulation-like access to a model resident on a Server. Mirrors the
+    Simulation attributes dat and scalars, get_profile_day() (which sets
+    solo_profile), and the query methods in QUERIES.
+    """
+    def __init__(self, model, client=None):
+        """
+        parameters
+        ----------
+        model : str
+        client : Client
+            defaults to a new Client on the default socket
+        """
+        self.model = model
+        self.client = client or Client()
+        self.solo_profile = None
+        self._dat = None
+        self._scalars = None
+
+    def __getattr__(self, name):
+        if name in QUERIES:
+            return lambda *args, **kwargs: self.client.query(self.model, name,
+                                                             *args, **kwargs)
+        raise AttributeError(name)
+
+    @property
+    def dat(self):
+        """dat table, with time from shock breakout, see Simulation.load_dat()
+        """
+        if self._dat is None:
+            self._dat = self.client.query(self.model, 'dat')
+        return self._dat
+
+    @property
+    def scalars(self):
+        """see Simulation.get_scalars()
+        """
+        if self._scalars is None:
+            self._scalars = self.client.query(self.model, 'scalars')
+        return self._scalars
+
+    def get_profile_day(self, day=0.0):
+        """
+        Profile at a day post shock breakout, stored in self.solo_profile.
+        See Simulation.get_profile_day()
+
+        Parameters:
+        -----------
+        day : float
+        """
+        df, t = self.client.query(self.model, 'profile_day', day)
+        df.time = t / 86400
+        df.day = day
+        self.solo_profile = df
+
+# ===============================================================
+#                      Process management
+# ===============================================================
+def start(socket_path=None, max_bytes=None, timeout=30):
+    """
+    Start a server in a new background process, unless one is already running.
+    Returns : subprocess.Popen, or None if already running
+
+    parameters
+    ----------
+    socket_path : str
+    max_bytes : float
+        see Server
+    timeout : float
+        seconds to wait for the server to accept connections
+    """
+    socket_path = socket_path or default_socket()
+    if _is_running(socket_path):
+        return None
+
+    args = [socket_path] + ([str(max_bytes)] if max_bytes else [])
+    process = subprocess.Popen([sys.executable, '-c', _MAIN, *args],
+                               stdout=subprocess.DEVNULL, start_new_session=True)
+    t0 = time.time()
+    while not _is_running(socket_path):
+        if time.time() - t0 > timeout or process.poll() is not None:
+            raise RuntimeError(f'Server did not start on {socket_path}')
+        time.sleep(0.05)
+
+    return process
+
+_MAIN = 'import sys; from snac import server; server.main(sys.argv[1:])'
+
+def _is_running(socket_path):
+    """Whether a server accepts connections on socket_path
+    """
+    try:
+        _Connect(socket_path, family='AF_UNIX', authkey=authkey()).close()
+        return True
+    except (FileNotFoundError, ConnectionRefusedError):
+        return False
+
+def _remove_stale_socket(socket_path):
+    """Remove a socket file left by a server that is no longer running
+    """
+    if os.path.exists(socket_path):
+        if _is_running(socket_path):
+            raise RuntimeError(f'Server already running on {socket_path}')
+        os.remove(socket_path)
+
+# ===============================================================
+#                      Replies
+# ===============================================================
+class _Shared:
+    """Descriptor of an array in shared memory
+    """
+    def __init__(self, name, shape, dtype):
+        self.name = name
+        self.shape = shape
+        self.dtype = dtype
+
+class _Frame:
+    """DataFrame with packed columns
+    """
+    def __init__(self, columns, index, index_name):
+        self.columns = columns
+        self.index = index
+        self.index_name = index_name
+
+def _pack(obj, blocks):
+    """
+    Replace large arrays (also in DataFrames, dicts, tuples and lists)
+    with copies in shared memory, appended to blocks.
+    """
+    if isinstance(obj, np.ndarray) and obj.nbytes >= MIN_SHM_BYTES and obj.dtype != object:
+        shm = shared_memory.SharedMemory(create=True, size=obj.nbytes)
+        np.ndarray(obj.shape, dtype=obj.dtype, buffer=shm.buf)[...] = obj
+        blocks.append(shm)
+        return _Shared(shm.name, obj.shape, obj.dtype.str)
+    elif isinstance(obj, pd.DataFrame):
+        return _Frame({col: _pack(obj[col].to_numpy(), blocks) for col in obj},
+                      index=_pack(obj.index.to_numpy(), blocks),
+                      index_name=obj.index.name)
+    elif isinstance(obj, dict):
+        return {key: _pack(value, blocks) for key, value in obj.items()}
+    elif isinstance(obj, (tuple, list)):
+        return type(obj)(_pack(value, blocks) for value in obj)
+    elif isinstance(obj, np.ndarray):
+        return np.asarray(obj)  # e.g. small np.memmap
+
+    return obj
+
+def _unpack(obj, attached):
+    """
+    Inverse of _pack(), mapping shared arrays without copying. Each block is
+    closed once the array using it is garbage collected.
+    """
+    if isinstance(obj, _Shared):
+        shm = shared._attach_shm(obj.name, track=False)
+        attached.append(shm)
+        array = np.ndarray(obj.shape, dtype=np.dtype(obj.dtype), buffer=shm.buf)
+        weakref.finalize(array, shm.close)
+        return array
+    elif isinstance(obj, _Frame):
+        index = pd.Index(_unpack(obj.index, attached), name=obj.index_name)
+        columns = {col: _unpack(value, attached) for col, value in obj.columns.items()}
+        return pd.DataFrame(columns, index=index, copy=False)
+    elif isinstance(obj, dict):
+        return {key: _unpack(value, attached) for key, value in obj.items()}
+    elif isinstance(obj, (tuple, list)):
+        return type(obj)(_unpack(value, attached) for value in obj)
+
+    return obj
+
+# ===============================================================
+#                      Misc.
+# ===============================================================
+def _profile_day(sim, day=0.0):
+    """
+    Profile at a day post shock breakout, from the profile arrays (as
+    Simulation.get_profile_day(), without loading profile dicts).
+    Returns : pd.DataFrame, snapshot time [s]
+    """
+    arrays = sim.get_profile_arrays()
+    j = sim.get_snapshot_index(day)[0]
+
+    df = pd.DataFrame({'mass': np.asarray(arrays['mass'])})
+    for col in sim.config['profiles']['fields']:
+        df[col] = arrays[col][j]
+
+    return df, arrays['time'][j]
+
+def _sim_nbytes(sim):
+    """Memory held by a Simulation's dat and profile arrays
+    """
+    nbytes = sim.dat.memory_usage(index=True).sum()
+    for array in (sim.arrays or {}).values():
+        # from the shape, as lazy arrays (archive, down-sampled cache) are not read
+        nbytes += int(np.prod(array.shape)) * np.dtype(array.dtype).itemsize
+
+    return int(nbytes)
+
+def main(argv):
+    """
+    Run a server, see start()
+
+    parameters
+    ----------
+    argv : [str]
+        [socket_path] [max_bytes]
+    """
+    socket_path = argv[0] if len(argv) > 0 else None
+    max_bytes = float(argv[1]) if len(argv) > 1 else None
+    Server(socket_path=socket_path, max_bytes=max_bytes).serve()
+
+if __name__ == '__main__':
+    # run from the package module, so replies unpickle as snac.server classes
+    from snac import server
+    server.main(sys.argv[1:])
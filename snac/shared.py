@@ -0,0 +1,258 @@
+"""
+Dense ensemble profile arrays in shared memory, for multiprocessing analysis.
+
+SharedArrays loads the (time x cell) arrays of every model once into
+NaN-padded (model x time x cell) blocks, one per field, backed by
+multiprocessing.shared_memory or by .npy files that are memory-mapped.
+Its small, picklable descriptor is all a worker needs to attach to the
+blocks without copying. SharedArrays.map() runs a function over models or
+snapshots in a process pool against those shared arrays.
+
+Example:
+    def peak_vel(model, data):
+        return data['vel'].max()
+
+    with SharedArrays(models) as shared:
+        vmax = shared.map(peak_vel)
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+import numpy as np
+
+# snac
+from . import load
+from . import tools
+
+class SharedArrays:
+    """
+    Dense per-field ensemble arrays in shared memory.
+    """
+    def __init__(self, models, fields=None, config='snec', backing='shm',
+                 path=None, arrays=None, verbose=True):
+        """
+        parameters
+        ----------
+        models : [str]
+        fields : [str]
+            profile fields to share. Defaults to all in config.
+        config : str
+        backing : {'shm', 'memmap'}
+            'shm' uses multiprocessing.shared_memory, 'memmap' writes .npy
+            files to path which workers memory-map.
+        path : str
+            directory for memmap backing
+        arrays : [dict]
+            profile arrays of each model, e.g. from Simulation.get_profile_arrays()
+            (which may read from an archive). Defaults to load.get_profile_arrays()
+        verbose : bool
+        """
+        if backing not in ('shm', 'memmap'):
+            raise ValueError(f"backing must be 'shm' or 'memmap', not {backing}")
+        if backing == 'memmap' and path is None:
+            raise ValueError("path must be given for memmap backing")
+
+        self.verbose = verbose
+        self.models = list(tools.ensure_sequence(models))
+        self.data = {}  # the shared blocks, as seen by this process
+        self._shm = []
+
+        if fields is None:
+            fields = load.load_config(name=config, verbose=False)['profiles']['fields']
+        fields = list(tools.ensure_sequence(fields))
+
+        if arrays is None:
+            arrays = [load.get_profile_arrays(model=model, fields=fields,
+                                              verbose=verbose)
+                      for model in self.models]
+
+        n_time = np.array([len(a['time']) for a in arrays])
+        n_cell = np.array([len(a['mass']) for a in arrays])
+        max_time, max_cell = int(n_time.max()), int(n_cell.max())
+        shapes = {'time': (len(arrays), max_time),
+                  'mass': (len(arrays), max_cell)}
+        for key in fields:
+            shapes[key] = (len(arrays), max_time, max_cell)
+
+        self.descriptor = {'backing': backing, 'models': self.models,
+                           'n_time': n_time.tolist(), 'n_cell': n_cell.tolist(),
+                           'arrays': {}}
+
+        for key, shape in shapes.items():
+            block = self._create(key, shape, backing=backing, path=path)
+            block[...] = np.nan
+            for i, a in enumerate(arrays):
+                block[(i, ) + tuple(slice(0, n) for n in a[key].shape)] = a[key]
+            if backing == 'memmap':
+                block.flush()
+            self.data[key] = block
+
+    def _create(self, key, shape, backing, path):
+        """Create one shared block, and record it in the descriptor
+        """
+        nbytes = int(np.prod(shape)) * np.dtype(np.float64).itemsize
+
+        if backing == 'shm':
+            shm = shared_memory.SharedMemory(create=True, size=max(nbytes, 1))
+            self._shm.append(shm)
+            name = shm.name
+            block = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+        else:
+            os.makedirs(path, exist_ok=True)
+            name = os.path.join(path, f'{key}.npy')
+            block = np.lib.format.open_memmap(name, mode='w+', dtype=np.float64,
+                                              shape=shape)
+
+        tools.printv(f'Sharing {key}: {name} ({nbytes/1e6:.1f} MB)', self.verbose)
+        self.descriptor['arrays'][key] = {'name': name, 'shape': shape,
+                                          'dtype': 'float64'}
+        return block
+
+    def map(self, func, over='model', n_workers=None):
+        """
+        Run func over models or snapshots in worker processes. See map_shared().
+        """
+        return map_shared(func, self.descriptor, over=over, n_workers=n_workers)
+
+    def close(self):
+        """
+        Release the shared memory blocks. Attached workers keep their mappings.
+        """
+        self.data = {}
+        for shm in self._shm:
+            shm.close()
+            shm.unlink()
+        self._shm = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+# ===============================================================
+#                      Workers
+# ===============================================================
+_attached = None  # per-process (descriptor, arrays), see _init_worker()
+
+def attach(descriptor, track=True):
+    """
+    Attach to shared blocks without copying.
+    Returns : dict of (model x time x cell) arrays, plus 'time' and 'mass'.
+        Padded with NaN beyond each model's n_time, n_cell.
+
+    parameters
+    ----------
+    descriptor : dict
+        SharedArrays.descriptor
+    track : bool
+        register shared memory with the resource tracker. Processes started
+        by multiprocessing share the creator's tracker, so this is harmless.
+        Unrelated processes must pass False, or their tracker unlinks the
+        blocks when they exit.
+    """
+    arrays = {}
+    handles = []
+
+    for key, d in descriptor['arrays'].items():
+        if descriptor['backing'] == 'shm':
+            shm = _attach_shm(d['name'], track=track)
+            handles.append(shm)
+            arrays[key] = np.ndarray(d['shape'], dtype=d['dtype'], buffer=shm.buf)
+        else:
+            arrays[key] = np.load(d['name'], mmap_mode='r')
+
+    arrays['_handles'] = handles
+    return arrays
+
+def model_view(descriptor, arrays, i):
+    """
+    Un-padded views of the arrays of the i'th model.
+    Returns : dict of (time x cell) arrays, plus 'time' and 'mass'
+
+    parameters
+    ----------
+    descriptor : dict
+    arrays : dict
+        as returned by attach()
+    i : int
+    """
+    n_time = descriptor['n_time'][i]
+    n_cell = descriptor['n_cell'][i]
+
+    view = {'time': arrays['time'][i, :n_time],
+            'mass': arrays['mass'][i, :n_cell]}
+    for key in descriptor['arrays']:
+        if key not in view:
+            view[key] = arrays[key][i, :n_time, :n_cell]
+
+    return view
+
+def map_shared(func, descriptor, over='model', n_workers=None):
+    """
+    Run func against shared arrays, over all models or all snapshots.
+    Workers attach to the shared blocks once, on startup.
+    Returns : list of results, in order of (model[, snapshot])
+
+    parameters
+    ----------
+    func : callable
+        over='model'    : func(model, data), data as from model_view()
+        over='snapshot' : func(model, j, data), j the snapshot index
+        Must be picklable, i.e., defined at module level.
+    descriptor : dict
+        SharedArrays.descriptor
+    over : {'model', 'snapshot'}
+    n_workers : int
+        number of worker processes. Defaults to os.cpu_count(). 1 runs serially.
+    """
+    if over == 'model':
+        tasks = [(func, i, None) for i in range(len(descriptor['models']))]
+    elif over == 'snapshot':
+        tasks = [(func, i, j) for i, n in enumerate(descriptor['n_time'])
+                 for j in range(n)]
+    else:
+        raise ValueError(f"over must be 'model' or 'snapshot', not {over}")
+
+    if n_workers == 1:
+        _init_worker(descriptor)
+        return [_run(task) for task in tasks]
+
+    chunksize = max(1, len(tasks) // (4 * (n_workers or os.cpu_count())))
+    with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker,
+                             initargs=(descriptor, )) as pool:
+        return list(pool.map(_run, tasks, chunksize=chunksize))
+
+def _init_worker(descriptor):
+    """Attach to shared arrays once per worker process
+    """
+    global _attached
+    _attached = (descriptor, attach(descriptor))
+
+def _run(task):
+    """Run one map_shared() task in a worker
+    """
+    func, i, j = task
+    descriptor, arrays = _attached
+    model = descriptor['models'][i]
+    data = model_view(descriptor, arrays, i)
+
+    if j is None:
+        return func(model, data)
+    else:
+        return func(model, j, data)
+
+def _attach_shm(name, track=True):
+    """Attach to existing shared memory, optionally without registering it
+    with this process's resource tracker (see attach)
+    """
+    if track:
+        return shared_memory.SharedMemory(name=name)
+
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:  # python < 3.13
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
@@ -37,13 +37,15 @@ Info
 import os
 import time
 import numpy as np
-# import xarray as xr
 import pandas as pd
 import matplotlib.pyplot as plt
 from matplotlib.widgets import Slider
 
 # snac
 # from . import analysis
+from . import archive as snac_archive
+from . import cache
+from . import lines as snac_lines
 from . import load
 from . import paths
 from . import plot_tools
@@ -56,7 +58,8 @@ class Simulation:
     """
     def __init__(self, model, config='snec',
                  output_dir='Data', verbose=True, load_all=True,
-                 reload=False, save=True, load_profiles=True):
+                 reload=False, save=True, load_profiles=True, background=False,
+                 archive=None):
         """
         Object representing a 1D flash simulation
         parameters
@@ -77,26 +80,45 @@ class Simulation:
             print information to terminal
         load_profiles : bool
             do, or do not, load mass profiles
+        background : bool
+            load profiles in background threads, returning as soon as dat and
+            scalars are loaded. Accessing profiles/solo_profile waits only for
+            the fields needed. See load.ProfileFutures
+        archive : str or archive.Archive
+            HDF5 ensemble archive to load the model from, instead of its
+            output files. Profiles are read lazily. See archive.py
         """
         t0 = time.time()
         self.verbose = verbose
         self.model = model
 
-        self.model_path = paths.model_path(model=model)
-        self.output_path = os.path.join(self.model_path, output_dir)
+        if isinstance(archive, str):
+            archive = snac_archive.Archive(archive)
+        self.archive = archive
+
+        if archive is None:
+            self.model_path = paths.model_path(model=model)
+            self.output_path = os.path.join(self.model_path, output_dir)
+        else:
+            self.model_path = None
+            self.output_path = None
 
         self.config       = None  # model-specific configuration; see load_config(). Dict
         self.dat          = None  # integrated data from .dat; see load_dat()
         self.profiles     = None  # mass profile data for each timestep
-        self.solo_profile = None  # profile at one timestep
+        self._solo_profile = None # profile at one timestep; see solo_profile
+        self.arrays       = None  # dense (time x cell) profiles; see get_profile_arrays()
         self.scalars      = None  # scalar quantities: time of shock breakout..
-        self.vFe          = None  # Holds v_Fe(t)
-        self.tau          = None  # Hold tau_sob
+        self.vFe          = None  # Holds v_Fe, keyed by day
+        self.tau          = None  # Hold tau_sob, keyed by day
+        self.derived      = cache.DerivedCache(model, persist=save and archive is None,
+                                               verbose=verbose)  # see cache.py
 
         self.load_config(config=config)
 
         if load_all:
-            self.load_all(reload=reload, save=save, load_profiles=load_profiles)
+            self.load_all(reload=reload, save=save, load_profiles=load_profiles,
+                          background=background)
         
         self.len = len(self.dat["time"])-1
 
@@ -132,20 +154,42 @@ class Simulation:
         """
         self.config = load.load_config(name=config, verbose=self.verbose)
 
-    def load_all(self, reload=False, save=True, load_profiles=False):
+    def load_all(self, reload=False, save=True, load_profiles=False,
+                 background=False):
         """
         Load all model data
         parameters
         ----------
         reload : bool
         save : bool
+        load_profiles : bool
+        background : bool
+            load profiles in background threads
         """
         self.load_dat(reload=reload, save=save)
         self.get_scalars()
         self.dat['time'] -= self.scalars['t_sb'] # adjust to shock breakout. 
         if load_profiles:
-            self.load_all_profiles(reload=reload, save=save)
-            self.get_profile_day()  
+            self.load_all_profiles(reload=reload, save=save, background=background)
+            if not background:
+                self.get_profile_day()  
+
+    @property
+    def solo_profile(self):
+        """
+        Profile at one timestep, see get_profile_day().
+        If profiles are loading in the background, the initial get_profile_day()
+        is deferred to first access.
+        """
+        if (self._solo_profile is None
+                and isinstance(self.profiles, load.ProfileFutures)):
+            self.get_profile_day()
+
+        return self._solo_profile
+
+    @solo_profile.setter
+    def solo_profile(self, profile):
+        self._solo_profile = profile
 
     # =======================================================
     #                   Loading Data
@@ -158,12 +202,16 @@ class Simulation:
         reload : bool
         save : bool
         """
+        if self.archive is not None:
+            self.dat = self.archive.get_dat(self.model)
+            return
+
         self.dat = load.get_dat(
                         model=self.model,
                         cols=self.config['dat_quantities']['fields'], reload=reload,
                         save=save, verbose=self.verbose)
 
-    def load_all_profiles(self, reload=False, save=True):
+    def load_all_profiles(self, reload=False, save=True, background=False):
             """
             Load profiles
 
@@ -171,20 +219,123 @@ class Simulation:
             ----------
             reload : bool
             save : bool
+            background : bool
+                load in background threads, see load.ProfileFutures
             """
             config = self.config['profiles']
 
+            if self.archive is not None:
+                self.profiles = self.archive.get_profiles(self.model,
+                                                          fields=config['fields'])
+                return
+
+            if background:
+                self.profiles = load.ProfileFutures(
+                                    model=self.model,
+                                    fields=config['fields'],
+                                    reload=reload, save=save, verbose=self.verbose)
+                return
+
             self.profiles = load.get_profiles(
                                     model=self.model,
                                     fields=config['fields'],
                                     reload=reload, save=save, verbose=self.verbose)
                             
+    def get_profile_arrays(self, reload=False):
+        """
+        Dense (time x cell) profile arrays, stacked from self.profiles.
+        If profiles are not loaded, the (memory-mapped) array cache is used,
+        or the archive. See load.profiles_to_arrays(). Stored in self.arrays.
+
+        Fields may be lazy (archive.LazyArray, or load.InterpolatedArray if the
+        cache was down-sampled, see paths.cache_tolerance()). They support
+        indexing, arithmetic and ufuncs like ndarrays, but arithmetic reads
+        the whole field: index first (e.g. arrays['rho'][j]) to read only part.
+
+        parameters
+        ----------
+        reload : bool
+            re-stack from self.profiles
+        """
+        fields = self.config['profiles']['fields']
+
+        if self.arrays is None or reload:
+            if self.archive is not None:
+                self.arrays = self.archive.get_profile_arrays(self.model,
+                                                              fields=fields)
+            elif self.profiles is None:
+                self.arrays = load.get_profile_arrays(
+                                        model=self.model, fields=fields,
+                                        verbose=self.verbose)
+            else:
+                self.arrays = load.profiles_to_arrays(self.profiles,
+                                                      fields=fields)
+
+        return self.arrays
+
+    def to_dataset(self, fields=None, chunks=64, positional_time=False):
+        """
+        Labeled xarray Dataset of profiles, dat and scalars.
+        Profiles have dims (time, cell) and are lazily backed by the
+        memory-mapped array cache, or the archive (see get_profile_arrays),
+        in dask chunks, so reductions stream from disk. Dat quantities have dim (dat_time);
+        scalars are stored as attributes. Times are post shock breakout [s].
+        Returns : xr.Dataset
+
+        parameters
+        ----------
+        fields : [str]
+            profile fields to include. Defaults to all in config.
+        chunks : int
+            number of snapshots per dask chunk
+        positional_time : bool
+            index time dims by snapshot/row number, with the actual times as
+            coordinates 't' and 'dat_t'. Used for stacking models, see Ensemble.
+        """
+        import dask.array as da
+        import xarray as xr
+
+        if fields is None:
+            fields = self.config['profiles']['fields']
+        fields = tools.ensure_sequence(fields)
+
+        arrays = self.get_profile_arrays()
+
+        data_vars = {}
+        for key in fields:
+            data = da.from_array(arrays[key], chunks=(chunks, -1))
+            data_vars[key] = (('time', 'cell'), data)
+
+        for col in self.dat:
+            if col == 'time': continue
+            data_vars[col] = ('dat_time', self.dat[col].to_numpy())
+
+        time = arrays['time'] - self.scalars['t_sb']
+        dat_time = self.dat['time'].to_numpy()
+        coords = {'cell': np.arange(len(arrays['mass'])),
+                  'mass': ('cell', np.asarray(arrays['mass']))}
+
+        if positional_time:
+            coords.update({'time': np.arange(len(time)), 't': ('time', time),
+                           'dat_time': np.arange(len(dat_time)),
+                           'dat_t': ('dat_time', dat_time)})
+        else:
+            coords.update({'time': time, 'dat_time': dat_time})
+
+        return xr.Dataset(data_vars, coords=coords,
+                          attrs={'model': self.model, **self.scalars})
+
     def get_scalars(self):
         """
         Compute all necessary SNEC scalar quantities
         """
 
         config = self.config['scalars']
+
+        if self.archive is not None:
+            self.scalars = self.archive.get_scalars(self.model)
+            return
+
         self.scalars = load.get_scalars(model=self.model, var=config['fields'])
 
 
@@ -194,33 +345,61 @@ class Simulation:
 
     def clear_vFe(self):
         """
-        Clear the self.vFe array.
+        Clear the self.vFe and self.tau dicts.
         """
 
-        if (self.vFe != None):
+        if (self.vFe is not None):
             self.vFe = None
+            self.tau = None
         else:
             print("vFe is already empty.")
 
     def get_dat_day(self, day=50.0):
         """
-        Isolate dat quantities at a specific day post shock breakout, 50 by default
+        Isolate dat quantities at a specific day post shock breakout, 50 by default.
+        Stored in self.scalars as '<col>_solo'. See sample_dat() for many days.
 
         Parameters:
         day : float
         """       
-        
-        time = self.dat['time'] 
-        if (day >= 0.0):
-            ind = np.max( np.where(time <= day * 86400.) )
-        else: 
-            ind = 0
 
-        for col in self.dat:
-            if col == 'time': continue
+        sample = self.sample_dat(days=day).iloc[0]
 
+        for col, value in sample.items():
             label = col + '_solo'
-            self.scalars[label] = self.dat[col][ind]
+            self.scalars[label] = value
+
+    def sample_dat(self, days, interpolate=False):
+        """
+        Sample all dat quantities at a set of days post shock breakout.
+        Returns : pd.DataFrame indexed by day
+
+        Parameters:
+        -----------
+        days : float or [float]
+            Negative days give the first dat row.
+        interpolate : bool
+            If True, linearly interpolate between dat rows. Otherwise take
+            the last row at or before each day (as get_dat_day).
+        """
+
+        days = np.asarray(tools.ensure_sequence(days), dtype=float)
+        time = self.dat['time'].to_numpy()
+        cols = [col for col in self.dat if col != 'time']
+        values = self.dat[cols].to_numpy()
+
+        if interpolate:
+            ind, w = tools.interp_weights(days * 86400., time)
+            w = w[:, np.newaxis]
+            sample = values[ind] * (1.0 - w) + values[ind + 1] * w
+        else:
+            ind = np.searchsorted(time, days * 86400., side='right') - 1
+            ind = np.clip(ind, 0, len(time) - 1)
+            ind[days < 0.0] = 0
+            sample = values[ind]
+
+        return pd.DataFrame(sample, columns=cols,
+                            index=pd.Index(days, name='day'))
 
     def get_profile_day(self, day=0.0, post_breakout=True):
         """
@@ -263,6 +442,263 @@ class Simulation:
 
         self.solo_profile = df
 
+    def get_photosphere(self):
+        """
+        Profile quantities at the photosphere for every profile snapshot.
+        The dat 'index_photo' series is aligned to the snapshot times (last dat
+        row at or before each snapshot) and all fields are gathered at the
+        photospheric cell in one pass over the (time x cell) arrays.
+        Returns : pd.DataFrame indexed by time post shock breakout [s]
+        """
+        arrays = self.get_profile_arrays()
+        time = arrays['time'] - self.scalars['t_sb']
+        n_time, n_cell = arrays[self.config['profiles']['fields'][0]].shape
+
+        dat_time = self.dat['time'].to_numpy()
+        ind = np.clip(np.searchsorted(dat_time, time, side='right') - 1,
+                      0, len(dat_time) - 1)
+
+        # index_photo is 1-indexed (Fortran)
+        cell = self.dat['index_photo'].to_numpy()[ind].astype(int) - 1
+        cell = np.clip(cell, 0, n_cell - 1)
+        rows = np.arange(n_time)
+
+        df = pd.DataFrame(index=pd.Index(time, name='time'))
+        df['cell'] = cell
+        df['mass'] = arrays['mass'][cell]
+        for col in self.config['profiles']['fields']:
+            df[col] = arrays[col][rows, cell]
+
+        return df
+
+    def get_shock(self, min_jump=0.1, edge_cells=5):
+        """
+        Shock front position and velocity for every profile snapshot, located
+        in one pass over the (time x cell) arrays; see quantities.shock_index().
+        rho * eps is used as the pressure proxy. Rows without a shock are NaN.
+
+        The shock breakout time, the first snapshot with the shock within
+        edge_cells of the surface, is checked against t_sb from info.dat
+        (to within the snapshot spacing), and stored in df.attrs.
+        Returns : pd.DataFrame indexed by time post shock breakout [s]
+            cell      : index of the last shocked cell
+            mass      : mass coordinate [g]
+            radius    : [cm]
+            vel       : post-shock fluid velocity [cm/s]
+            vel_shock : shock velocity, d(radius)/dt [cm/s]
+
+        Parameters:
+        -----------
+        min_jump : float
+            minimum drop in ln(rho * eps) across the shock
+        edge_cells : int
+            number of cells below the surface counted as breakout
+        """
+        arrays = self.get_profile_arrays()
+        time = arrays['time'] - self.scalars['t_sb']
+        n_cell = arrays['vel'].shape[1]
+
+        cell = quantities.shock_index(np.asarray(arrays['vel']),
+                                      np.asarray(arrays['rho']) * np.asarray(arrays['eps']),
+                                      min_jump=min_jump)
+        found = cell >= 0
+        safe = np.where(found, cell, 0)
+        rows = np.arange(len(time))
+
+        df = pd.DataFrame(index=pd.Index(time, name='time'))
+        df['cell'] = cell
+        df['mass'] = np.where(found, arrays['mass'][safe], np.nan)
+        df['radius'] = np.where(found, arrays['radius'][rows, safe], np.nan)
+        df['vel'] = np.where(found, arrays['vel'][rows, safe], np.nan)
+
+        vel_shock = np.full(len(time), np.nan)
+        if np.count_nonzero(found) > 1:
+            vel_shock[found] = np.gradient(df['radius'].to_numpy()[found],
+                                           time[found])
+        df['vel_shock'] = vel_shock
+
+        # breakout check
+        out = np.flatnonzero(found & (cell >= n_cell - 1 - edge_cells))
+        df.attrs['t_sb'] = self.scalars['t_sb']
+        df.attrs['t_sb_shock'] = np.nan
+
+        if len(out) > 0:
+            j = out[0]
+            t_sb_shock = arrays['time'][j]
+            spacing = np.max(np.diff(arrays['time'])[max(j - 1, 0):j + 1])
+            df.attrs['t_sb_shock'] = t_sb_shock
+
+            if abs(t_sb_shock - self.scalars['t_sb']) > spacing:
+                self.printv(f'Shock reaches surface at t = {t_sb_shock:.4e} s, '
+                            f"but t_sb = {self.scalars['t_sb']:.4e} s")
+        else:
+            self.printv('Shock does not reach the surface in profile snapshots')
+
+        return df
+
+    def get_snapshot_index(self, days):
+        """
+        Indices of the profile snapshots at the given days post shock breakout,
+        following get_profile_day(): the last snapshot at or before each day,
+        one snapshot past breakout for day = 0, and the initial profile for day = -1.
+        Returns : np.array
+
+        Parameters:
+        -----------
+        days : float or [float]
+        """
+        days = np.asarray(tools.ensure_sequence(days), dtype=float)
+        times = self.get_profile_arrays()['time'] - self.scalars['t_sb']
+
+        ind = np.searchsorted(times, days * 86400., side='right') - 1
+        ind[days == 0.0] += 1
+        ind[days == -1] = 0
+
+        return np.clip(ind, 0, len(times) - 1)
+
+    def regrid(self, fields, grid, days, coord='mass'):
+        """
+        Interpolate profile fields onto a given mass grid, for many days at once.
+        Returns : dict of (day x grid) arrays, NaN outside of the model grid
+
+        Parameters:
+        -----------
+        fields : str or [str]
+        grid : 1D array
+            mass coordinates [g], or mass fractions (see coord)
+        days : float or [float]
+            see get_snapshot_index()
+        coord : {'mass', 'mass_fraction'}
+            'mass_fraction' is the fraction of the mass above the inner
+            boundary (masscut), from 0 to 1
+        """
+        fields = tools.ensure_sequence(fields)
+        arrays = self.get_profile_arrays()
+        ind = self.get_snapshot_index(days)
+        mass = self._mass_coord(coord)
+
+        return {key: tools.interp_last_axis(grid, mass, arrays[key][ind])
+                for key in fields}
+
+    def shell_history(self, fields, mass=None, cells=None, coord='mass'):
+        """
+        Follow Lagrangian mass shells through every profile snapshot, by slicing
+        the (time x cell) arrays (see get_profile_arrays()) rather than looping
+        over snapshots. Shells are given either as cell indices, or as mass
+        coordinates, interpolated linearly between cells.
+        Returns : dict
+            'time' : snapshot times post shock breakout [s]
+            field  : (time x shell) array for each field. For mass coordinates,
+                     NaN outside of the model grid.
+
+        Parameters:
+        -----------
+        fields : str or [str]
+        mass : float or [float]
+            mass coordinates [g], or mass fractions (see coord)
+        cells : int or [int]
+            cell indices
+        coord : {'mass', 'mass_fraction'}
+            see regrid()
+        """
+        if (mass is None) == (cells is None):
+            raise ValueError('Specify one of mass or cells')
+
+        fields = tools.ensure_sequence(fields)
+        arrays = self.get_profile_arrays()
+        history = {'time': arrays['time'] - self.scalars['t_sb']}
+
+        if cells is not None:
+            cells = np.asarray(tools.ensure_sequence(cells), dtype=int)
+            for key in fields:
+                history[key] = np.asarray(arrays[key][:, cells])
+        else:
+            mass = np.asarray(tools.ensure_sequence(mass), dtype=float)
+            mass_coord = self._mass_coord(coord)
+            for key in fields:
+                history[key] = tools.interp_last_axis(mass, mass_coord,
+                                                      np.asarray(arrays[key]))
+
+        return history
+
+    def iter_snapshots(self, fields=None, chunk=16, block_size=16777216):
+        """
+        Iterate over profile snapshots in chunks, with all fields aligned.
+        Data comes from the (memory-mapped) array cache, or from profiles
+        already in memory, or else is streamed from the .xg files, so memory
+        use is bounded by the chunk size. See reducers.py for reductions.
+        Yields : dict
+            'time' : 1D array of (up to chunk) times post shock breakout [s]
+            'mass' : 1D array of cell mass coordinates
+            field  : 2D (time x cell) array for each field
+
+        Parameters:
+        -----------
+        fields : str or [str]
+            defaults to all profile fields
+        chunk : int
+            number of snapshots per chunk
+        block_size : int
+            bytes per read when streaming .xg files, see load.iter_xg()
+        """
+        if fields is None:
+            fields = self.config['profiles']['fields']
+        fields = list(tools.ensure_sequence(fields))
+        t_sb = self.scalars['t_sb']
+
+        arrays = self.arrays
+        if arrays is None and self.archive is not None:
+            arrays = self.get_profile_arrays()
+        elif arrays is None and self.profiles is None:
+            try:
+                arrays = load.load_array_cache(model=self.model, fields=fields,
+                                               verbose=self.verbose)
+            except FileNotFoundError:
+                pass
+
+        if arrays is not None:
+            for j in range(0, len(arrays['time']), chunk):
+                out = {'time': arrays['time'][j:j + chunk] - t_sb,
+                       'mass': np.asarray(arrays['mass'])}
+                for key in fields:
+                    out[key] = np.array(arrays[key][j:j + chunk])
+                yield out
+
+        elif self.profiles is not None:
+            times = [*self.profiles[fields[0]]]
+            for j in range(0, len(times), chunk):
+                out = load.profiles_to_arrays(
+                            {key: {t: self.profiles[key][t] for t in times[j:j + chunk]}
+                             for key in fields}, fields=fields)
+                out['time'] = out['time'] - t_sb
+                yield out
+
+        else:
+            for out in load.iter_profile_chunks(self.model, fields=fields,
+                                                chunk=chunk, block_size=block_size,
+                                                verbose=self.verbose):
+                out['time'] = out['time'] - t_sb
+                yield out
+
+    def _mass_coord(self, coord='mass'):
+        """
+        Cell mass coordinates, as mass [g] or as fraction of the mass above
+        the inner boundary (masscut), from 0 to 1.
+        Returns : np.array
+
+        Parameters:
+        -----------
+        coord : {'mass', 'mass_fraction'}
+        """
+        mass = self.get_profile_arrays()['mass']
+
+        if coord == 'mass_fraction':
+            return (mass - mass[0]) / (mass[-1] - mass[0])
+        elif coord != 'mass':
+            raise ValueError(f"coord must be 'mass' or 'mass_fraction', not {coord}")
+
+        return mass
+
     # =======================================================
     #                   Quantities
     # =======================================================
@@ -270,6 +706,8 @@ class Simulation:
     def vel_FeII(self, day=50.0):
         """
         Compute FeII 5169 line velocity from Sobolev optical depth = 1
+        Results are cached, see cache.DerivedCache. Stored in self.vFe and
+        self.tau (keyed by day) and self.scalars['v_Fe'].
 
         NOTE: Not supported for default version of SNEC. I've added an additional 
         profile to output the hydrogen profiles. These are used to approximate the 
@@ -280,95 +718,202 @@ class Simulation:
         if "H_frac" not in self.config['profiles']['fields']:
             raise ValueError(f'Mass fraction profile not supplied.')
 
-        if (self.solo_profile.day != day):
-            self.get_profile_day(day=day)
+        self._ensure_profile_day(day)
 
-        # NOTE: This can be duplicated if you call snacs.vel_FeII extra times
-        # It just keeps appending until reloaded.
-        if (self.vFe == None):
-            self.vFe = []
+        if (self.vFe is None):
+            self.vFe = {}
 
-        if (self.tau == None):
-            self.tau = []
+        if (self.tau is None):
+            self.tau = {}
 
-        tau = quantities.tau_sob(density = self.solo_profile['rho'], 
-                                temp=self.solo_profile['temp'], 
-                                X=self.solo_profile['H_frac'], 
-                                t_exp = day + self.scalars['t_sb']/86400)
+        t_exp = day + self.scalars['t_sb']/86400
+        params = {'t_exp': t_exp}
 
-        self.tau.append( tau )
-        
-        self.scalars['v_Fe'] = quantities.iron_velocity(
-                                    self.solo_profile['vel'], tau_sob=tau)
+        tau = self.derived.fetch(
+                    'tau_sob', snapshot=self.solo_profile.time, params=params,
+                    version=cache.code_version(quantities.tau_sob,
+                                               snac_lines.tau_sob),
+                    compute=lambda: quantities.tau_sob(
+                                        density=self.solo_profile['rho'],
+                                        temp=self.solo_profile['temp'],
+                                        X=self.solo_profile['H_frac'],
+                                        t_exp=t_exp))
+
+        v_Fe = self.derived.fetch(
+                    'v_Fe', snapshot=self.solo_profile.time, params=params,
+                    version=cache.code_version(quantities.tau_sob,
+                                               snac_lines.tau_sob,
+                                               quantities.iron_velocity),
+                    compute=lambda: quantities.iron_velocity(
+                                        self.solo_profile['vel'], tau_sob=tau))
 
-        self.vFe.append( quantities.iron_velocity(
-                                    self.solo_profile['vel'], tau_sob=tau) )
+        self.tau[day] = tau
+        self.vFe[day] = v_Fe
+        self.scalars['v_Fe'] = v_Fe
+
+    def vel_FeII_curve(self, days):
+        """
+        FeII 5169 line velocity at many days post shock breakout, in one
+        batched pass over the profile snapshots (see line_velocities()).
+        Stored in self.vFe and self.tau (keyed by day).
+        Returns : np.array [km/s]
+
+        Parameters:
+        -----------
+        days : [float]
+        """
+        days = tools.ensure_sequence(days)
+        v_Fe, tau = self.line_velocities(days, lines='FeII_5169', return_tau=True)
+
+        if (self.vFe is None):
+            self.vFe = {}
+
+        if (self.tau is None):
+            self.tau = {}
+
+        for i, day in enumerate(days):
+            self.vFe[day] = v_Fe['FeII_5169'].iloc[i]
+            self.tau[day] = tau['FeII_5169'][i]
+
+        return v_Fe['FeII_5169'].to_numpy()
+
+    def line_velocities(self, days, lines=None, X_field='H_frac', chunk=64,
+                        return_tau=False):
+        """
+        Line velocities from Sobolev optical depth = 1, for several lines at
+        many days post shock breakout, in one pass over the (time x cell)
+        profile arrays (see get_profile_arrays()). Table lookups are shared
+        by lines on the same (rho, T) grid, see lines.py.
+        Snapshots are selected as in get_profile_day(), see get_snapshot_index().
+        Returns : pd.DataFrame indexed by day, with one column per line [km/s]
+            (0 where tau_sob < 1 everywhere),
+            and if return_tau, dict of (day x cell) tau_sob arrays, keyed by line
+
+        Parameters:
+        -----------
+        days : float or [float]
+        lines : str or [str]
+            registered lines, see lines.LINES. Defaults to all.
+        X_field : str
+            hydrogen mass fraction profile
+        chunk : int
+            number of snapshots per batch, to bound memory
+        return_tau : bool
+        """
+        if X_field not in self.config['profiles']['fields']:
+            raise ValueError(f'Mass fraction profile {X_field} not supplied.')
+
+        days = np.asarray(tools.ensure_sequence(days), dtype=float)
+        names = [line.name for line in snac_lines.get_lines(lines)]
+        arrays = self.get_profile_arrays()
+        ind = self.get_snapshot_index(days)
+        t_exp = days + self.scalars['t_sb'] / 86400
+
+        vel = {name: np.zeros(len(days)) for name in names}
+        tau = {name: [] for name in names}
+
+        for j in range(0, len(days), chunk):
+            block = ind[j:j + chunk]
+            tau_block = snac_lines.tau_sob(density=np.asarray(arrays['rho'][block]),
+                                           temp=np.asarray(arrays['temp'][block]),
+                                           X=np.asarray(arrays[X_field][block]),
+                                           t_exp=t_exp[j:j + chunk], lines=names)
+            vel_block = np.asarray(arrays['vel'][block])
+
+            for name in names:
+                vel[name][j:j + chunk] = snac_lines.tau_one_velocity(vel_block,
+                                                                     tau_block[name])
+                if return_tau:
+                    tau[name].append(tau_block[name])
+
+        table = pd.DataFrame(vel, index=pd.Index(days, name='day'))
+
+        if return_tau:
+            return table, {name: np.concatenate(tau[name]) for name in names}
+        return table
 
     def compute_total_energy(self, day=0.0):
         """
         Compute specific total energy profile.
         Recomputes and overwrites self.solo_profile
+        Results are cached, see cache.DerivedCache.
 
         Parameters:
         -----------
         day : float
         """
 
-        if self.solo_profile is None:
-            self.get_profile_day(day=day)
-
-        if (self.solo_profile.day != day):
-            self.get_profile_day(day=day)
+        self._ensure_profile_day(day)
 
-        self.solo_profile['e_tot'] = quantities.total_energy(
+        self.solo_profile['e_tot'] = self.derived.fetch(
+                    'e_tot', snapshot=self.solo_profile.time,
+                    version=cache.code_version(quantities.total_energy),
+                    compute=lambda: quantities.total_energy(
                                         mass=self.solo_profile['mass'],
                                         radius=self.solo_profile['radius'], 
                                         vel=self.solo_profile['vel'], 
                                         rho=self.solo_profile['rho'], 
-                                        eps=self.solo_profile['eps'])
-                                
+                                        eps=self.solo_profile['eps']))
 
     def compute_bound_mass(self, day=0.0):
         """
         Compute bound mass. See quantities.bound_mass()
+        Results are cached, see cache.DerivedCache.
 
         Parameters:
         -----------
         day : float
         """
 
+        self._ensure_profile_day(day)
+
         if "e_tot" not in self.solo_profile:
             self.compute_total_energy(day = day)
 
-        if self.solo_profile is None:
-            self.get_profile_day(day=day)
-
-        if (self.solo_profile.day != day):
-            self.get_profile_day(day=day)
-
-        self.scalars['bound_mass'] = quantities.bound_mass(
-                                    e_tot=self.solo_profile['e_tot'],
-                                    mass=self.solo_profile['mass'])
+        self.scalars['bound_mass'] = self.derived.fetch(
+                    'bound_mass', snapshot=self.solo_profile.time,
+                    version=cache.code_version(quantities.total_energy,
+                                               quantities.bound_mass),
+                    compute=lambda: quantities.bound_mass(
+                                        e_tot=self.solo_profile['e_tot'],
+                                        mass=self.solo_profile['mass']))
         
     def compute_ejecta_mass(self, day=0.0):
         """
-        Compute bound mass. See quantities.bound_mass()
+        Compute ejecta mass. See quantities.ejecta_mass()
+        Results are cached, see cache.DerivedCache.
 
         Parameters:
         -----------
         day : float
         """
 
-        if self.solo_profile is None:
-            self.get_profile_day(day=day)
+        self._ensure_profile_day(day)
 
-        if (self.solo_profile.day != day):
-            self.get_profile_day(day=day)
+        if "e_tot" not in self.solo_profile:
+            self.compute_total_energy(day = day)
 
-        self.scalars['M_ej'] = quantities.ejecta_mass(
-                                    e_tot = self.solo_profile['e_tot'],
-                                    mass = self.solo_profile['mass']
-        )
+        self.scalars['M_ej'] = self.derived.fetch(
+                    'M_ej', snapshot=self.solo_profile.time,
+                    version=cache.code_version(quantities.total_energy,
+                                               quantities.ejecta_mass),
+                    compute=lambda: quantities.ejecta_mass(
+                                        e_tot=self.solo_profile['e_tot'],
+                                        mass=self.solo_profile['mass']))
+
+    def _ensure_profile_day(self, day):
+        """
+        Make sure self.solo_profile is the profile at the given day.
+
+        Parameters:
+        -----------
+        day : float
+        """
+
+        # not through the solo_profile property: in background mode, it would
+        # first build the deferred day 0 profile
+        if self._solo_profile is None or self._solo_profile.day != day:
+            self.get_profile_day(day=day)
 
 
     # =======================================================
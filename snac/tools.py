@@ -55,4 +55,82 @@ def ensure_sequence(x):
     if isinstance(x, (list, tuple, np.ndarray)):
         return x
     else:
-        return [x, ]
\ No newline at end of file
+        return [x, ]
+
+def interp_weights(x, xp):
+    """
+    Indices and weights for linear interpolation onto x from monotonic xp,
+    such that f(x) = fp[..., i] * (1 - w) + fp[..., i + 1] * w.
+    Weights are clipped to [0, 1], i.e., constant beyond the ends of xp (as np.interp).
+    returns : i, w
+    parameters
+    ----------
+    x : 1D-array
+        points to interpolate to
+    xp : 1D-array
+        monotonically increasing sample points (at least 2)
+    """
+    x = np.asarray(x, dtype=float)
+    xp = np.asarray(xp, dtype=float)
+
+    i = np.clip(np.searchsorted(xp, x, side='right') - 1, 0, len(xp) - 2)
+    w = np.clip((x - xp[i]) / (xp[i + 1] - xp[i]), 0.0, 1.0)
+
+    return i, w
+
+def expand_index(key, ndim):
+    """
+    Expand a numpy index into a tuple of one index per axis, replacing
+    Ellipsis and filling missing axes with full slices.
+    returns : tuple
+    parameters
+    ----------
+    key : index
+    ndim : int
+    """
+    if not isinstance(key, tuple):
+        key = (key, )
+
+    for i, k in enumerate(key):
+        if k is Ellipsis:
+            fill = (slice(None), ) * (ndim - len(key) + 1)
+            key = key[:i] + fill + key[i + 1:]
+            break
+
+    return key + (slice(None), ) * (ndim - len(key))
+
+class LazyArrayOperators(np.lib.mixins.NDArrayOperatorsMixin):
+    """
+    Arithmetic, comparisons and numpy ufuncs for lazy arrays (classes with
+    __array__, e.g. archive.LazyArray, load.InterpolatedArray), so they can
+    be used like ndarrays. Lazy operands are read in full (np.asarray) first;
+    index them to read only part.
+    """
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        if any(isinstance(x, LazyArrayOperators) for x in kwargs.get('out', ())):
+            return NotImplemented  # lazy arrays are read-only
+
+        inputs = tuple(np.asarray(x) if isinstance(x, LazyArrayOperators) else x
+                       for x in inputs)
+        return getattr(ufunc, method)(*inputs, **kwargs)
+
+def interp_last_axis(x, xp, fp, fill_value=np.nan):
+    """
+    Linearly interpolate fp along its last axis onto x, for all leading
+    axes at once (e.g., every snapshot of a (time x cell) array).
+    Points outside of xp are set to fill_value.
+    parameters
+    ----------
+    x : 1D-array
+    xp : 1D-array
+        monotonically increasing, len(xp) == fp.shape[-1]
+    fp : nD-array
+    fill_value : float
+    """
+    x = np.asarray(x, dtype=float)
+    i, w = interp_weights(x, xp)
+
+    out = fp[..., i] * (1.0 - w) + fp[..., i + 1] * w
+    out[..., (x < xp[0]) | (x > xp[-1])] = fill_value
+
+    return out
@@ -0,0 +1,81 @@
+"""
+Benchmark the NumPy and Numba versions of the kernels in snac/kernels.py,
+checking that both give identical results.
+
+Usage:
+    python bench_kernels.py [path/to/file.xg] [--cells 100000] [--repeat 5]
+
+Requires SNAC_DIR and PYTHONPATH to be set, see README. Numba must be installed.
+Without an .xg file, a synthetic one is generated.
+"""
+
+import argparse
+import time
+import numpy as np
+
+from snac import kernels
+from snac import lines as snac_lines
+
+def best_time(func, repeat):
+    """Best wall time of repeated calls, after one warm-up (compilation) call
+    """
+    result = func()
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - t0)
+    return min(times), result
+
+def synthetic_xg(n_time=200, n_cell=1000):
+    """Text of a synthetic .xg file
+    """
+    rng = np.random.default_rng(0)
+    lines = []
+    for t in np.linspace(0, 1e7, n_time):
+        lines.append(f'"Time = {t:.6E}')
+        for m, v in rng.random((n_cell, 2)):
+            lines.append(f' {m:.10E} {v:.10E}')
+        lines.append('')
+        lines.append('')
+    return '\n'.join(lines).encode()
+
+def compare(name, func, repeat):
+    """Time func with both kernels, check results are identical
+    """
+    kernels.set_numba(False)
+    t_np, r_np = best_time(func, repeat)
+    kernels.set_numba(True)
+    t_nb, r_nb = best_time(func, repeat)
+
+    if isinstance(r_np, dict):
+        same = (list(r_np) == list(r_nb)
+                and all(np.array_equal(r_np[k], r_nb[k]) for k in r_np))
+    else:
+        same = np.array_equal(r_np, r_nb)
+
+    print(f'{name:<12} numpy: {t_np*1e3:9.3f} ms   numba: {t_nb*1e3:9.3f} ms   '
+          f'speedup: {t_np/t_nb:5.1f}x   identical: {same}')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('xg', nargs='?', default=None)
+    parser.add_argument('--cells', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(1)
+    density = 10**rng.uniform(-17, -7, args.cells)
+    temp = 10**rng.uniform(3.2, 4.4, args.cells)
+    table = snac_lines.eta_table('FeII_5169_eta.dat')
+    tau = rng.uniform(0, 1.1, (max(args.cells // 1000, 1), 1000))
+
+    if args.xg is None:
+        buf = synthetic_xg()
+    else:
+        with open(args.xg, 'rb') as f:
+            buf = f.read()
+
+    compare('eta_lookup', lambda: kernels.eta_lookup(density, temp, *table), args.repeat)
+    compare('tau_one', lambda: kernels.tau_one_index(tau), args.repeat)
+    compare('parse_xg', lambda: kernels.parse_xg(buf), args.repeat)
@@ -0,0 +1,50 @@
+"""
+Benchmark prefetching I/O (snac/prefetch.py) against sequential small reads,
+on a filesystem stand-in with artificial per-read latency.
+
+Usage:
+    python bench_prefetch.py model [model ...] [--latency 0.005] [--work 0.1] [--reload]
+
+Requires SNAC_DIR, SNEC_MODELS and PYTHONPATH to be set, see README.
+Caches are not written.
+"""
+
+import argparse
+import time
+
+from snac import prefetch
+
+def run(models, opener, work, reload, **kwargs):
+    """
+    Iterate over models with a Prefetcher, sleeping for `work` seconds per
+    model to mimic analysis. Returns wall time.
+    """
+    t0 = time.time()
+    for model, dat, profiles in prefetch.Prefetcher(models, opener=opener,
+                                                    reload=reload, save=False,
+                                                    **kwargs):
+        time.sleep(work)
+    return time.time() - t0
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('models', nargs='+')
+    parser.add_argument('--latency', type=float, default=0.005,
+                        help='seconds per open/read call')
+    parser.add_argument('--work', type=float, default=0.1,
+                        help='seconds of mock analysis per model')
+    parser.add_argument('--reload', action='store_true',
+                        help='read raw .dat/.xg files instead of caches')
+    args = parser.parse_args()
+
+    opener = prefetch.DelayedOpener(latency=args.latency)
+
+    # sequential 8 KiB reads, one file at a time: like line-by-line parsing
+    t_seq = run(args.models, opener, args.work, args.reload,
+                block_size=8192, n_threads=1, depth=0)
+    # config defaults: large concurrent reads, prefetching ahead
+    t_pre = run(args.models, opener, args.work, args.reload)
+
+    print(f'models: {len(args.models)}, latency: {args.latency} s, work: {args.work} s')
+    print(f'sequential: {t_seq:.3f} s')
+    print(f'prefetch  : {t_pre:.3f} s ({t_seq/t_pre:.1f}x)')
@@ -5,49 +5,138 @@ Prerequisites:
 PROGS: tool for handling supernova progenitor files.
 See https://github.com/AstroBarker/progs.git
 
-Current PROGS setup only supports Sukhbold 2016 progenitors. 
+Current PROGS setup only supports Sukhbold 2016 progenitors.
 Extension to other progenitor files is simple, but feel free to reach out.
 
-TODO: make smarter output paths. currently writes files to current working directory.
+Usage:
+    python write_profile.py [model ...]
+writes the hydro and comps profiles of each model to the current working directory.
+Or, from python, write_profile(model, path) for one progenitor and
+write_grid(models, path) for a whole progenitor grid (in parallel).
 
 ***** No mass cut is applied. *****
 
 """
 
-import progs 
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 import numpy as np
+import progs
 
-# load in progenitor data for a given model 
-model = "25.0"
-progenitor = progs.prog.Prog(model, 's16', verbose=False)
-
-# write SNEC hydro profile. Modify filename convention as desired.
-# column setup: cell index   mass   radius   temperature   density   velocity   Ye   Omega
-# first line contains the number of lines
-fn = "s" + model + "_a1.25_exploding_hydro.snec"
-num_lines = len(progenitor.table)
-with open(fn, "w") as f:
-    f.write( str(num_lines-1) + '\n')
-
-    for i in range(1,num_lines):
-        f.write( str(i) + " " + str(progenitor.table['mass'][i]) + " " + str(progenitor.table['radius'][i]) \
-            + " " + str(progenitor.table['temperature'][i]) + " " + str(progenitor.table['density'][i]) \
-            + " " + str(progenitor.table['velocity'][i]) + " " + str(progenitor.table['ye'][i]) \
-            + " " + str(progenitor.table['ang_velocity'][i]) + '\n')
-
-# write SNEC comps profile
-# first line: num_lines, num_isotopes
-# second line: mass number of all isotopes (only num_isotopes of them!!)
-# charge numbers of all isotopes
-# cell mass   cell radius   (Mass fraction of isotope i) for i=1,nisotopes
-fn = "s" + model + "_a1.25_exploding_comps.snec"
-with open(fn, "w") as f:
-    f.write( str(num_lines-1) + " " + str(len(progenitor.network)) + '\n')
-    f.write(' '.join([str(i) for i in progenitor.network['A']]) + '\n')
-    f.write(' '.join([str(i) for i in progenitor.network['Z']]) + '\n')
-
-    for i in range(1,num_lines):
-        f.write( str(i) + " " + str(progenitor.table['mass'][i]) + " " + str(progenitor.table['radius'][i]) + " "\
-           + ' '.join([str(j).replace('\n','') for j in progenitor\
-                .table[progenitor.network['isotope']].iloc[[i]].values.tolist()])\
-                .replace(']','').replace('[','').replace(',','') + '\n')
\ No newline at end of file
+def profile_name(model):
+    """
+    Base filename for SNEC profiles of a model. Modify filename convention as desired.
+    """
+    return "s" + model + "_a1.25_exploding"
+
+def format_rows(index, data):
+    """
+    Format whole table as lines of space separated values, in one pass.
+    Floats are written with str(), as before.
+
+    parameters
+    ----------
+    index : np.array
+        cell indices, first column
+    data : 2D np.array
+        remaining columns
+    """
+    row_fmt = ' '.join(['%d'] + ['%r'] * data.shape[1]) + '\n'
+    rows = np.column_stack([index, data]).tolist()
+
+    return ''.join([row_fmt % tuple(row) for row in rows])
+
+def write_hydro(progenitor, filepath):
+    """
+    Write SNEC hydro profile.
+    column setup: cell index   mass   radius   temperature   density   velocity   Ye   Omega
+    first line contains the number of lines
+
+    parameters
+    ----------
+    progenitor : progs.prog.Prog
+    filepath : str
+    """
+    cols = ['mass', 'radius', 'temperature', 'density', 'velocity', 'ye', 'ang_velocity']
+    num_lines = len(progenitor.table)
+    data = progenitor.table[cols].to_numpy(dtype=float)[1:]
+
+    with open(filepath, "w") as f:
+        f.write(str(num_lines-1) + '\n')
+        f.write(format_rows(np.arange(1, num_lines), data))
+
+def write_comps(progenitor, filepath):
+    """
+    Write SNEC comps profile.
+    first line: num_lines, num_isotopes
+    second line: mass number of all isotopes (only num_isotopes of them!!)
+    charge numbers of all isotopes
+    cell index   cell mass   cell radius   (Mass fraction of isotope i) for i=1,nisotopes
+
+    parameters
+    ----------
+    progenitor : progs.prog.Prog
+    filepath : str
+    """
+    cols = ['mass', 'radius'] + list(progenitor.network['isotope'])
+    num_lines = len(progenitor.table)
+    data = progenitor.table[cols].to_numpy(dtype=float)[1:]
+
+    with open(filepath, "w") as f:
+        f.write(str(num_lines-1) + " " + str(len(progenitor.network)) + '\n')
+        f.write(' '.join([str(i) for i in progenitor.network['A']]) + '\n')
+        f.write(' '.join([str(i) for i in progenitor.network['Z']]) + '\n')
+        f.write(format_rows(np.arange(1, num_lines), data))
+
+def write_profile(model, path='.', prog_set='s16'):
+    """
+    Load progenitor and write its SNEC hydro and comps profiles.
+    Returns : hydro filepath, comps filepath
+
+    parameters
+    ----------
+    model : str
+        progenitor model, e.g. "25.0"
+    path : str
+        output directory
+    prog_set : str
+        progenitor set, see PROGS
+    """
+    progenitor = progs.prog.Prog(model, prog_set, verbose=False)
+
+    os.makedirs(path, exist_ok=True)
+    name = profile_name(model)
+    hydro_filepath = os.path.join(path, name + "_hydro.snec")
+    comps_filepath = os.path.join(path, name + "_comps.snec")
+
+    write_hydro(progenitor, hydro_filepath)
+    write_comps(progenitor, comps_filepath)
+
+    return hydro_filepath, comps_filepath
+
+def write_grid(models, path='.', prog_set='s16', n_workers=None):
+    """
+    Write SNEC profiles for a grid of progenitors, in parallel worker processes.
+    Returns : [(hydro filepath, comps filepath)]
+
+    parameters
+    ----------
+    models : [str]
+    path : str
+    prog_set : str
+    n_workers : int
+        number of worker processes. Defaults to os.cpu_count(). 1 runs serially.
+    """
+    func = partial(write_profile, path=path, prog_set=prog_set)
+
+    if n_workers == 1:
+        return [func(model) for model in models]
+
+    with ProcessPoolExecutor(max_workers=n_workers) as pool:
+        return list(pool.map(func, models))
+
+if __name__ == '__main__':
+    models = sys.argv[1:] if len(sys.argv) > 1 else ["25.0"]
+    write_grid(models, path=os.getcwd())
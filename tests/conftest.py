@@ -0,0 +1,7 @@
+import os
+import sys
+
+# run from a checkout, without installing (see README: Setup)
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault('SNAC_DIR', ROOT)
@@ -0,0 +1,126 @@
+"""
+NumPy and Numba kernels (snac/kernels.py) give the expected, identical results.
+The Numba cases are skipped if Numba is not installed.
+"""
+
+import numpy as np
+import pytest
+
+from snac import kernels
+from snac import lines
+
+@pytest.fixture(params=[False, True], ids=['numpy', 'numba'])
+def use_numba(request):
+    if request.param and not kernels.HAVE_NUMBA:
+        pytest.skip('Numba is not installed')
+    previous = kernels.USE_NUMBA
+    kernels.set_numba(request.param)
+    yield request.param
+    kernels.USE_NUMBA = previous
+
+@pytest.fixture(scope='module')
+def table():
+    return lines.eta_table('FeII_5169_eta.dat')
+
+def synthetic_xg(times, n_cell, seed=0):
+    """Text of an .xg file, and its (cell x 2) blocks keyed by time
+    """
+    rng = np.random.default_rng(seed)
+    text = []
+    blocks = {}
+    for t in times:
+        block = rng.random((n_cell, 2))
+        blocks[t] = block
+        text.append(f'"Time = {t:.6E}')
+        text += [f' {m:.10E} {v:.10E}' for m, v in block]
+        text += ['', '']
+    return '\n'.join(text).encode(), blocks
+
+# ===============================================================
+#                      eta_lookup
+# ===============================================================
+def test_eta_lookup_on_grid(use_numba, table):
+    rho_grid, temp_grid, eta_grid = table
+    i, j = np.meshgrid(np.arange(len(rho_grid) - 1), np.arange(len(temp_grid) - 1),
+                       indexing='ij')
+    eta = kernels.eta_lookup(rho_grid[i], temp_grid[j], *table)
+
+    np.testing.assert_array_equal(eta, eta_grid[i, j])
+
+def test_eta_lookup_between_grid(use_numba, table):
+    rho_grid, temp_grid, eta_grid = table
+    # just above a density: nearest; between temperatures: the one below
+    rho = rho_grid[3] * 1.001
+    temp = 0.5 * (temp_grid[5] + temp_grid[6])
+
+    assert kernels.eta_lookup([rho], [temp], *table)[0] == eta_grid[3, 5]
+
+def test_eta_lookup_outside(use_numba, table):
+    rho_grid, temp_grid, _ = table
+    rho = np.array([rho_grid[0] / 2, rho_grid[-1] * 2, rho_grid[5], rho_grid[5],
+                    np.nan, rho_grid[5], rho_grid[-1]])
+    temp = np.array([temp_grid[5], temp_grid[5], temp_grid[0] / 2, temp_grid[-1] * 2,
+                     temp_grid[5], np.nan, temp_grid[-1]])  # last: the corner
+
+    np.testing.assert_array_equal(kernels.eta_lookup(rho, temp, *table),
+                                  np.zeros(len(rho)))
+
+def test_eta_lookup_shape(use_numba, table):
+    rho = np.full((3, 4), 1e-10)
+    temp = np.full((3, 4), 5000.0)
+
+    assert kernels.eta_lookup(rho, temp, *table).shape == (3, 4)
+
+def test_eta_lookup_numba_matches_numpy(table):
+    if not kernels.HAVE_NUMBA:
+        pytest.skip('Numba is not installed')
+    rng = np.random.default_rng(1)
+    rho = 10**rng.uniform(-17, -7, 10000)
+    temp = 10**rng.uniform(3.2, 4.4, 10000)
+    rho[::97] = np.nan
+
+    previous = kernels.USE_NUMBA
+    try:
+        kernels.set_numba(False)
+        eta_numpy = kernels.eta_lookup(rho, temp, *table)
+        kernels.set_numba(True)
+        eta_numba = kernels.eta_lookup(rho, temp, *table)
+    finally:
+        kernels.USE_NUMBA = previous
+
+    np.testing.assert_array_equal(eta_numpy, eta_numba)
+
+# ===============================================================
+#                      tau_one_index
+# ===============================================================
+def test_tau_one_index_1d(use_numba):
+    ind = kernels.tau_one_index(np.array([5.0, 3.0, 1.5, 0.5, 2.0, 0.1]))
+
+    assert ind == 4
+    assert isinstance(ind, int)
+
+def test_tau_one_index_2d(use_numba):
+    tau = np.array([[5.0, 3.0, 1.5, 0.5, 0.1],
+                    [0.5, 0.5, 0.5, 0.5, 0.5],   # no crossing
+                    [1.0, 1.0, 1.0, 1.0, 1.0],   # tau = 1 is not > 1
+                    [2.0, 2.0, 2.0, 2.0, 2.0]])
+
+    np.testing.assert_array_equal(kernels.tau_one_index(tau), [2, -1, -1, 4])
+
+def test_tau_one_index_no_crossing_1d(use_numba):
+    assert kernels.tau_one_index(np.zeros(10)) == -1
+
+# ===============================================================
+#                      parse_xg
+# ===============================================================
+def test_parse_xg(use_numba):
+    times = [0.0, 1.5e3, 2.25e6]
+    buf, blocks = synthetic_xg(times, n_cell=50)
+    parsed = kernels.parse_xg(buf)
+
+    assert list(parsed) == times
+    for t in times:
+        np.testing.assert_allclose(parsed[t], blocks[t], rtol=1e-10)
+
+def test_parse_xg_empty(use_numba):
+    assert kernels.parse_xg(b'') == {}